@@ -1,6 +1,19 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, Response, abort, current_app, jsonify, request, stream_with_context
 from flask_login import current_user, login_required
-from models import db, Product, CartItem
+from models import db, Product
+from search import search_products
+from pagination import is_keyset, paginate_request
+from catalog import (cached, get_product_data, get_products_data, listing_validators,
+                     parse_fields, product_serializer, product_validators, project_products,
+                     request_key)
+from conditional import conditional
+from facets import facet_counts, filter_products, request_filters
+from suggest import suggest_products
+from cache import cache_stats
+from database import read_only
+from images import ImageError, get_image_store, image_url, store_upload
+from cart import (CartError, add_to_cart, get_cart_summary, load_cart, remove_cart_item,
+                  serialize_cart)
 from datetime import datetime
 from functools import wraps
 
@@ -9,43 +22,157 @@ api = Blueprint('api', __name__)
 def admin_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        if not current_user.is_admin:
+        if not getattr(current_user, 'is_admin', False):
             return jsonify({'error': 'Admin access required'}), 403
         return f(*args, **kwargs)
     return decorated_function
 
+@api.errorhandler(400)
+def bad_request(e):
+    return jsonify({'error': e.description}), 400
+
+@api.errorhandler(404)
+def not_found(e):
+    return jsonify({'error': 'Not found'}), 404
+
 @api.route('/products')
+@read_only
+@conditional(listing_validators)
 def get_products():
     search = request.args.get('search', '')
-    category = request.args.get('category', '')
-    page = request.args.get('page', 1, type=int)
+    filters = request_filters()
     per_page = request.args.get('per_page', 6, type=int)
+    fields = parse_fields(request.args.get('fields'))
     
-    query = Product.query
-    if search:
-        query = query.filter(Product.name.ilike(f'%{search}%'))
-    if category:
-        query = query.filter_by(category=category)
+    if 'ids' in request.args:
+        return jsonify(get_products_by_ids(request.args['ids'], fields))
     
-    products = query.paginate(page=page, per_page=per_page)
+    def load_payload():
+        query = Product.query
+        if search:
+            query = search_products(query, search)
+        query = filter_products(query, **filters)
+        
+        products = paginate_request(project_products(query, fields), per_page=per_page)
+        serialize = product_serializer(fields)
+        products_data = [serialize(product) for product in products.items]
+        
+        if is_keyset(products):
+            payload = {
+                'products': products_data,
+                'total': products.total,
+                'per_page': products.per_page,
+                'next_cursor': products.next_cursor,
+                'prev_cursor': products.prev_cursor
+            }
+        else:
+            payload = {
+                'products': products_data,
+                'total': products.total,
+                'pages': products.pages,
+                'current_page': products.page
+            }
+        # ?facets=1 adds the filter sidebar counts for the same selection
+        if request.args.get('facets') in ('1', 'true'):
+            payload['facets'] = facet_counts(search, **filters)
+        return payload
     
-    products_data = [{
-        'id': product.id,
-        'name': product.name,
-        'description': product.description,
-        'price': product.price,
-        'image_url': product.image_url,
-        'stock': product.stock,
-        'category': product.category
-    } for product in products.items]
+    return jsonify(cached(request_key('api.get_products'), load_payload))
+
+def get_products_by_ids(value, fields):
+    # ?ids=1,2,3 returns those products in the order asked for
+    try:
+        ids = [int(product_id) for product_id in value.split(',') if product_id.strip()]
+    except ValueError:
+        abort(400, description='ids must be a comma-separated list of integers')
+    limit = current_app.config['MAX_PER_PAGE']
+    if not ids or len(ids) > limit:
+        abort(400, description=f'Between 1 and {limit} ids are allowed')
     
-    return jsonify({
-        'products': products_data,
-        'total': products.total,
-        'pages': products.pages,
-        'current_page': products.page
+    found = get_products_data(ids)
+    ids = list(dict.fromkeys(ids))
+    return {
+        'products': [{field: found[product_id][field] for field in fields}
+                     for product_id in ids if product_id in found],
+        'missing': [product_id for product_id in ids if product_id not in found]
+    }
+
+@api.route('/products/suggest')
+@read_only
+def suggest():
+    query = request.args.get('q', '')
+    limit = max(1, min(request.args.get('limit', 8, type=int), 20))
+    return jsonify({'query': query, 'suggestions': suggest_products(query, limit)})
+
+@api.route('/products/facets')
+@read_only
+@conditional(listing_validators)
+def get_product_facets():
+    search = request.args.get('search', '')
+    filters = request_filters()
+    return jsonify(cached(request_key('api.get_product_facets'),
+                          lambda: facet_counts(search, **filters)))
+
+@api.route('/products/<int:product_id>')
+@read_only
+@conditional(product_validators)
+def get_product(product_id):
+    product = get_product_data(product_id)
+    fields = parse_fields(request.args.get('fields'))
+    return jsonify({field: product[field] for field in fields})
+
+@api.route('/products/import', methods=['POST'])
+@login_required
+@admin_required
+def import_products_api():
+    from bulk import EXPORTERS, READERS, import_products
+
+    # Streams NDJSON or CSV from the request body; ?format= overrides the
+    # Content-Type. Any other type is refused, so a cross-site form post
+    # (text/plain, urlencoded) cannot import with an admin's session cookie.
+    request.max_content_length = current_app.config['BULK_MAX_CONTENT_LENGTH']
+    formats = {mimetype: fmt for fmt, (mimetype, _) in EXPORTERS.items()}
+    if request.mimetype not in formats:
+        return jsonify({'error': 'Content-Type must be application/x-ndjson or text/csv'}), 415
+    fmt = request.args.get('format') or formats[request.mimetype]
+    if fmt not in READERS:
+        return jsonify({'error': f'Unsupported format: {fmt}'}), 400
+    
+    result = import_products(READERS[fmt](request.stream),
+                             batch_size=current_app.config['BULK_BATCH_SIZE'])
+    return jsonify(result.to_dict()), 200
+
+@api.route('/products/export')
+@login_required
+@admin_required
+def export_products_api():
+    from bulk import EXPORTERS, iter_product_rows
+
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in EXPORTERS:
+        return jsonify({'error': f'Unsupported format: {fmt}'}), 400
+    
+    mimetype, exporter = EXPORTERS[fmt]
+    rows = iter_product_rows(chunk_size=current_app.config['BULK_BATCH_SIZE'])
+    return Response(stream_with_context(exporter(rows)), mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename=products.{fmt}'
     })
 
+@api.route('/products', methods=['PATCH'])
+@login_required
+@admin_required
+def bulk_update_products():
+    from bulk import apply_patches
+
+    data = request.get_json(silent=True)
+    patches = data.get('patches') if isinstance(data, dict) else data
+    if not isinstance(patches, list) or not patches:
+        return jsonify({'error': 'Expected a non-empty list of patches'}), 400
+    
+    results = apply_patches(patches)
+    updated = sum(1 for result in results if result.get('status') == 'updated')
+    return jsonify({'results': results, 'updated': updated}), 200
+
 @api.route('/products', methods=['POST'])
 @admin_required
 def create_product():
@@ -101,6 +228,25 @@ def update_product(product_id):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@api.route('/products/<int:product_id>/image', methods=['PUT'])
+@login_required
+@admin_required
+def upload_product_image(product_id):
+    # Multipart upload in the 'image' field. The product points at the stored
+    # original at once; resized variants follow from the background pool.
+    product = Product.query.get_or_404(product_id)
+    try:
+        image = store_upload(request.files.get('image'))
+    except ImageError as e:
+        return jsonify({'error': str(e)}), e.status_code
+    if image is None:
+        return jsonify({'error': 'No image uploaded'}), 400
+
+    product.image_url = image_url(image[1])
+    db.session.commit()
+    get_image_store().submit(product.id, *image)
+    return jsonify({'image_url': product.image_url, 'image_key': image[0]}), 202
+
 @api.route('/products/<int:product_id>', methods=['DELETE'])
 @admin_required
 def delete_product_api(product_id):
@@ -117,44 +263,23 @@ def delete_product_api(product_id):
 @login_required
 def manage_cart():
     if request.method == 'GET':
-        cart_items = CartItem.query.filter_by(user_id=current_user.id).all()
-        cart_data = [{
-            'id': item.id,
-            'product_id': item.product_id,
-            'product_name': item.product.name,
-            'product_price': item.product.price,
-            'product_image': item.product.image_url,
-            'quantity': item.quantity
-        } for item in cart_items]
-        
-        total = sum(item.product.price * item.quantity for item in cart_items)
-        return jsonify({'cart_items': cart_data, 'total': total})
+        return jsonify(serialize_cart(load_cart(current_user.id)))
     
     elif request.method == 'POST':
-        data = request.get_json()
-        product_id = data.get('product_id')
-        quantity = data.get('quantity', 1)
-        
-        product = Product.query.get(product_id)
-        if not product:
-            return jsonify({'error': 'Product not found'}), 404
+        data = request.get_json() or {}
+        try:
+            product_id = int(data.get('product_id'))
+            quantity = int(data.get('quantity', 1))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'Invalid product or quantity'}), 400
+        if quantity < 1:
+            return jsonify({'error': 'Quantity must be at least 1'}), 400
         
-        # Check if item already in cart
-        cart_item = CartItem.query.filter_by(
-            user_id=current_user.id, 
-            product_id=product_id
-        ).first()
-        
-        if cart_item:
-            cart_item.quantity += quantity
-        else:
-            cart_item = CartItem(
-                user_id=current_user.id,
-                product_id=product_id,
-                quantity=quantity,
-                created_at=datetime.utcnow()
-            )
-            db.session.add(cart_item)
+        try:
+            add_to_cart(current_user.id, product_id, quantity)
+        except CartError as e:
+            db.session.rollback()
+            return jsonify({'error': str(e)}), e.status_code
         
         db.session.commit()
         return jsonify({'message': 'Item added to cart'}), 201
@@ -163,14 +288,36 @@ def manage_cart():
         data = request.get_json()
         cart_item_id = data.get('cart_item_id')
         
-        cart_item = CartItem.query.filter_by(
-            id=cart_item_id,
-            user_id=current_user.id
-        ).first()
-        
-        if not cart_item:
-            return jsonify({'error': 'Cart item not found'}), 404
+        try:
+            remove_cart_item(current_user.id, cart_item_id)
+        except CartError as e:
+            db.session.rollback()
+            return jsonify({'error': str(e)}), e.status_code
         
-        db.session.delete(cart_item)
         db.session.commit()
         return jsonify({'message': 'Item removed from cart'}), 200
+
+@api.route('/cart/summary')
+@login_required
+def cart_summary():
+    return jsonify(get_cart_summary(current_user.id))
+
+@api.route('/batch', methods=['POST'])
+def batch():
+    from batch import run_batch
+
+    data = request.get_json(silent=True)
+    operations = data.get('operations') if isinstance(data, dict) else None
+    if not isinstance(operations, list) or not operations:
+        return jsonify({'error': 'Expected a non-empty list of operations'}), 400
+    limit = current_app.config['BATCH_MAX_OPERATIONS']
+    if len(operations) > limit:
+        return jsonify({'error': f'At most {limit} operations per batch'}), 400
+    
+    return jsonify({'results': run_batch(operations)}), 200
+
+@api.route('/cache/stats')
+@login_required
+@admin_required
+def get_cache_stats():
+    return jsonify(dict(cache_stats(), suggest=current_app.extensions['suggest'].stats()))
@@ -0,0 +1,142 @@
+from flask_login import current_user
+from cart import (CartError, add_to_cart, get_cart_summary, load_cart, remove_cart_item,
+                  serialize_cart, set_cart_quantity)
+from catalog import get_products_data
+from models import db
+
+# POST /api/batch runs a list of sub-operations in one request:
+#   {'operations': [
+#       {'op': 'products', 'ids': [1, 2, 3]},
+#       {'op': 'cart.add', 'product_id': 2, 'quantity': 1},
+#       {'op': 'cart.update', 'cart_item_id': 7, 'quantity': 3},
+#       {'op': 'cart.remove', 'cart_item_id': 8},
+#       {'op': 'cart'},
+#       {'op': 'cart.summary'}
+#   ]}
+# Operations run in order and each gets a result with its own status; an
+# optional 'id' on an operation is echoed back. Every cart write is a single
+# statement that either applies or leaves the cart untouched, so a failed
+# operation does not disturb the others and all writes share one commit.
+
+OPERATIONS = {}
+
+
+class BatchError(ValueError):
+    status_code = 400
+
+
+def operation(name, login=False, writes=False):
+    def register(f):
+        OPERATIONS[name] = (f, login, writes)
+        return f
+    return register
+
+
+def _int(op, field, default=None):
+    value = op.get(field, default)
+    if value is None:
+        raise BatchError(f'{field} is required')
+    try:
+        if isinstance(value, bool) or (isinstance(value, float) and not value.is_integer()):
+            raise ValueError
+        return int(value)
+    except (TypeError, ValueError):
+        raise BatchError(f'{field} must be an integer')
+
+
+def _ids(op):
+    ids = op.get('ids')
+    if not isinstance(ids, list) or not ids:
+        raise BatchError('ids must be a non-empty list')
+    try:
+        return [_int({'id': value}, 'id') for value in ids]
+    except BatchError:
+        raise BatchError('ids must be integers')
+
+
+@operation('products')
+def _products(op, products):
+    ids = _ids(op)
+    return {
+        'products': [products[product_id] for product_id in ids if product_id in products],
+        'missing': [product_id for product_id in ids if product_id not in products]
+    }
+
+
+@operation('cart', login=True)
+def _cart(op, products):
+    return serialize_cart(load_cart(current_user.id))
+
+
+@operation('cart.summary', login=True)
+def _cart_summary(op, products):
+    return get_cart_summary(current_user.id)
+
+
+@operation('cart.add', login=True, writes=True)
+def _cart_add(op, products):
+    quantity = _int(op, 'quantity', 1)
+    if quantity < 1:
+        raise BatchError('Quantity must be at least 1')
+    add_to_cart(current_user.id, _int(op, 'product_id'), quantity)
+
+
+@operation('cart.update', login=True, writes=True)
+def _cart_update(op, products):
+    set_cart_quantity(current_user.id, _int(op, 'cart_item_id'), _int(op, 'quantity'))
+
+
+@operation('cart.remove', login=True, writes=True)
+def _cart_remove(op, products):
+    remove_cart_item(current_user.id, _int(op, 'cart_item_id'))
+
+
+def _prefetch_products(operations):
+    # Every product any 'products' operation asks for, fetched once
+    ids = []
+    for op in operations:
+        if isinstance(op, dict) and op.get('op') == 'products':
+            try:
+                ids.extend(_ids(op))
+            except BatchError:
+                pass
+    return get_products_data(ids) if ids else {}
+
+
+def run_batch(operations):
+    products = _prefetch_products(operations)
+    results = []
+    wrote = False
+    for op in operations:
+        result = {}
+        if isinstance(op, dict) and 'id' in op:
+            result['id'] = op['id']
+        name = op.get('op') if isinstance(op, dict) else None
+        result['op'] = name
+        results.append(result)
+
+        if not isinstance(name, str) or name not in OPERATIONS:
+            result.update(status=400, error=f'Unknown operation: {name}')
+            continue
+        handler, login, writes = OPERATIONS[name]
+        if login and not current_user.is_authenticated:
+            result.update(status=401, error='Login required')
+            continue
+        try:
+            data = handler(op, products)
+        except (BatchError, CartError) as e:
+            result.update(status=e.status_code, error=str(e))
+            continue
+        if writes:
+            wrote = True
+        result['status'] = 200
+        if data:
+            result.update(data)
+
+    if wrote:
+        try:
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+    return results
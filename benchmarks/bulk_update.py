@@ -0,0 +1,73 @@
+"""Per-item PUT versus one bulk PATCH for a repricing run.
+
+    python -m benchmarks.bulk_update --products 5000
+
+Creates a catalog of ``--products`` items, reprices every one of them through
+PUT /api/products/<id>, then does the same through a single PATCH
+/api/products and reports wall time and SQL statements for both.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--products', type=int, default=5000)
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix='bulk-update-bench-')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(workdir, 'bench.db')
+    from sqlalchemy import event, insert
+    from app import create_app
+    from schema import init_db
+    from seed import seed_database
+    from models import db, Product, User
+
+    app = create_app()
+    with app.app_context():
+        init_db()
+        seed_database()
+        db.session.execute(insert(Product), [{
+            'name': f'Product {i}', 'description': 'Benchmark product', 'price': 10.0,
+            'image_url': 'https://example.com/p.jpg', 'stock': 100, 'category': 'Other'
+        } for i in range(args.products)])
+        db.session.commit()
+        ids = [row[0] for row in db.session.query(Product.id).all()]
+        admin_id = User.query.filter_by(is_admin=True).first().id
+        statements = []
+        event.listen(db.engine, 'before_cursor_execute', lambda *a: statements.append(a[2]))
+
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['_user_id'] = str(admin_id)
+        sess['_fresh'] = True
+
+    statements.clear()
+    start = time.perf_counter()
+    for product_id in ids:
+        client.put(f'/api/products/{product_id}', json={'price': 9.0, 'stock': 101})
+    per_item = time.perf_counter() - start
+    per_item_statements = len(statements)
+
+    statements.clear()
+    start = time.perf_counter()
+    response = client.patch('/api/products', json={'patches': [
+        {'id': product_id, 'price': {'mul': 0.9}, 'stock': {'add': 1}} for product_id in ids
+    ]})
+    bulk = time.perf_counter() - start
+    bulk_statements = len(statements)
+
+    print(f'products={len(ids)}')
+    print(f'per-item PUT: {per_item:.3f}s, {per_item_statements} statements, '
+          f'{len(ids) / per_item:.0f} products/s')
+    print(f'bulk PATCH:   {bulk:.3f}s, {bulk_statements} statements, '
+          f'{len(ids) / bulk:.0f} products/s ({response.json["updated"]} updated)')
+    print(f'speedup: {per_item / bulk:.1f}x')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
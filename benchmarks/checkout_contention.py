@@ -0,0 +1,86 @@
+"""Concurrent checkouts against a single hot product.
+
+    python -m benchmarks.checkout_contention --buyers 200 --stock 50 --threads 16
+
+Every buyer has the hot product in their cart and checks out at the same
+time. The run reports throughput and verifies that exactly ``stock`` orders
+succeeded and that stock never went negative.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--buyers', type=int, default=200)
+    parser.add_argument('--stock', type=int, default=50)
+    parser.add_argument('--quantity', type=int, default=1)
+    parser.add_argument('--threads', type=int, default=16)
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix='checkout-bench-')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(workdir, 'bench.db')
+    from app import create_app
+    from schema import init_db
+    from models import db, CartItem, Order, Product, User
+
+    app = create_app()
+    app.config['WTF_CSRF_ENABLED'] = False
+    with app.app_context():
+        init_db()
+        hot = Product(name='Flash Sale Item', description='Hot product', price=9.99,
+                      image_url='https://example.com/hot.jpg', stock=args.stock,
+                      category='Other')
+        db.session.add(hot)
+        users = [User(email=f'buyer{i}@example.com', password='!', name=f'Buyer {i}')
+                 for i in range(args.buyers)]
+        db.session.add_all(users)
+        db.session.flush()
+        db.session.add_all([CartItem(user_id=u.id, product_id=hot.id, quantity=args.quantity)
+                            for u in users])
+        db.session.commit()
+        hot_id = hot.id
+        user_ids = [u.id for u in users]
+
+    local = threading.local()
+
+    def checkout(user_id):
+        client = getattr(local, 'client', None)
+        if client is None:
+            client = local.client = app.test_client()
+        with client.session_transaction() as sess:
+            sess['_user_id'] = str(user_id)
+            sess['_fresh'] = True
+        start = time.perf_counter()
+        response = client.post('/checkout/complete')
+        return response.status_code, time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        results = list(pool.map(checkout, user_ids))
+    elapsed = time.perf_counter() - start
+
+    with app.app_context():
+        orders = Order.query.count()
+        stock_left = db.session.get(Product, hot_id).stock
+
+    latencies = sorted(latency for _, latency in results)
+    expected = min(args.buyers, args.stock // args.quantity)
+    print(f'buyers={args.buyers} stock={args.stock} threads={args.threads}')
+    print(f'elapsed={elapsed:.3f}s throughput={len(results) / elapsed:.1f} checkouts/s')
+    print(f'p50={latencies[len(latencies) // 2] * 1000:.1f}ms '
+          f'p99={latencies[int(len(latencies) * 0.99) - 1] * 1000:.1f}ms')
+    print(f'orders={orders} expected={expected} stock_left={stock_left}')
+    if orders != expected or stock_left != args.stock - orders * args.quantity or stock_left < 0:
+        print('FAILED: oversold or lost orders')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
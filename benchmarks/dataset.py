@@ -0,0 +1,140 @@
+"""Synthetic catalog, users and carts for load runs.
+
+    python -m benchmarks.dataset --products 100000 --users 10000 --db /tmp/bench.db
+
+Rows are drawn from a seeded random generator, so the same arguments give
+the same database. Products get generated names and descriptions across the
+admin form's categories. Users are ``user_email(n)`` with password
+``PASSWORD``; the hash is made once with PASSWORD_HASH_METHOD and shared, so
+logins cost what they cost in production. Each user starts with a cart of
+about ``--cart-items`` lines.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+CATEGORIES = ('Electronics', 'Home', 'Sports', 'Fashion', 'Other')
+ADJECTIVES = (
+    'Wireless', 'Smart', 'Classic', 'Portable', 'Compact', 'Premium', 'Ultra',
+    'Vintage', 'Organic', 'Deluxe', 'Modern', 'Rugged', 'Slim', 'Pro', 'Eco',
+)
+NOUNS = {
+    'Electronics': ('Headphones', 'Speaker', 'Charger', 'Keyboard', 'Monitor', 'Camera', 'Router'),
+    'Home': ('Lamp', 'Blender', 'Kettle', 'Pillow', 'Rug', 'Vase', 'Toaster'),
+    'Sports': ('Yoga Mat', 'Dumbbell', 'Bottle', 'Racket', 'Helmet', 'Backpack', 'Ball'),
+    'Fashion': ('Jacket', 'Sneakers', 'Watch', 'Scarf', 'Sunglasses', 'Wallet', 'Belt'),
+    'Other': ('Notebook', 'Puzzle', 'Candle', 'Planter', 'Mug', 'Poster', 'Gift Card'),
+}
+FILLER = (
+    'durable', 'lightweight', 'everyday', 'design', 'quality', 'materials', 'comfort',
+    'performance', 'finish', 'warranty', 'includes', 'perfect', 'travel', 'home', 'office',
+)
+PASSWORD = 'benchmark'
+
+
+def user_email(n):
+    return f'bench{n}@example.com'
+
+
+def search_terms():
+    # Words that occur in generated product names
+    return [word.lower() for word in ADJECTIVES] + [
+        noun.split()[0].lower() for nouns in NOUNS.values() for noun in nouns
+    ]
+
+
+def _product(rng, n):
+    category = rng.choice(CATEGORIES)
+    name = f'{rng.choice(ADJECTIVES)} {rng.choice(NOUNS[category])} {n}'
+    words = rng.choices(FILLER, k=rng.randint(20, 60))
+    return {
+        'name': name,
+        'description': f'{name}. ' + ' '.join(words).capitalize() + '.',
+        'price': round(min(rng.lognormvariate(3.8, 1.1), 5000), 2),
+        'image_url': f'https://example.com/images/{n % 500}.jpg',
+        'stock': 0 if rng.random() < 0.05 else rng.randint(1, 1000),
+        'category': category,
+    }
+
+
+def _chunks(rows, size):
+    for i in range(0, len(rows), size):
+        yield rows[i:i + size]
+
+
+def generate(products, users, cart_items=2, seed=0, batch_size=5000):
+    # Fills the database of the current app, which must be freshly initialised
+    from sqlalchemy import insert, select
+    from facets import refresh_facet_counts
+    from models import db, CartItem, Product, User
+    from passwords import hash_password
+    from stats import reconcile_statistics
+
+    rng = random.Random(seed)
+    for chunk in _chunks([_product(rng, n) for n in range(products)], batch_size):
+        db.session.execute(insert(Product), chunk)
+    password = hash_password(PASSWORD)
+    for chunk in _chunks([{'email': user_email(n), 'name': f'Bench User {n}', 'password': password}
+                          for n in range(users)], batch_size):
+        db.session.execute(insert(User), chunk)
+    db.session.commit()
+
+    product_ids = db.session.scalars(select(Product.id).order_by(Product.id)).all()
+    user_ids = db.session.scalars(
+        select(User.id).where(User.email.like('bench%@example.com')).order_by(User.id)
+    ).all()
+    lines = []
+    for user_id in user_ids:
+        count = min(rng.randint(0, 2 * cart_items), len(product_ids))
+        for product_id in rng.sample(product_ids, count):
+            lines.append({'user_id': user_id, 'product_id': product_id,
+                          'quantity': rng.randint(1, 3)})
+    for chunk in _chunks(lines, batch_size):
+        db.session.execute(insert(CartItem), chunk)
+    db.session.commit()
+
+    # Core inserts skip the session hooks that maintain these
+    with db.engine.begin() as conn:
+        refresh_facet_counts(conn)
+    reconcile_statistics()
+    return {'products': products, 'users': users, 'cart_items': len(lines), 'seed': seed}
+
+
+def describe():
+    # Row counts of an existing dataset in the current app's database
+    from sqlalchemy import func, select
+    from models import db, CartItem, Product, User
+
+    return {name: db.session.scalar(select(func.count()).select_from(model))
+            for name, model in (('products', Product), ('users', User), ('cart_items', CartItem))}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--products', type=int, default=100000)
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--cart-items', type=int, default=2)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--db', required=True, help='SQLite file to create')
+    args = parser.parse_args(argv)
+
+    if os.path.exists(args.db):
+        parser.error(f'{args.db} already exists')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.abspath(args.db)
+    from app import create_app
+    from schema import init_db
+
+    app = create_app()
+    with app.app_context():
+        start = time.perf_counter()
+        init_db()
+        summary = generate(args.products, args.users, args.cart_items, args.seed)
+    print(', '.join(f'{key}={value}' for key, value in summary.items()) +
+          f' in {time.perf_counter() - start:.1f}s')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
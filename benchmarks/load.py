@@ -0,0 +1,401 @@
+"""Load run against the real endpoints on a synthetic dataset.
+
+    python -m benchmarks.load --products 100000 --users 10000 --requests 200 --threads 8
+    python -m benchmarks.load --db /tmp/bench.db --gunicorn 4 --threads 32
+    python -m benchmarks.load --db /tmp/bench.db --compare benchmarks/results/before.json
+
+Builds a dataset with benchmarks.dataset, or reuses ``--db`` when that file
+already exists, then runs every scenario in SCENARIOS for ``--requests``
+requests spread over ``--threads`` threads. Each thread is logged in as its
+own dataset user. Requests go through the Flask test client in this process,
+or with ``--gunicorn N`` over HTTP to a local gunicorn with N workers.
+
+Per scenario the run reports throughput, p50/p95/p99 latency, responses
+other than the expected status, 503s shed under load (counted apart from
+errors) and SQL statements per request, counted
+in-process or read from the Server-Timing header over HTTP. Only the timed request is measured; any setup a scenario needs,
+such as filling a cart before checkout, is done outside the timer. Results
+are saved as JSON to ``--output`` (default benchmarks/results/load-<UTC
+time>.json), and ``--compare`` prints the change from an earlier results
+file. Config comes from the environment as usual, e.g. CATALOG_CACHE_TTL=0
+measures uncached listings.
+"""
+import argparse
+import http.cookiejar
+import json
+import math
+import os
+import platform
+import queue
+import random
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from benchmarks import dataset
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CSRF_TOKEN = re.compile(r'name="csrf_token" type="hidden" value="([^"]+)"')
+TIMING_QUERIES = re.compile(r'desc="(\d+) queries"')
+LISTING_PER_PAGE = 6
+
+
+class TestClientSession:
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, url, data=None, payload=None):
+        response = self.client.open(url, method=method, data=data, json=payload)
+        return response.status_code, response.get_data(), response.headers
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HttpSession:
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect()
+        )
+
+    def request(self, method, url, data=None, payload=None):
+        body, headers = None, {}
+        if payload is not None:
+            body = json.dumps(payload).encode()
+            headers['Content-Type'] = 'application/json'
+        elif data is not None:
+            body = urllib.parse.urlencode(data).encode()
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        req = urllib.request.Request(self.base_url + url, data=body, headers=headers, method=method)
+        try:
+            with self.opener.open(req, timeout=60) as response:
+                return response.status, response.read(), response.headers
+        except urllib.error.HTTPError as e:
+            return e.code, e.read(), e.headers
+
+
+def login_form(session, email):
+    # The login form carries a CSRF token, so fetch it first
+    _, body, _ = session.request('GET', '/login')
+    match = CSRF_TOKEN.search(body.decode())
+    data = {'email': email, 'password': dataset.PASSWORD}
+    if match:
+        data['csrf_token'] = match.group(1)
+    return data
+
+
+def login(session, email):
+    status, _, _ = session.request('POST', '/login', data=login_form(session, email))
+    if status != 302:
+        raise RuntimeError(f'Could not log in as {email}: HTTP {status}')
+    return session
+
+
+def add_to_cart(session, rng, data):
+    status, _, _ = session.request('POST', '/api/cart', payload={
+        'product_id': rng.choice(data['in_stock']), 'quantity': 1
+    })
+    return status
+
+
+# Scenarios take (session, rng, data), do any untimed setup and return the
+# session to time, the request and the status it should answer with
+SCENARIOS = {}
+
+
+def scenario(name):
+    def register(f):
+        SCENARIOS[name] = f
+        return f
+    return register
+
+
+@scenario('GET /products')
+def _product_list(session, rng, data):
+    return session, 'GET', f'/products?page={rng.randint(1, data["pages"])}', {}, 200
+
+
+@scenario('GET /products?search')
+def _product_search(session, rng, data):
+    return session, 'GET', f'/products?search={rng.choice(data["terms"])}', {}, 200
+
+
+@scenario('GET /products?category')
+def _product_category(session, rng, data):
+    # One of the first 20 pages, or fewer when a small dataset has fewer
+    category = rng.choice(dataset.CATEGORIES)
+    page = rng.randint(1, min(20, data['category_pages'].get(category, 1)))
+    return session, 'GET', f'/products?category={urllib.parse.quote(category)}&page={page}', {}, 200
+
+
+@scenario('GET /products/<id>')
+def _product_detail(session, rng, data):
+    return session, 'GET', f'/products/{rng.choice(data["product_ids"])}', {}, 200
+
+
+@scenario('GET /api/products')
+def _api_products(session, rng, data):
+    return session, 'GET', f'/api/products?page={rng.randint(1, data["pages"])}', {}, 200
+
+
+@scenario('GET /api/cart')
+def _cart_get(session, rng, data):
+    return session, 'GET', '/api/cart', {}, 200
+
+
+@scenario('POST /api/cart')
+def _cart_add(session, rng, data):
+    product_id = rng.choice(data['in_stock'])
+    return session, 'POST', '/api/cart', {'payload': {'product_id': product_id, 'quantity': 1}}, 201
+
+
+@scenario('DELETE /api/cart')
+def _cart_remove(session, rng, data):
+    add_to_cart(session, rng, data)
+    _, body, _ = session.request('GET', '/api/cart')
+    items = json.loads(body)['cart_items']
+    return session, 'DELETE', '/api/cart', {'payload': {'cart_item_id': items[-1]['id']}}, 200
+
+
+@scenario('POST /checkout/complete')
+def _checkout(session, rng, data):
+    add_to_cart(session, rng, data)
+    return session, 'POST', '/checkout/complete', {}, 302
+
+
+@scenario('POST /login')
+def _login(session, rng, data):
+    fresh = data['new_session']()
+    form = login_form(fresh, dataset.user_email(rng.randrange(data['users'])))
+    return fresh, 'POST', '/login', {'data': form}, 302
+
+
+class StatementCounter:
+    # SQL statements run by the current thread since the last reset
+
+    def __init__(self, engines):
+        from sqlalchemy import event
+
+        self._local = threading.local()
+        for engine in engines:
+            event.listen(engine, 'before_cursor_execute', self._count)
+
+    def _count(self, *args):
+        self._local.count = getattr(self._local, 'count', 0) + 1
+
+    def reset(self):
+        self._local.count = 0
+
+    @property
+    def count(self):
+        return getattr(self._local, 'count', 0)
+
+
+def percentile(samples, p):
+    return samples[min(len(samples) - 1, max(0, math.ceil(len(samples) * p / 100) - 1))]
+
+
+def run_scenario(run, sessions, data, args, counter, index):
+    idle = queue.SimpleQueue()
+    for session in sessions:
+        idle.put(session)
+    local = threading.local()
+
+    def one(i):
+        if not hasattr(local, 'session'):
+            local.session = idle.get()
+        rng = random.Random(f'{args.seed}:{index}:{i}')
+        session, method, url, kwargs, expected = run(local.session, rng, data)
+        if counter:
+            counter.reset()
+        start = time.perf_counter()
+        status, _, headers = session.request(method, url, **kwargs)
+        elapsed = time.perf_counter() - start
+        if counter:
+            return status, expected, elapsed, counter.count
+        match = TIMING_QUERIES.search(headers.get('Server-Timing', ''))
+        return status, expected, elapsed, int(match.group(1)) if match else None
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(sessions)) as pool:
+        results = list(pool.map(one, range(args.requests)))
+    wall = time.perf_counter() - start
+
+    latencies = sorted(elapsed * 1000 for _, _, elapsed, _ in results)
+    queries = [count for _, _, _, count in results if count is not None]
+    return {
+        'requests': len(results),
+        # 503s are load shedding (e.g. the password hash queue), not failures
+        'errors': sum(1 for status, expected, _, _ in results if status not in (expected, 503)),
+        'shed': sum(1 for status, expected, _, _ in results if status == 503 != expected),
+        'throughput': round(len(results) / wall, 1),
+        'mean_ms': round(statistics.fmean(latencies), 2),
+        'p50_ms': round(percentile(latencies, 50), 2),
+        'p95_ms': round(percentile(latencies, 95), 2),
+        'p99_ms': round(percentile(latencies, 99), 2),
+        'queries_mean': round(statistics.fmean(queries), 1) if queries else None,
+        'queries_max': max(queries) if queries else None,
+    }
+
+
+def start_gunicorn(workers, env):
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '--workers', str(workers), '--bind',
+         f'127.0.0.1:{port}', '--log-level', 'warning', 'wsgi:app'],
+        cwd=ROOT, env=env
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError('gunicorn exited during startup')
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return process, f'http://127.0.0.1:{port}'
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError('gunicorn did not start listening within 30s')
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(endpoints, baseline=None):
+    print(f'{"endpoint":<28}{"req/s":>9}{"p50 ms":>9}{"p95 ms":>9}{"p99 ms":>9}'
+          f'{"errors":>8}{"shed":>6}{"queries":>9}')
+    for name, result in endpoints.items():
+        queries = '-' if result['queries_mean'] is None else f'{result["queries_mean"]:g}'
+        print(f'{name:<28}{result["throughput"]:>9.1f}{result["p50_ms"]:>9.2f}'
+              f'{result["p95_ms"]:>9.2f}{result["p99_ms"]:>9.2f}{result["errors"]:>8}{result.get("shed", 0):>6}{queries:>9}')
+        before = (baseline or {}).get(name)
+        if before:
+            changes = [f'{(result[key] - before[key]) / before[key] * 100:+.0f}%' if before[key] else '-'
+                       for key in ('throughput', 'p50_ms', 'p95_ms', 'p99_ms')]
+            print(f'{"  vs baseline":<28}' + ''.join(f'{change:>9}' for change in changes))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--products', type=int, default=100000)
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--cart-items', type=int, default=2)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--db', help='SQLite file to reuse, or to create on the first run')
+    parser.add_argument('--requests', type=int, default=200, help='Requests per scenario')
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--gunicorn', type=int, metavar='WORKERS',
+                        help='Drive a local gunicorn with this many workers over HTTP')
+    parser.add_argument('--scenario', action='append', dest='scenarios', choices=list(SCENARIOS),
+                        help='Scenario to run (repeatable, default all)')
+    parser.add_argument('--output', help='Where to write the JSON results')
+    parser.add_argument('--compare', metavar='RESULTS', help='Earlier results file to compare with')
+    args = parser.parse_args(argv)
+
+    db_path = os.path.abspath(args.db or os.path.join(
+        tempfile.mkdtemp(prefix='load-bench-'), 'bench.db'))
+    reuse = os.path.exists(db_path)
+    os.environ['DATABASE_URL'] = 'sqlite:///' + db_path
+    from sqlalchemy import func, select
+    from app import create_app
+    from models import db, Product
+    from schema import init_db
+
+    app = create_app()
+    with app.app_context():
+        start = time.perf_counter()
+        if reuse:
+            summary = dataset.describe()
+        else:
+            init_db()
+            summary = dataset.generate(args.products, args.users, args.cart_items, args.seed)
+        print(f'dataset {db_path}: ' + ', '.join(f'{k}={v}' for k, v in summary.items()) +
+              f' ({"reused" if reuse else f"built in {time.perf_counter() - start:.1f}s"})')
+        product_ids = db.session.scalars(select(Product.id)).all()
+        in_stock = db.session.scalars(select(Product.id).where(Product.stock > 100)).all()
+        category_counts = dict(db.session.execute(
+            select(Product.category, func.count()).group_by(Product.category)
+        ).all())
+        counter = None if args.gunicorn else StatementCounter(db.engines.values())
+
+    server = None
+    if args.gunicorn:
+        server, base_url = start_gunicorn(args.gunicorn, dict(os.environ))
+        new_session = lambda: HttpSession(base_url)
+    else:
+        new_session = lambda: TestClientSession(app)
+
+    data = {
+        'product_ids': product_ids,
+        'in_stock': in_stock or product_ids,
+        'pages': max(1, math.ceil(len(product_ids) / LISTING_PER_PAGE)),
+        'category_pages': {category: max(1, math.ceil(count / LISTING_PER_PAGE))
+                           for category, count in category_counts.items()},
+        'terms': dataset.search_terms(),
+        'users': summary['users'],
+        'new_session': new_session,
+    }
+    try:
+        sessions = [login(new_session(), dataset.user_email(n))
+                    for n in range(min(args.threads, summary['users']))]
+        endpoints = {}
+        for index, name in enumerate(args.scenarios or SCENARIOS):
+            endpoints[name] = run_scenario(SCENARIOS[name], sessions, data, args, counter, index)
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['endpoints']
+    print(f'\nmode={"gunicorn x%d" % args.gunicorn if args.gunicorn else "test client"} '
+          f'threads={len(sessions)} requests={args.requests}')
+    print_results(endpoints, baseline)
+
+    stamp = datetime.now(timezone.utc)
+    output = args.output or os.path.join(
+        ROOT, 'benchmarks', 'results', f'load-{stamp:%Y%m%dT%H%M%SZ}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump({
+            'meta': {
+                'time': stamp.isoformat(),
+                'commit': git_commit(),
+                'python': platform.python_version(),
+                'mode': 'gunicorn' if args.gunicorn else 'test_client',
+                'args': {k: v for k, v in vars(args).items() if k not in ('output', 'compare')},
+                'dataset': summary,
+            },
+            'endpoints': endpoints,
+        }, f, indent=2)
+    print(f'\nresults written to {output}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
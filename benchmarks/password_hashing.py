@@ -0,0 +1,77 @@
+"""Login throughput for different password hashing settings.
+
+    python -m benchmarks.password_hashing --logins 64 --threads 16
+
+For every method, a user is created with a hash of that method and
+``--logins`` concurrent POST /login requests are fired at the app. The run
+reports successful logins per second, p95 latency and how many requests
+were shed with 503 by the bounded hashing pool.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_METHODS = [
+    'pbkdf2:sha256:100000',
+    'pbkdf2:sha256:600000',
+    'scrypt:16384:8:1',
+    'scrypt:32768:8:1',
+]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--logins', type=int, default=64)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--workers', type=int, default=2, help='PASSWORD_HASH_WORKERS')
+    parser.add_argument('--queue-limit', type=int, default=4, help='PASSWORD_HASH_QUEUE_LIMIT')
+    parser.add_argument('--method', action='append', dest='methods',
+                        help='Hash method to measure (repeatable)')
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix='password-bench-')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(workdir, 'bench.db')
+    from app import create_app
+    from schema import init_db
+    from models import db, User
+    from passwords import PasswordHasher
+
+    app = create_app()
+    app.config['WTF_CSRF_ENABLED'] = False
+    with app.app_context():
+        init_db()
+
+    print(f'{"method":<24}{"logins/s":>10}{"p95 ms":>10}{"shed":>8}')
+    for i, method in enumerate(args.methods or DEFAULT_METHODS):
+        hasher = PasswordHasher(method=method, workers=args.workers,
+                                queue_limit=args.queue_limit, timeout=60)
+        app.extensions['password_hasher'] = hasher
+        email = f'bench{i}@example.com'
+        with app.app_context():
+            db.session.add(User(email=email, name='Bench', password=hasher.hash('secret')))
+            db.session.commit()
+
+        def login(_):
+            client = app.test_client()
+            start = time.perf_counter()
+            response = client.post('/login', data={'email': email, 'password': 'secret'})
+            return response.status_code, time.perf_counter() - start
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.threads) as pool:
+            results = list(pool.map(login, range(args.logins)))
+        elapsed = time.perf_counter() - start
+        hasher.shutdown()
+
+        ok = sorted(latency for status, latency in results if status == 302)
+        shed = sum(1 for status, _ in results if status == 503)
+        p95 = ok[max(0, int(len(ok) * 0.95) - 1)] * 1000 if ok else float('nan')
+        print(f'{method:<24}{len(ok) / elapsed:>10.1f}{p95:>10.1f}{shed:>8}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
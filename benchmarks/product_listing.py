@@ -0,0 +1,104 @@
+"""Payload size and latency of product listings with and without projection.
+
+    python -m benchmarks.product_listing --products 2000 --per-page 50
+
+Creates a catalog whose descriptions are ``--description-bytes`` long and
+times:
+
+- building one listing page from full Product objects (the old code path)
+  against building it from column-restricted rows;
+- GET /api/products for several ``fields=`` projections;
+- ``--per-page`` single GET /api/products/<id> calls against one
+  ``?ids=`` multi-get.
+
+The catalog cache is disabled (CATALOG_CACHE_TTL=0), so every request runs
+its queries.
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+PROJECTIONS = [None, 'id,name,price,image_url,category', 'id,name,price']
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000, result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--products', type=int, default=2000)
+    parser.add_argument('--per-page', type=int, default=50)
+    parser.add_argument('--description-bytes', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix='listing-bench-')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(workdir, 'bench.db')
+    os.environ['CATALOG_CACHE_TTL'] = '0'
+    from sqlalchemy import insert
+    from app import create_app
+    from catalog import PRODUCT_FIELDS, product_serializer, project_products, serialize_product
+    from models import db, Product
+    from schema import init_db
+
+    app = create_app()
+    with app.app_context():
+        init_db()
+        db.session.execute(insert(Product), [{
+            'name': f'Product {i}', 'description': 'x' * args.description_bytes,
+            'price': 10.0 + i % 100, 'image_url': 'https://example.com/p.jpg',
+            'stock': 100, 'category': 'Other'
+        } for i in range(args.products)])
+        db.session.commit()
+        ids = [row[0] for row in db.session.query(Product.id).limit(args.per_page)]
+
+        def orm_page():
+            products = Product.query.order_by(Product.id).limit(args.per_page).all()
+            result = [serialize_product(product) for product in products]
+            db.session.expunge_all()
+            return result
+
+        def projected_page():
+            serialize = product_serializer(PRODUCT_FIELDS)
+            rows = project_products(Product.query, PRODUCT_FIELDS).order_by(Product.id)
+            return [serialize(row) for row in rows.limit(args.per_page)]
+
+        orm_ms, _ = timed(orm_page, args.repeat)
+        rows_ms, _ = timed(projected_page, args.repeat)
+
+    client = app.test_client()
+    print(f'products={args.products} per_page={args.per_page} '
+          f'description={args.description_bytes}B')
+    print('\nbuild one page, all fields')
+    print(f'  ORM objects:      {orm_ms:8.2f} ms')
+    print(f'  projected rows:   {rows_ms:8.2f} ms  ({orm_ms / rows_ms:.1f}x)')
+
+    print(f'\nGET /api/products?per_page={args.per_page}')
+    print(f'  {"fields":<36}{"bytes":>10}{"median ms":>12}')
+    for fields in PROJECTIONS:
+        url = f'/api/products?per_page={args.per_page}'
+        if fields:
+            url += f'&fields={fields}'
+        ms, response = timed(lambda: client.get(url), args.repeat)
+        print(f'  {fields or "(all)":<36}{len(response.data):>10}{ms:>12.2f}')
+
+    single_ms, _ = timed(lambda: [client.get(f'/api/products/{i}') for i in ids], args.repeat)
+    multi_url = '/api/products?ids=' + ','.join(str(i) for i in ids)
+    multi_ms, _ = timed(lambda: client.get(multi_url), args.repeat)
+    print(f'\n{len(ids)} products by id')
+    print(f'  one GET per id:   {single_ms:8.2f} ms')
+    print(f'  ?ids= multi-get:  {multi_ms:8.2f} ms  ({single_ms / multi_ms:.1f}x)')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
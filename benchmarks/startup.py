@@ -0,0 +1,88 @@
+"""Cold-start time of a worker: importing the app and building it.
+
+    python -m benchmarks.startup --runs 10
+
+Each run is a fresh interpreter that imports ``app``, calls ``create_app()``
+and exits, as a gunicorn worker would without --preload. The run reports
+the median and worst import and create_app times, plus the whole process
+including interpreter start. DATABASE_URL points at a file that does not exist
+yet; if startup created it, something connected to the database at import or
+in create_app and the run fails. ``--importtime N`` also lists the N slowest
+modules from ``python -X importtime``.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = '''
+import json, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+app.create_app()
+created = time.perf_counter()
+print(json.dumps({'import': imported - start, 'create_app': created - imported}))
+'''
+
+
+def run_child(env, extra_args=()):
+    return subprocess.run([sys.executable, *extra_args, '-c', CHILD], cwd=ROOT, env=env,
+                          capture_output=True, text=True, check=True)
+
+
+def slowest_imports(env, limit):
+    # -X importtime lines: "import time: self [us] | cumulative | name"
+    stderr = run_child(env, ['-X', 'importtime']).stderr
+    modules = []
+    for line in stderr.splitlines():
+        parts = line.split('|')
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        modules.append((int(parts[1]), parts[2].strip()))
+    return sorted(modules, reverse=True)[:limit]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--importtime', type=int, default=0, metavar='N',
+                        help='Also show the N slowest imports')
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix='startup-bench-')
+    db_path = os.path.join(workdir, 'bench.db')
+    env = dict(os.environ, DATABASE_URL='sqlite:///' + db_path)
+
+    imports, creates, totals = [], [], []
+    for _ in range(args.runs):
+        start = time.perf_counter()
+        timings = json.loads(run_child(env).stdout.strip().splitlines()[-1])
+        totals.append(time.perf_counter() - start)
+        imports.append(timings['import'])
+        creates.append(timings['create_app'])
+
+    print(f'runs={args.runs}')
+    print(f'{"":<12}{"median ms":>12}{"max ms":>10}')
+    for label, values in (('import', imports), ('create_app', creates), ('process', totals)):
+        print(f'{label:<12}{statistics.median(values) * 1000:>12.1f}{max(values) * 1000:>10.1f}')
+
+    if args.importtime:
+        print('\nslowest imports (cumulative):')
+        for micros, name in slowest_imports(env, args.importtime):
+            print(f'{micros / 1000:>10.1f} ms  {name}')
+
+    if os.path.exists(db_path):
+        print('FAILED: startup touched the database')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
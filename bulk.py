@@ -0,0 +1,422 @@
+import csv
+import io
+import json
+from collections import Counter
+from datetime import datetime
+from sqlalchemy import bindparam, func, insert, select, update
+from werkzeug.datastructures import MultiDict
+from catalog import mark_catalog_changed
+from facets import adjust_facet_counts, cell, refresh_facet_counts
+from stats import add_statistics, inventory_totals, low_stock_threshold, product_deltas, totals_delta
+from forms import ProductForm
+from models import db, Product
+
+PRODUCT_FIELDS = ['name', 'description', 'price', 'image_url', 'stock', 'category']
+EXPORT_FIELDS = ['id'] + PRODUCT_FIELDS + ['created_at', 'updated_at']
+MAX_REPORTED_ERRORS = 1000
+CATEGORIES = [value for value, _ in ProductForm.category.kwargs['choices']]
+
+# Fields a patch may change and the relative operations each one supports
+PATCH_OPERATIONS = {
+    'name': (),
+    'description': (),
+    'image_url': (),
+    'category': (),
+    'price': ('add', 'mul'),
+    'stock': ('add',),
+}
+
+products_table = Product.__table__
+
+_update_product = update(products_table).where(
+    products_table.c.id == bindparam('_id')
+).values({field: bindparam(field) for field in PRODUCT_FIELDS + ['updated_at']})
+
+
+class ImportResult:
+
+    def __init__(self):
+        self.inserted = 0
+        self.updated = 0
+        self.error_count = 0
+        self.errors = []
+
+    def add_error(self, line, errors):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line, 'errors': errors})
+
+    def to_dict(self):
+        return {
+            'inserted': self.inserted,
+            'updated': self.updated,
+            'error_count': self.error_count,
+            'errors': self.errors
+        }
+
+
+def read_ndjson(stream):
+    for line_no, line in enumerate(io.TextIOWrapper(stream, encoding='utf-8'), start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield line_no, None, {'_row': [f'Invalid JSON: {e}']}
+            continue
+        if not isinstance(row, dict):
+            yield line_no, None, {'_row': ['Expected a JSON object']}
+            continue
+        yield line_no, row, None
+
+
+def read_csv(stream):
+    reader = csv.DictReader(io.TextIOWrapper(stream, encoding='utf-8', newline=''))
+    # Line 1 is the header
+    for line_no, row in enumerate(reader, start=2):
+        yield line_no, row, None
+
+
+READERS = {
+    'ndjson': read_ndjson,
+    'csv': read_csv,
+}
+
+
+def validate_row(row):
+    # Same rules as the admin form; CSRF does not apply to machine input
+    formdata = MultiDict({
+        key: '' if value is None else str(value)
+        for key, value in row.items() if key in PRODUCT_FIELDS
+    })
+    form = ProductForm(formdata=formdata, meta={'csrf': False})
+    if not form.validate():
+        return None, {field: errors for field, errors in form.errors.items()}
+    values = {field: getattr(form, field).data for field in PRODUCT_FIELDS}
+    product_id = row.get('id')
+    if product_id not in (None, ''):
+        try:
+            values['id'] = int(product_id)
+        except (TypeError, ValueError):
+            return None, {'id': ['Not a valid integer value.']}
+    return values, None
+
+
+def _write_batch(batch, result):
+    ids = [row['id'] for row in batch if 'id' in row]
+    existing = {}
+    if ids:
+        existing = {row.id: row for row in db.session.execute(
+            select(products_table.c.id, products_table.c.category, products_table.c.price,
+                   products_table.c.stock)
+            .where(products_table.c.id.in_(ids))
+        )}
+
+    now = datetime.utcnow()
+    inserts, updates = [], []
+    deltas, stats = Counter(), Counter()
+    threshold = low_stock_threshold()
+    for row in batch:
+        old = existing.get(row.get('id'))
+        if old is not None:
+            updates.append(dict(row, _id=row['id'], updated_at=now))
+            deltas[cell(old.category, old.price, old.stock)] -= 1
+        else:
+            inserts.append(dict(row, created_at=now, updated_at=now))
+        deltas[cell(row['category'], row['price'], row['stock'])] += 1
+        stats.update(product_deltas(old and (old.price, old.stock), (row['price'], row['stock']),
+                                    threshold))
+
+    conn = db.session.connection()
+    if inserts:
+        conn.execute(insert(products_table), inserts)
+    if updates:
+        conn.execute(_update_product, updates)
+    adjust_facet_counts(conn, deltas)
+    add_statistics(conn, stats)
+    mark_catalog_changed()
+    db.session.commit()
+    result.inserted += len(inserts)
+    result.updated += len(updates)
+
+
+def import_products(rows, batch_size=1000):
+    # rows yields (line_no, row, parse_errors). Valid rows are written in
+    # batches of executemany INSERTs/UPDATEs, one transaction per batch, so
+    # memory stays bounded and a bad row never aborts the whole feed.
+    result = ImportResult()
+    batch = []
+    seen_ids = set()
+    for line_no, row, errors in rows:
+        if errors is None:
+            values, errors = validate_row(row)
+        if errors:
+            result.add_error(line_no, errors)
+            continue
+        # The same id twice in one batch would be classified before the
+        # first copy is written
+        if values.get('id') in seen_ids:
+            _write_batch(batch, result)
+            batch, seen_ids = [], set()
+        batch.append(values)
+        if 'id' in values:
+            seen_ids.add(values['id'])
+        if len(batch) >= batch_size:
+            _write_batch(batch, result)
+            batch, seen_ids = [], set()
+    if batch:
+        _write_batch(batch, result)
+    return result
+
+
+class PatchError(ValueError):
+    pass
+
+
+def _convert(field, value):
+    try:
+        if field == 'price':
+            value = float(value)
+        elif field == 'stock':
+            if isinstance(value, float) and not value.is_integer():
+                raise ValueError
+            value = int(value)
+        elif not isinstance(value, str) or not value:
+            raise ValueError
+    except (TypeError, ValueError):
+        raise PatchError(f'Invalid value for {field}')
+    if field == 'name' and len(value) > 100:
+        raise PatchError('name must be at most 100 characters')
+    if field == 'category' and value not in CATEGORIES:
+        raise PatchError(f'Unknown category: {value}')
+    return value
+
+
+def parse_patch(patch):
+    # {'id': 1, 'price': 9.5, 'stock': {'add': -2}} -> {'price': ('set', 9.5), 'stock': ('add', -2)}
+    changes = {}
+    for field, operations in PATCH_OPERATIONS.items():
+        if field not in patch:
+            continue
+        value = patch[field]
+        if isinstance(value, dict):
+            if len(value) != 1:
+                raise PatchError(f'{field} takes exactly one operation')
+            op, operand = next(iter(value.items()))
+            if op not in operations:
+                raise PatchError(f'Unsupported operation {op!r} for {field}')
+            operand = _convert(field, operand)
+            if op == 'mul' and operand < 0:
+                raise PatchError(f'{field} multiplier must not be negative')
+            changes[field] = (op, operand)
+        else:
+            value = _convert(field, value)
+            if field in ('price', 'stock') and value < 0:
+                raise PatchError(f'{field} must not be negative')
+            changes[field] = ('set', value)
+    if not changes:
+        raise PatchError('Nothing to update')
+    return changes
+
+
+def _patch_values(changes):
+    values = {}
+    for field, (op, _) in changes.items():
+        column = products_table.c[field]
+        param = bindparam(f'p_{field}')
+        if op == 'add':
+            values[field] = column + param
+        elif op == 'mul':
+            # Multiplied prices are rounded to cents
+            values[field] = func.round(column * param, 2)
+        else:
+            values[field] = param
+    return values
+
+
+def _patch_params(changes):
+    return {f'p_{field}': value for field, (_, value) in changes.items()}
+
+
+def _apply(value, change):
+    op, operand = change
+    if op == 'add':
+        return value + operand
+    if op == 'mul':
+        return round(value * operand, 2)
+    return operand
+
+
+def _parse_entry(patch):
+    if not isinstance(patch, dict):
+        raise PatchError('Expected an object')
+    if 'id' in patch:
+        try:
+            product_id = int(patch['id'])
+        except (TypeError, ValueError):
+            raise PatchError('Invalid id')
+        return {'id': product_id}, parse_patch({k: v for k, v in patch.items() if k != 'id'})
+    if 'category' in patch and isinstance(patch.get('set'), dict):
+        return {'category': _convert('category', patch['category'])}, parse_patch(patch['set'])
+    raise PatchError("A patch needs an 'id', or a 'category' with a 'set' object")
+
+
+def apply_patches(patches):
+    # Applies a list of patches in a single transaction and returns one result
+    # per patch, in order:
+    #   {'id': 1, 'price': 9.5, 'stock': {'add': -2}}
+    #   {'category': 'Home', 'set': {'price': {'mul': 0.9}}}
+    # Id patches run in request order: consecutive patches of the same shape
+    # (fields and operations) are sent as one executemany UPDATE, so a later
+    # patch to an id always sees the earlier ones. Category patches are one
+    # UPDATE each and run after all id patches.
+    results, parsed = [], []
+    for patch in patches:
+        try:
+            selector, changes = _parse_entry(patch)
+        except PatchError as e:
+            selector = {key: patch[key] for key in ('id', 'category')
+                        if isinstance(patch, dict) and key in patch}
+            selector.update(status='invalid', error=str(e))
+            changes = None
+        results.append(selector)
+        parsed.append(changes)
+
+    ids = {result['id'] for result, changes in zip(results, parsed) if changes and 'id' in result}
+    current = {}
+    if ids:
+        rows = db.session.execute(
+            select(products_table.c.id, products_table.c.category, products_table.c.price,
+                   products_table.c.stock)
+            .where(products_table.c.id.in_(ids))
+        ).all()
+        current = {row.id: {'category': row.category, 'price': row.price, 'stock': row.stock}
+                   for row in rows}
+    original = {product_id: dict(state) for product_id, state in current.items()}
+
+    # [(shape, changes, [(result, params)])], consecutive patches of one shape
+    runs = []
+    category_patches = []
+    for result, changes in zip(results, parsed):
+        if changes is None:
+            continue
+        if 'category' in result:
+            category_patches.append((result, changes))
+            continue
+        state = current.get(result['id'])
+        if state is None:
+            result['status'] = 'not_found'
+            continue
+        # Validate against the row as left by earlier patches in this request
+        updated = {field: _apply(state[field], changes[field]) for field in ('price', 'stock')
+                   if field in changes}
+        if any(value < 0 for value in updated.values()):
+            result.update(status='invalid', error='price and stock must not become negative')
+            continue
+        state.update(updated)
+        if 'category' in changes:
+            state['category'] = changes['category'][1]
+        shape = tuple(sorted((field, op) for field, (op, _) in changes.items()))
+        if not runs or runs[-1][0] != shape:
+            runs.append((shape, changes, []))
+        runs[-1][2].append((result, dict(_patch_params(changes), _id=result['id'])))
+
+    now = datetime.utcnow()
+    conn = db.session.connection()
+    try:
+        for _, changes, members in runs:
+            stmt = update(products_table).where(products_table.c.id == bindparam('_id'))
+            conn.execute(stmt.values(dict(_patch_values(changes), updated_at=now)),
+                         [params for _, params in members])
+            for result, _ in members:
+                result['status'] = 'updated'
+
+        # A category-wide patch can move any number of rows, so the totals of
+        # the categories involved are taken before and after
+        touched = set()
+        for result, changes in category_patches:
+            touched.add(result['category'])
+            if 'category' in changes:
+                touched.add(changes['category'][1])
+        if touched:
+            in_touched = products_table.c.category.in_(touched)
+            totals_before = inventory_totals(conn, in_touched)
+
+        for result, changes in category_patches:
+            stmt = update(products_table).where(products_table.c.category == result['category'])
+            # Rows that a relative change would take below zero are left alone
+            for field in ('price', 'stock'):
+                if field in changes and changes[field][0] == 'add':
+                    stmt = stmt.where(products_table.c[field] + changes[field][1] >= 0)
+            result['updated'] = conn.execute(
+                stmt.values(dict(_patch_values(changes), updated_at=now)), _patch_params(changes)
+            ).rowcount
+            result['status'] = 'updated'
+
+        deltas, stats = Counter(), Counter()
+        threshold = low_stock_threshold()
+        for product_id, old in original.items():
+            new = current[product_id]
+            if new == old:
+                continue
+            deltas[cell(old['category'], old['price'], old['stock'])] -= 1
+            deltas[cell(new['category'], new['price'], new['stock'])] += 1
+            stats.update(product_deltas((old['price'], old['stock']),
+                                        (new['price'], new['stock']), threshold))
+        adjust_facet_counts(conn, deltas)
+        if touched:
+            refresh_facet_counts(conn, touched)
+            stats.update(totals_delta(totals_before, inventory_totals(conn, in_touched)))
+        add_statistics(conn, stats)
+
+        mark_catalog_changed()
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return results
+
+
+def iter_product_rows(chunk_size=1000):
+    # Keyset scan over the primary key with plain Core rows, so exporting the
+    # whole catalog never holds more than one chunk in memory
+    columns = [products_table.c[field] for field in EXPORT_FIELDS]
+    last_id = 0
+    while True:
+        rows = db.session.execute(
+            select(*columns).where(products_table.c.id > last_id)
+            .order_by(products_table.c.id).limit(chunk_size)
+        ).mappings().all()
+        if not rows:
+            return
+        for row in rows:
+            yield {key: value.isoformat() if isinstance(value, datetime) else value
+                   for key, value in row.items()}
+        last_id = rows[-1]['id']
+        # Release the read transaction between chunks
+        db.session.commit()
+
+
+def export_ndjson(rows):
+    for row in rows:
+        yield json.dumps(row) + '\n'
+
+
+def export_csv(rows):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS)
+    writer.writeheader()
+    for row in rows:
+        writer.writerow(row)
+        if buffer.tell() > 64 * 1024:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+EXPORTERS = {
+    'ndjson': ('application/x-ndjson', export_ndjson),
+    'csv': ('text/csv', export_csv),
+}
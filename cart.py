@@ -0,0 +1,248 @@
+import secrets
+import time
+from importlib import import_module
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import delete, exists, func, literal, select, update
+from sqlalchemy.orm import contains_eager
+from cache import TTLCache
+from models import db, CartItem, Product, User
+from stats import add_statistics
+
+# Per-worker cache of cart summaries keyed by (user_id, user.cart_version).
+# Every cart write below sets a new version in the same transaction, so once
+# it commits no worker or session can hit the summary of the old contents.
+_summary_cache = TTLCache(maxsize=10000, name='cart_summary')
+
+
+class Cart:
+
+    def __init__(self, items, total):
+        self.items = items
+        self.total = total
+
+    @property
+    def count(self):
+        return sum(item.quantity for item in self.items)
+
+    def __iter__(self):
+        yield from self.items
+
+    def __len__(self):
+        return len(self.items)
+
+
+def load_cart(user_id):
+    # Cart lines, their products and the cart total in a single query: the
+    # product columns are joined in eagerly and the total comes from a window
+    # aggregate over the same rows.
+    total = func.sum(CartItem.quantity * Product.price).over()
+    rows = db.session.query(CartItem, total).join(CartItem.product).options(
+        contains_eager(CartItem.product)
+    ).filter(
+        CartItem.user_id == user_id
+    ).order_by(CartItem.created_at, CartItem.id).all()
+    if not rows:
+        return Cart([], 0.0)
+    return Cart([item for item, _ in rows], round(float(rows[0][1]), 2))
+
+
+def serialize_cart(cart):
+    return {
+        'cart_items': [{
+            'id': item.id,
+            'product_id': item.product_id,
+            'product_name': item.product.name,
+            'product_price': item.product.price,
+            'product_image': item.product.image_url,
+            'quantity': item.quantity
+        } for item in cart.items],
+        'total': cart.total
+    }
+
+
+class CartError(Exception):
+    status_code = 400
+
+
+class ProductNotFound(CartError):
+    status_code = 404
+
+
+class CartItemNotFound(CartError):
+    status_code = 404
+
+
+class InsufficientStock(CartError):
+    pass
+
+
+# Imported on first use: sqlalchemy.dialects.postgresql alone adds tens of
+# milliseconds to startup on deployments that never talk to PostgreSQL
+_UPSERT_DIALECTS = {
+    'sqlite': 'sqlalchemy.dialects.sqlite',
+    'postgresql': 'sqlalchemy.dialects.postgresql',
+}
+
+
+def add_to_cart(user_id, product_id, quantity=1):
+    # The first line in an empty cart counts as a new cart on the dashboard
+    new_cart = not db.session.scalar(select(exists().where(CartItem.user_id == user_id)))
+    _upsert_cart_line(user_id, product_id, quantity)
+    touch_carts([user_id])
+    if new_cart:
+        add_statistics(db.session.connection(), {}, {'carts_created': 1})
+
+
+def _upsert_cart_line(user_id, product_id, quantity):
+    # Insert the line or add to its quantity in one statement. The row only
+    # gets written while the resulting quantity fits in the product's stock,
+    # so concurrent requests can neither lose increments nor oversubscribe.
+    dialect = _UPSERT_DIALECTS.get(db.session.get_bind().dialect.name)
+    if dialect is None:
+        return _add_to_cart_locked(user_id, product_id, quantity)
+    insert = import_module(dialect).insert
+
+    now = datetime.utcnow()
+    source = select(
+        literal(user_id), Product.id, literal(quantity), literal(now), literal(now)
+    ).where(Product.id == product_id, Product.stock >= quantity)
+    stmt = insert(CartItem).from_select(
+        ['user_id', 'product_id', 'quantity', 'created_at', 'updated_at'], source
+    )
+    stock = select(Product.stock).where(Product.id == product_id).scalar_subquery()
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['user_id', 'product_id'],
+        set_={'quantity': CartItem.quantity + stmt.excluded.quantity,
+              'updated_at': stmt.excluded.updated_at},
+        where=CartItem.quantity + stmt.excluded.quantity <= stock
+    )
+    if db.session.execute(stmt).rowcount == 0:
+        _raise_add_error(product_id)
+
+
+def _add_to_cart_locked(user_id, product_id, quantity):
+    # Fallback for databases without INSERT ... ON CONFLICT
+    product = db.session.get(Product, product_id, with_for_update=True)
+    if product is None:
+        raise ProductNotFound('Product not found')
+    cart_item = CartItem.query.filter_by(user_id=user_id, product_id=product_id).first()
+    current = cart_item.quantity if cart_item else 0
+    if current + quantity > product.stock:
+        raise InsufficientStock('Not enough stock')
+    if cart_item:
+        cart_item.quantity = current + quantity
+    else:
+        db.session.add(CartItem(
+            user_id=user_id,
+            product_id=product_id,
+            quantity=quantity,
+            created_at=datetime.utcnow()
+        ))
+    db.session.flush()
+
+
+def _raise_add_error(product_id):
+    if db.session.get(Product, product_id) is None:
+        raise ProductNotFound('Product not found')
+    raise InsufficientStock('Not enough stock')
+
+
+def remove_cart_item(user_id, cart_item_id):
+    deleted = CartItem.query.filter_by(id=cart_item_id, user_id=user_id).delete(
+        synchronize_session=False
+    )
+    if not deleted:
+        raise CartItemNotFound('Cart item not found')
+    touch_carts([user_id])
+
+
+def set_cart_quantity(user_id, cart_item_id, quantity):
+    # Like add_to_cart, the stock check is part of the UPDATE itself
+    if quantity < 1:
+        return remove_cart_item(user_id, cart_item_id)
+    stock = select(Product.stock).where(Product.id == CartItem.product_id).scalar_subquery()
+    updated = db.session.execute(
+        update(CartItem).where(
+            CartItem.id == cart_item_id, CartItem.user_id == user_id, stock >= quantity
+        ).values(quantity=quantity, updated_at=datetime.utcnow())
+    ).rowcount
+    if not updated:
+        if db.session.query(CartItem.id).filter_by(id=cart_item_id, user_id=user_id).first() is None:
+            raise CartItemNotFound('Cart item not found')
+        raise InsufficientStock('Not enough stock')
+    touch_carts([user_id])
+
+
+def clear_cart(user_id):
+    deleted = CartItem.query.filter_by(user_id=user_id).delete(synchronize_session=False)
+    if deleted:
+        touch_carts([user_id])
+    return deleted
+
+
+def touch_carts(user_ids):
+    # Random rather than incremented, so the version of a write that is
+    # rolled back is never reused for different cart contents
+    db.session.execute(
+        update(User).where(User.id.in_(user_ids)).values(cart_version=secrets.token_hex(8)),
+        execution_options={'synchronize_session': False}
+    )
+
+
+def sweep_expired_cart_items(ttl_days=None, batch_size=None, pause=None):
+    # Deletes cart lines untouched for ttl_days, oldest first, in short
+    # transactions of batch_size rows so the SQLite write lock is released
+    # between batches. Returns (rows deleted, batches).
+    config = current_app.config
+    ttl_days = config['CART_TTL_DAYS'] if ttl_days is None else ttl_days
+    batch_size = batch_size or config['CART_SWEEP_BATCH_SIZE']
+    pause = config['CART_SWEEP_PAUSE'] if pause is None else pause
+    cutoff = datetime.utcnow() - timedelta(days=ttl_days)
+    expired = (
+        select(CartItem.id, CartItem.user_id).where(CartItem.updated_at < cutoff)
+        .order_by(CartItem.updated_at).limit(batch_size)
+    )
+    deleted = batches = 0
+    while True:
+        rows = db.session.execute(expired).all()
+        count = 0
+        if rows:
+            count = db.session.execute(
+                # Lines touched since they were selected are kept
+                delete(CartItem).where(CartItem.id.in_([row.id for row in rows]),
+                                       CartItem.updated_at < cutoff),
+                execution_options={'synchronize_session': False}
+            ).rowcount
+            # Cached summaries of the swept carts must not outlive their rows
+            touch_carts({row.user_id for row in rows})
+        if count:
+            add_statistics(db.session.connection(), {'cart_items_swept': count},
+                           {'cart_items_swept': count})
+        db.session.commit()
+        if not count:
+            return deleted, batches
+        deleted += count
+        batches += 1
+        if count < batch_size:
+            return deleted, batches
+        time.sleep(pause)
+
+
+def query_cart_summary(user_id):
+    count, total = db.session.query(
+        func.coalesce(func.sum(CartItem.quantity), 0),
+        func.coalesce(func.sum(CartItem.quantity * Product.price), 0.0)
+    ).join(Product, CartItem.product_id == Product.id).filter(
+        CartItem.user_id == user_id
+    ).one()
+    return {'count': int(count), 'total': round(float(total), 2)}
+
+
+def get_cart_summary(user_id):
+    # The version is read first, so a summary is never cached under a version
+    # newer than the contents it was computed from
+    version = db.session.scalar(select(User.cart_version).where(User.id == user_id))
+    ttl = current_app.config['CART_SUMMARY_TTL']
+    return _summary_cache.get_or_set((user_id, version), lambda: query_cart_summary(user_id),
+                                     ttl=ttl)
@@ -0,0 +1,225 @@
+import threading
+import time
+from datetime import datetime
+from functools import lru_cache
+from operator import attrgetter
+from flask import abort, current_app, request
+from sqlalchemy import event, func, select, update
+from sqlalchemy.orm import Session
+from cache import TTLCache
+from models import db, CatalogState, Product
+from pagination import SORTS
+
+# Serialized products and listing pages, shared by the HTML views and the API.
+# Keys include the catalog version and the stock version, so a product write
+# or checkout anywhere makes every older entry unreachable; LRU eviction then
+# reclaims them. Checkouts only bump the stock version unless they sell a
+# product out, which leaves the suggest index alone. Listing ETags come from
+# the same pair, so they change whenever a cached page could.
+catalog_cache = TTLCache(maxsize=2048, ttl=300, name='catalog')
+
+# Fields a product read can return, in serialization order
+PRODUCT_FIELDS = ('id', 'name', 'description', 'price', 'image_url', 'image_key', 'stock', 'category',
+                  'updated_at')
+DATETIME_FIELDS = {'updated_at'}
+SORT_FIELDS = tuple(dict.fromkeys(column.key for keys in SORTS.values() for column, _ in keys))
+
+_version = {'value': None, 'stock': None, 'updated_at': None, 'checked': 0.0}
+_version_lock = threading.Lock()
+
+
+def init_catalog(app):
+    catalog_cache.resize(maxsize=app.config['CATALOG_CACHE_SIZE'],
+                         ttl=app.config['CATALOG_CACHE_TTL'])
+
+
+def ensure_catalog_state():
+    if db.session.get(CatalogState, 1) is None:
+        db.session.add(CatalogState(id=1, version=0, updated_at=datetime.utcnow()))
+        db.session.commit()
+
+
+def parse_fields(value):
+    # ?fields=id,name,price -> ('id', 'name', 'price') in serialization order
+    if not value:
+        return PRODUCT_FIELDS
+    requested = {field.strip() for field in value.split(',') if field.strip()}
+    unknown = requested.difference(PRODUCT_FIELDS)
+    if unknown:
+        abort(400, description=f"Unknown field: {', '.join(sorted(unknown))}")
+    return tuple(field for field in PRODUCT_FIELDS if field in requested)
+
+
+@lru_cache(maxsize=64)
+def product_serializer(fields):
+    # Built once per field set. Works on Product objects and on Core rows
+    # alike, since both expose the columns as attributes.
+    getter = attrgetter(*fields)
+    if len(fields) == 1:
+        single = getter
+        getter = lambda product: (single(product),)
+    dates = [i for i, field in enumerate(fields) if field in DATETIME_FIELDS]
+
+    def serialize(product):
+        values = getter(product)
+        if dates:
+            values = list(values)
+            for i in dates:
+                values[i] = values[i].isoformat() if values[i] else None
+        return dict(zip(fields, values))
+    return serialize
+
+
+def serialize_product(product, fields=PRODUCT_FIELDS):
+    return product_serializer(fields)(product)
+
+
+def project_products(query, fields=PRODUCT_FIELDS, description_length=None):
+    # Restricts a Product query to plain rows with the given columns, skipping
+    # ORM object construction. Sort key columns are always selected so keyset
+    # cursors can be built from the rows; a description_length selects only
+    # the start of the description.
+    columns = []
+    for field in dict.fromkeys(fields + SORT_FIELDS):
+        column = getattr(Product, field)
+        if field == 'description' and description_length:
+            column = func.substr(column, 1, description_length).label(field)
+        columns.append(column)
+    return query.with_entities(*columns)
+
+
+def bump_catalog_version(connection=None):
+    # Runs inside the caller's transaction so the bump commits with the write
+    connection = connection or db.session.connection()
+    connection.execute(update(CatalogState).where(CatalogState.id == 1).values(
+        version=CatalogState.version + 1,
+        updated_at=datetime.utcnow()
+    ))
+
+
+def bump_stock_version(connection=None):
+    connection = connection or db.session.connection()
+    connection.execute(update(CatalogState).where(CatalogState.id == 1).values(
+        stock_version=CatalogState.stock_version + 1,
+        updated_at=datetime.utcnow()
+    ))
+
+
+def _refresh_version():
+    # Other workers learn about writes by polling the version row, at most once
+    # per CATALOG_VERSION_CHECK_INTERVAL seconds
+    interval = current_app.config['CATALOG_VERSION_CHECK_INTERVAL']
+    now = time.monotonic()
+    if _version['value'] is None or now - _version['checked'] >= interval:
+        with _version_lock:
+            if _version['value'] is None or now - _version['checked'] >= interval:
+                row = db.session.query(CatalogState.version, CatalogState.stock_version,
+                                       CatalogState.updated_at).filter_by(id=1).first()
+                _version['value'], _version['stock'], _version['updated_at'] = row if row else (0, 0, None)
+                _version['checked'] = now
+    return _version
+
+
+def catalog_version():
+    return _refresh_version()['value']
+
+
+def catalog_stamp():
+    # (catalog version, stock version): what cached catalog data depends on
+    version = _refresh_version()
+    return version['value'], version['stock']
+
+
+def catalog_last_modified():
+    return _refresh_version()['updated_at']
+
+
+def _expire_local_version():
+    _version['checked'] = 0.0
+
+
+def cached(key, factory):
+    return catalog_cache.get_or_set(catalog_stamp() + key, factory)
+
+
+def get_product_data(product_id):
+    return cached(('product', product_id),
+                  lambda: serialize_product(Product.query.get_or_404(product_id)))
+
+
+def get_products_data(product_ids):
+    # Multi-get: ids already in the cache are served from it and the rest are
+    # loaded with a single IN query. Unknown ids are left out of the result.
+    stamp = catalog_stamp()
+    found, missing = {}, []
+    for product_id in dict.fromkeys(product_ids):
+        data = catalog_cache.get(stamp + ('product', product_id))
+        if data is None:
+            missing.append(product_id)
+        else:
+            found[product_id] = data
+    if missing:
+        serialize = product_serializer(PRODUCT_FIELDS)
+        rows = db.session.execute(
+            select(*[getattr(Product, field) for field in PRODUCT_FIELDS])
+            .where(Product.id.in_(missing))
+        )
+        for row in rows:
+            data = found[row.id] = serialize(row)
+            catalog_cache.set(stamp + ('product', row.id), data)
+    return found
+
+
+def listing_validators(*args, **kwargs):
+    return catalog_stamp(), catalog_last_modified()
+
+
+def product_validators(product_id):
+    product = get_product_data(product_id)
+    updated_at = product['updated_at']
+    last_modified = datetime.fromisoformat(updated_at) if updated_at else None
+    return (product['id'], updated_at), last_modified
+
+
+def request_key(endpoint):
+    return (endpoint, tuple(sorted(request.args.items(multi=True))))
+
+
+def mark_catalog_changed(session=None):
+    # Bump the version at most once per transaction
+    session = session or db.session()
+    if not session.info.get('catalog_bumped'):
+        bump_catalog_version(session.connection())
+        session.info['catalog_bumped'] = True
+
+
+def mark_stock_changed(session=None):
+    # For stock-only writes such as checkouts; a catalog bump covers it too
+    session = session or db.session()
+    if not session.info.get('catalog_bumped') and not session.info.get('stock_bumped'):
+        bump_stock_version(session.connection())
+        session.info['stock_bumped'] = True
+
+
+@event.listens_for(Session, 'after_flush')
+def _product_flush(session, flush_context):
+    changed = any(isinstance(obj, Product) for obj in session.new) or any(
+        isinstance(obj, Product) for obj in session.deleted
+    ) or any(
+        isinstance(obj, Product) and session.is_modified(obj) for obj in session.dirty
+    )
+    if changed:
+        mark_catalog_changed(session)
+
+
+@event.listens_for(Session, 'after_commit')
+def _product_commit(session):
+    bumped = session.info.pop('catalog_bumped', False)
+    if session.info.pop('stock_bumped', False) or bumped:
+        _expire_local_version()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _product_rollback(session):
+    session.info.pop('catalog_bumped', None)
+    session.info.pop('stock_bumped', None)
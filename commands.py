@@ -0,0 +1,151 @@
+import sys
+import time
+import click
+from flask import current_app
+from flask.cli import AppGroup, with_appcontext
+
+products_cli = AppGroup('products', help='Bulk product maintenance.')
+
+
+@products_cli.command('import')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['ndjson', 'csv']),
+              help='Input format (default: from the file extension).')
+@click.option('--batch-size', type=int, help='Rows per transaction.')
+def import_command(path, fmt, batch_size):
+    """Import or update products from an NDJSON or CSV file."""
+    from bulk import READERS, import_products
+
+    fmt = fmt or ('csv' if path.endswith('.csv') else 'ndjson')
+    batch_size = batch_size or current_app.config['BULK_BATCH_SIZE']
+    # Validation reuses ProductForm, which needs a request context
+    with current_app.test_request_context(), open(path, 'rb') as stream:
+        result = import_products(READERS[fmt](stream), batch_size=batch_size)
+    for error in result.errors:
+        click.echo(f"line {error['line']}: {error['errors']}", err=True)
+    click.echo(f'{result.inserted} inserted, {result.updated} updated, '
+               f'{result.error_count} rejected')
+
+
+@products_cli.command('export')
+@click.argument('path', type=click.Path(dir_okay=False, writable=True), required=False)
+@click.option('--format', 'fmt', type=click.Choice(['ndjson', 'csv']), default='ndjson')
+def export_command(path, fmt):
+    """Export every product as NDJSON or CSV (to stdout by default)."""
+    from bulk import EXPORTERS, iter_product_rows
+
+    _, exporter = EXPORTERS[fmt]
+    rows = iter_product_rows(chunk_size=current_app.config['BULK_BATCH_SIZE'])
+    out = open(path, 'w', newline='', encoding='utf-8') if path else sys.stdout
+    try:
+        for chunk in exporter(rows):
+            out.write(chunk)
+    finally:
+        if path:
+            out.close()
+
+
+stats_cli = AppGroup('stats', help='Admin dashboard statistics.')
+
+
+@stats_cli.command('reconcile')
+@click.option('--every', type=float, metavar='SECONDS',
+              help='Keep running and reconcile at this interval.')
+def reconcile_command(every):
+    """Recompute dashboard statistics from the source tables."""
+    from stats import reconcile_statistics
+
+    while True:
+        drift = reconcile_statistics()
+        if drift:
+            click.echo('Corrected drift: ' + ', '.join(f'{key} {value:+g}' for key, value in drift.items()))
+        else:
+            click.echo('Statistics are consistent.')
+        if not every:
+            return
+        time.sleep(every)
+
+
+@stats_cli.command('fold')
+@click.option('--every', type=float, metavar='SECONDS',
+              help='Keep running and fold at this interval.')
+def fold_command(every):
+    """Move pending statistic deltas into the dashboard totals."""
+    from models import db
+    from stats import fold_statistics
+
+    while True:
+        folded = fold_statistics(db.session.connection())
+        db.session.commit()
+        click.echo(f'Folded {folded} statistic deltas.')
+        if not every:
+            return
+        time.sleep(every)
+
+
+carts_cli = AppGroup('carts', help='Cart maintenance.')
+
+
+@carts_cli.command('sweep')
+@click.option('--ttl-days', type=float, help='Override CART_TTL_DAYS.')
+@click.option('--batch-size', type=int, help='Override CART_SWEEP_BATCH_SIZE.')
+@click.option('--every', type=float, metavar='SECONDS',
+              help='Keep running and sweep at this interval.')
+def sweep_command(ttl_days, batch_size, every):
+    """Delete cart items that have not been touched within the TTL."""
+    from cart import sweep_expired_cart_items
+
+    while True:
+        start = time.perf_counter()
+        deleted, batches = sweep_expired_cart_items(ttl_days, batch_size)
+        click.echo(f'Swept {deleted} expired cart items in {batches} batches '
+                   f'({time.perf_counter() - start:.2f}s).')
+        if not every:
+            return
+        time.sleep(every)
+
+
+images_cli = AppGroup('images', help='Product image storage.')
+
+
+@images_cli.command('backfill')
+@click.option('--limit', type=int, help='Import at most this many products.')
+@click.option('--concurrency', type=int, default=4, show_default=True,
+              help='Images downloaded and resized at once.')
+def backfill_command(limit, concurrency):
+    """Store remote product images locally and make their resized variants."""
+    from images import backfill_images
+
+    imported, failed = backfill_images(limit, concurrency, echo=click.echo)
+    click.echo(f'{imported} imported, {failed} failed')
+
+
+@click.command('init-db')
+@with_appcontext
+def init_db_command():
+    """Create missing tables and upgrade an existing database."""
+    from schema import init_db
+
+    init_db()
+    click.echo('Database initialized.')
+
+
+@click.command('seed')
+@with_appcontext
+def seed_command():
+    """Add the admin user and sample products to an empty database."""
+    from seed import seed_database
+
+    if seed_database():
+        click.echo('Seeded admin user and sample products.')
+    else:
+        click.echo('Admin user already exists; nothing to seed.')
+
+
+def init_commands(app):
+    app.cli.add_command(products_cli)
+    app.cli.add_command(stats_cli)
+    app.cli.add_command(carts_cli)
+    app.cli.add_command(images_cli)
+    app.cli.add_command(init_db_command)
+    app.cli.add_command(seed_command)
@@ -0,0 +1,61 @@
+import hashlib
+from datetime import timezone
+from functools import wraps
+from flask import make_response, request, session
+from flask_login import current_user
+
+
+def make_etag(*parts):
+    return hashlib.sha1(repr(parts).encode()).hexdigest()
+
+
+def _http_date(value):
+    # Stored timestamps are naive UTC; HTTP dates have one-second resolution
+    if value is None:
+        return None
+    return value.replace(microsecond=0, tzinfo=timezone.utc)
+
+
+def _is_fresh(etag, last_modified):
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    if last_modified is not None and request.if_modified_since is not None:
+        return last_modified <= request.if_modified_since
+    return False
+
+
+def conditional(validators, private=False):
+    # Conditional GET for a view. ``validators`` returns (etag_parts,
+    # last_modified) computed from cheap state such as the catalog version; when
+    # the client's copy is current a 304 is returned without running the view.
+    # Private responses are personalised, so the user is part of the ETag.
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if request.method not in ('GET', 'HEAD') or session.get('_flashes'):
+                return f(*args, **kwargs)
+
+            parts, last_modified = validators(*args, **kwargs)
+            if private:
+                user = current_user
+                parts = (parts, user.get_id(), getattr(user, 'is_admin', False))
+            etag = make_etag(parts, request.full_path)
+            last_modified = _http_date(last_modified)
+
+            if _is_fresh(etag, last_modified):
+                response = make_response('', 304)
+            else:
+                response = make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            if last_modified is not None:
+                response.last_modified = last_modified
+            response.cache_control.no_cache = True
+            if private:
+                response.cache_control.private = True
+            else:
+                response.cache_control.public = True
+            return response
+        return decorated_function
+    return decorator
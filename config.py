@@ -5,6 +5,94 @@ class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'your-secret-key-here'
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///database.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Comma-separated read replica URLs; views marked read_only query them
+    DATABASE_REPLICA_URLS = os.environ.get('DATABASE_REPLICA_URLS', '')
+    # Connection pool, applied to the primary and every replica
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+    DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', 30))
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+    DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', '1') == '1'
+    # Per-request query count, DB and template time (see instrumentation.py).
+    # SERVER_TIMING=0 keeps the measurements and logs but drops the header.
+    SQL_INSTRUMENTATION = os.environ.get('SQL_INSTRUMENTATION', '1') == '1'
+    SERVER_TIMING = os.environ.get('SERVER_TIMING', '1') == '1'
+    # Statements slower than this are logged with the endpoint that ran them
+    SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', 100))
+    # The same statement this many times in one request is logged as a likely N+1
+    N_PLUS_ONE_THRESHOLD = int(os.environ.get('N_PLUS_ONE_THRESHOLD', 5))
+    # Prometheus metrics at /metrics. Under gunicorn, point METRICS_DIR at a
+    # directory shared by the workers (emptied before start) so that a scrape
+    # covers all of them; workers write their totals there at most every
+    # METRICS_FLUSH_INTERVAL seconds.
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') == '1'
+    METRICS_DIR = os.environ.get('METRICS_DIR', '')
+    METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', 1.0))
+    # PRAGMAs run on every new SQLite connection
+    SQLITE_JOURNAL_MODE = os.environ.get('SQLITE_JOURNAL_MODE', 'WAL')
+    SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')
+    SQLITE_BUSY_TIMEOUT = int(os.environ.get('SQLITE_BUSY_TIMEOUT', 5000))  # milliseconds
+    SQLITE_CACHE_SIZE = int(os.environ.get('SQLITE_CACHE_SIZE', -64000))  # negative = KiB
+    SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
     PERMANENT_SESSION_LIFETIME = timedelta(days=7)
-    UPLOAD_FOLDER = 'static/images'
+    # Product images are stored here, relative to the app, and served from
+    # /images/. Each gets resized WebP and JPEG variants at these widths, made
+    # by IMAGE_WORKERS background threads per worker.
+    UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER') or 'static/images'
+    IMAGE_VARIANT_WIDTHS = tuple(int(width) for width in
+                                 os.environ.get('IMAGE_VARIANT_WIDTHS', '160,480,960').split(','))
+    IMAGE_QUALITY = int(os.environ.get('IMAGE_QUALITY', 80))
+    IMAGE_WORKERS = int(os.environ.get('IMAGE_WORKERS', 2))
+    # Limits for remote images fetched by `flask images backfill`
+    IMAGE_FETCH_TIMEOUT = float(os.environ.get('IMAGE_FETCH_TIMEOUT', 10))
+    IMAGE_MAX_BYTES = int(os.environ.get('IMAGE_MAX_BYTES', 10 * 1024 * 1024))
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max upload size
+    # Upper bound for per_page on every paginated listing and API
+    MAX_PER_PAGE = int(os.environ.get('MAX_PER_PAGE', 100))
+    # Seconds an approximate (count=estimate) listing total may be reused
+    COUNT_CACHE_TTL = int(os.environ.get('COUNT_CACHE_TTL', 60))
+    # 'auto' picks SQLite FTS5 when the database is SQLite and its build has
+    # FTS5, otherwise a portable LIKE backend
+    SEARCH_BACKEND = os.environ.get('SEARCH_BACKEND') or 'auto'
+    # Seconds a worker may reuse a cart badge summary. Cart writes, checkout and
+    # the expiry sweeper invalidate it on commit; this only bounds staleness
+    # after admin price changes.
+    CART_SUMMARY_TTL = int(os.environ.get('CART_SUMMARY_TTL', 300))
+    # Per-worker cache of serialized products and listing pages
+    CATALOG_CACHE_SIZE = int(os.environ.get('CATALOG_CACHE_SIZE', 2048))
+    CATALOG_CACHE_TTL = int(os.environ.get('CATALOG_CACHE_TTL', 300))
+    # How often a worker polls the catalog and stock versions for writes made by
+    # other workers
+    CATALOG_VERSION_CHECK_INTERVAL = float(os.environ.get('CATALOG_VERSION_CHECK_INTERVAL', 1.0))
+    # Bulk product import/export: rows per transaction and request size limit
+    BULK_BATCH_SIZE = int(os.environ.get('BULK_BATCH_SIZE', 1000))
+    BULK_MAX_CONTENT_LENGTH = int(os.environ.get('BULK_MAX_CONTENT_LENGTH', 512 * 1024 * 1024))
+    # Seconds a worker may reuse a cached user snapshot without a database check
+    USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL', 60))
+    # How often a worker polls the auth version for user changes made by other
+    # workers; bounds how long a demoted admin keeps admin access
+    AUTH_VERSION_CHECK_INTERVAL = float(os.environ.get('AUTH_VERSION_CHECK_INTERVAL', 1.0))
+    # Password hashing: any werkzeug method string, e.g. 'scrypt:32768:8:1' or
+    # 'pbkdf2:sha256:600000'. Existing hashes are upgraded on the next login.
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD') or 'scrypt'
+    # Hashing threads per worker process and how many more logins may wait
+    # for one; beyond that login/register answer 503 with Retry-After. Their
+    # sum must stay below the gunicorn threads per process (GUNICORN_THREADS,
+    # see gunicorn.conf.py), so that logins can never take every thread.
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', 2))
+    PASSWORD_HASH_QUEUE_LIMIT = int(os.environ.get('PASSWORD_HASH_QUEUE_LIMIT', 4))
+    PASSWORD_HASH_TIMEOUT = float(os.environ.get('PASSWORD_HASH_TIMEOUT', 10))
+    # Most sub-operations a single POST /api/batch may carry
+    BATCH_MAX_OPERATIONS = int(os.environ.get('BATCH_MAX_OPERATIONS', 50))
+    # Upper bound on entries in each worker's typeahead prefix index; one
+    # product takes its full name plus up to six name words. The default
+    # holds about 250k products with three-word names, at roughly 200 bytes
+    # per entry.
+    SUGGEST_MAX_ENTRIES = int(os.environ.get('SUGGEST_MAX_ENTRIES', 1000000))
+    # Products at or below this stock count as low stock on the dashboard
+    LOW_STOCK_THRESHOLD = int(os.environ.get('LOW_STOCK_THRESHOLD', 5))
+    # Cart lines untouched for this many days are deleted by `flask carts sweep`,
+    # in transactions of CART_SWEEP_BATCH_SIZE rows with a pause in between
+    CART_TTL_DAYS = float(os.environ.get('CART_TTL_DAYS', 30))
+    CART_SWEEP_BATCH_SIZE = int(os.environ.get('CART_SWEEP_BATCH_SIZE', 500))
+    CART_SWEEP_PAUSE = float(os.environ.get('CART_SWEEP_PAUSE', 0.05))
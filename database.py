@@ -0,0 +1,96 @@
+import random
+from functools import wraps
+from flask import g, has_request_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+REPLICA_PREFIX = 'replica_'
+
+
+class RoutingSession(Session):
+    # Sends reads to a replica bind while the current request is marked
+    # read-only (see read_only below); flushes, and everything outside such
+    # requests, go to the primary.
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and has_request_context() and g.get('db_read_only'):
+            replica = self._replica()
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _replica(self):
+        # Stick to one replica for the whole request
+        if 'db_replica' not in g:
+            engines = self._db.engines
+            keys = [key for key in engines if key and key.startswith(REPLICA_PREFIX)]
+            g.db_replica = engines[random.choice(keys)] if keys else None
+        return g.db_replica
+
+
+def read_only(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        g.db_read_only = True
+        return f(*args, **kwargs)
+    return decorated_function
+
+
+def _is_memory_sqlite(uri):
+    url = make_url(uri)
+    return url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:')
+
+
+def engine_options(config, uri):
+    options = {
+        'pool_pre_ping': config['DB_POOL_PRE_PING'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+    }
+    if not _is_memory_sqlite(uri):
+        options.update(
+            pool_size=config['DB_POOL_SIZE'],
+            max_overflow=config['DB_MAX_OVERFLOW'],
+            pool_timeout=config['DB_POOL_TIMEOUT'],
+        )
+    return options
+
+
+def _sqlite_pragmas(config):
+    return [
+        ('journal_mode', config['SQLITE_JOURNAL_MODE']),
+        ('synchronous', config['SQLITE_SYNCHRONOUS']),
+        ('busy_timeout', config['SQLITE_BUSY_TIMEOUT']),
+        ('cache_size', config['SQLITE_CACHE_SIZE']),
+        ('mmap_size', config['SQLITE_MMAP_SIZE']),
+    ]
+
+
+def _apply_pragmas(engine, pragmas):
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas:
+                cursor.execute(f'PRAGMA {name}={value}')
+        finally:
+            cursor.close()
+
+
+def init_database(app, db):
+    config = app.config
+    uri = config['SQLALCHEMY_DATABASE_URI']
+    replicas = [url.strip() for url in config.get('DATABASE_REPLICA_URLS', '').split(',') if url.strip()]
+    binds = config.setdefault('SQLALCHEMY_BINDS', {})
+    for i, url in enumerate(replicas):
+        binds.setdefault(f'{REPLICA_PREFIX}{i}', url)
+    config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(config, uri))
+
+    db.init_app(app)
+
+    # Engines are created by init_app but connect lazily, so no I/O happens here
+    pragmas = _sqlite_pragmas(config)
+    with app.app_context():
+        for engine in db.engines.values():
+            if engine.dialect.name == 'sqlite':
+                _apply_pragmas(engine, pragmas)
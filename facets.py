@@ -0,0 +1,187 @@
+from collections import Counter
+from flask import abort, request
+from sqlalchemy import and_, case, delete, event, func, insert, inspect, select, update
+from sqlalchemy.orm import Session
+from models import db, FacetCount, Product
+from search import search_products
+
+# Facet counts for the category, price and in-stock filters. facet_count
+# holds one row per (category, price bucket, in stock) cell; every product
+# write adjusts the cells it moves a product between, so facets for any
+# category/price/in-stock selection are a sum over a few dozen rows instead
+# of a GROUP BY over the catalog. Searches narrow the set in ways the cells
+# cannot express and fall back to grouping over the matching products.
+
+# (low, high) price ranges; high is exclusive and None means unbounded
+PRICE_BUCKETS = [(0, 25), (25, 50), (50, 100), (100, 250), (250, 500), (500, 1000), (1000, None)]
+
+
+def _label(low, high):
+    return f'{low}+' if high is None else f'{low}-{high}'
+
+
+BUCKETS = {_label(low, high): (low, high) for low, high in PRICE_BUCKETS}
+
+facet_table = FacetCount.__table__
+products_table = Product.__table__
+
+
+def price_bucket(price):
+    if price is None:
+        return None
+    for label, (low, high) in BUCKETS.items():
+        if high is None or price < high:
+            return label
+    return None
+
+
+def price_bucket_expr(column=products_table.c.price):
+    return case(*[(column < high, label) for label, (_, high) in BUCKETS.items() if high is not None],
+                else_=_label(*PRICE_BUCKETS[-1]))
+
+
+def price_filter(label, column=Product.price):
+    low, high = BUCKETS[label]
+    if high is None:
+        return column >= low
+    return and_(column >= low, column < high)
+
+
+def request_filters():
+    # ?category=Home&price=50-100&in_stock=1, shared by the listings and the API
+    price = request.args.get('price', '')
+    if price and price not in BUCKETS:
+        abort(400, description=f'Unknown price range: {price}')
+    return {
+        'category': request.args.get('category', ''),
+        'price': price,
+        'in_stock': request.args.get('in_stock', '') in ('1', 'true'),
+    }
+
+
+def filter_products(query, category='', price='', in_stock=False):
+    if category:
+        query = query.filter(Product.category == category)
+    if price:
+        query = query.filter(price_filter(price))
+    if in_stock:
+        query = query.filter(Product.stock > 0)
+    return query
+
+
+def adjust_facet_counts(connection, deltas):
+    # deltas: Counter of (category, price bucket, in stock) -> change in product count
+    for (category, bucket, in_stock), delta in deltas.items():
+        if not delta:
+            continue
+        updated = connection.execute(
+            update(facet_table)
+            .where(facet_table.c.category == category, facet_table.c.price_bucket == bucket,
+                   facet_table.c.in_stock == in_stock)
+            .values(count=facet_table.c.count + delta)
+        ).rowcount
+        if not updated:
+            connection.execute(insert(facet_table).values(
+                category=category, price_bucket=bucket, in_stock=in_stock, count=delta
+            ))
+
+
+def refresh_facet_counts(connection, categories=None):
+    # Recounts the cells of the given categories (all of them by default)
+    # from the product table
+    bucket = price_bucket_expr()
+    in_stock = products_table.c.stock > 0
+    counts = select(products_table.c.category, bucket, in_stock, func.count()).group_by(
+        products_table.c.category, bucket, in_stock
+    )
+    stale = delete(facet_table)
+    if categories is not None:
+        counts = counts.where(products_table.c.category.in_(categories))
+        stale = stale.where(facet_table.c.category.in_(categories))
+    connection.execute(stale)
+    connection.execute(insert(facet_table).from_select(
+        ['category', 'price_bucket', 'in_stock', 'count'], counts
+    ))
+
+
+def cell(category, price, stock):
+    return (category, price_bucket(price), stock > 0)
+
+
+def committed_value(state, key):
+    # Value of an attribute as last loaded from the database
+    history = state.attrs[key].history
+    if history.deleted:
+        return history.deleted[0]
+    if history.unchanged:
+        return history.unchanged[0]
+    return getattr(state.obj(), key)
+
+
+# The old category, price and stock of a modified product are needed to move
+# it out of its cell, so load them before they are overwritten
+@event.listens_for(Product.category, 'set', active_history=True)
+@event.listens_for(Product.price, 'set', active_history=True)
+@event.listens_for(Product.stock, 'set', active_history=True)
+def _keep_old_value(target, value, oldvalue, initiator):
+    pass
+
+
+def _committed_cell(state):
+    return cell(*(committed_value(state, key) for key in ('category', 'price', 'stock')))
+
+
+@event.listens_for(Session, 'before_flush')
+def _product_facets(session, flush_context, instances):
+    deltas = Counter()
+    for obj in session.new:
+        if isinstance(obj, Product):
+            deltas[cell(obj.category, obj.price, obj.stock or 0)] += 1
+    for obj in session.deleted:
+        if isinstance(obj, Product):
+            deltas[_committed_cell(inspect(obj))] -= 1
+    for obj in session.dirty:
+        if isinstance(obj, Product) and obj not in session.deleted:
+            state = inspect(obj)
+            if any(state.attrs[key].history.has_changes() for key in ('category', 'price', 'stock')):
+                deltas[_committed_cell(state)] -= 1
+                deltas[cell(obj.category, obj.price, obj.stock)] += 1
+    if any(deltas.values()):
+        adjust_facet_counts(session.connection(), deltas)
+
+
+def _combine(cells, category, price):
+    # Disjunctive facets: category counts honour the price selection and
+    # price counts honour the category selection, but not their own
+    categories, prices = Counter(), Counter()
+    for cell_category, bucket, count in cells:
+        if not price or bucket == price:
+            categories[cell_category] += count
+        if not category or cell_category == category:
+            prices[bucket] += count
+    return {
+        'category': [{'value': value, 'count': count}
+                     for value, count in sorted(categories.items()) if count > 0],
+        'price': [{'value': label, 'min': low, 'max': high, 'count': prices[label]}
+                  for label, (low, high) in BUCKETS.items()]
+    }
+
+
+def facet_counts(search='', category='', price='', in_stock=False):
+    if not search:
+        query = select(
+            facet_table.c.category, facet_table.c.price_bucket, facet_table.c.count
+        ).where(facet_table.c.count > 0)
+        if in_stock:
+            query = query.where(facet_table.c.in_stock.is_(True))
+        return _combine(db.session.execute(query).all(), category, price)
+
+    query = Product.query
+    if search:
+        query = search_products(query, search, ranked=False)
+    query = filter_products(query, in_stock=in_stock)
+    bucket = price_bucket_expr(Product.price)
+    cells = query.order_by(None).with_entities(
+        Product.category, bucket, func.count()
+    ).group_by(Product.category, bucket).all()
+    return _combine(cells, category, price)
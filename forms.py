@@ -1,6 +1,7 @@
 from flask_wtf import FlaskForm
+from flask_wtf.file import FileAllowed, FileField
 from wtforms import StringField, PasswordField, SubmitField, TextAreaField, FloatField, IntegerField, SelectField
-from wtforms.validators import DataRequired, Email, EqualTo, Length, ValidationError
+from wtforms.validators import DataRequired, Email, EqualTo, InputRequired, Length, NumberRange, ValidationError
 from models import User
 
 class LoginForm(FlaskForm):
@@ -25,8 +26,11 @@ class ProductForm(FlaskForm):
     name = StringField('Product Name', validators=[DataRequired(), Length(max=100)])
     description = TextAreaField('Description', validators=[DataRequired()])
     price = FloatField('Price', validators=[DataRequired()])
-    image_url = StringField('Image URL', validators=[DataRequired()])
-    stock = IntegerField('Stock Quantity', validators=[DataRequired()])
+    image_url = StringField('Image URL')
+    image = FileField('Upload Image', validators=[
+        FileAllowed(['jpg', 'jpeg', 'png', 'webp', 'gif'], 'Images only')
+    ])
+    stock = IntegerField('Stock Quantity', validators=[InputRequired(), NumberRange(min=0)])
     category = SelectField('Category', choices=[
         ('Electronics', 'Electronics'),
         ('Home', 'Home'),
@@ -35,3 +39,7 @@ class ProductForm(FlaskForm):
         ('Other', 'Other')
     ], validators=[DataRequired()])
     submit = SubmitField('Save Product')
+
+    def validate_image_url(self, image_url):
+        if not image_url.data and not self.image.data:
+            raise ValidationError('Enter an image URL or upload an image.')
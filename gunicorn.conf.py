@@ -0,0 +1,11 @@
+import os
+
+# Threaded workers. Password hashing sheds logins with a 503 once
+# PASSWORD_HASH_WORKERS + PASSWORD_HASH_QUEUE_LIMIT of them are in flight in
+# one process (see passwords.py). A sync worker only ever holds one request,
+# so that bound is never reached and a login burst would occupy every
+# worker; with more threads than the bound, the rest keep serving the
+# catalog. Keep DB_POOL_SIZE + DB_MAX_OVERFLOW at or above the thread count.
+# The worker count comes from WEB_CONCURRENCY or --workers as usual.
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 12))
@@ -0,0 +1,151 @@
+import threading
+import time
+from datetime import datetime
+from flask import current_app, session
+from flask_login import UserMixin
+from sqlalchemy import event, inspect, update
+from sqlalchemy.orm import Session
+from cache import TTLCache
+from models import db, AuthState, User
+
+# Per-worker cache of lightweight user snapshots so that authenticated
+# requests need no User query. Keys are (shared auth version, user_id,
+# auth_version), where the user's version is the one stamped into the session
+# at login: once it is bumped, sessions carrying the old stamp are rejected as
+# soon as their snapshot is reloaded. The shared version in auth_state moves
+# with every such bump and every user deletion, so other workers drop their
+# snapshots within AUTH_VERSION_CHECK_INTERVAL instead of the cache TTL.
+_user_cache = TTLCache(maxsize=10000, ttl=60, name='users')
+
+_auth = {'value': None, 'checked': 0.0}
+_auth_lock = threading.Lock()
+
+SESSION_KEY = '_auth_version'
+
+# Changing any of these makes existing sessions re-authenticate
+SECURITY_FIELDS = ('email', 'is_admin')
+
+
+class UserSnapshot(UserMixin):
+
+    def __init__(self, id, email, name, is_admin, auth_version):
+        self.id = id
+        self.email = email
+        self.name = name
+        self.is_admin = bool(is_admin)
+        self.auth_version = auth_version
+
+    @classmethod
+    def from_user(cls, user):
+        return cls(user.id, user.email, user.name, user.is_admin, user.auth_version or 0)
+
+    def __repr__(self):
+        return f'<UserSnapshot {self.email}>'
+
+
+def init_identity(app):
+    _user_cache.resize(ttl=app.config['USER_CACHE_TTL'])
+
+
+def ensure_auth_state():
+    if db.session.get(AuthState, 1) is None:
+        db.session.add(AuthState(id=1, version=0, updated_at=datetime.utcnow()))
+        db.session.commit()
+
+
+def auth_version():
+    # Polled at most once per AUTH_VERSION_CHECK_INTERVAL seconds, like the
+    # catalog version
+    interval = current_app.config['AUTH_VERSION_CHECK_INTERVAL']
+    now = time.monotonic()
+    if _auth['value'] is None or now - _auth['checked'] >= interval:
+        with _auth_lock:
+            if _auth['value'] is None or now - _auth['checked'] >= interval:
+                version = db.session.query(AuthState.version).filter_by(id=1).scalar()
+                _auth['value'] = version or 0
+                _auth['checked'] = now
+    return _auth['value']
+
+
+def _expire_local_auth_version():
+    _auth['checked'] = 0.0
+
+
+def load_user_snapshot(user_id):
+    try:
+        user_id = int(user_id)
+    except (TypeError, ValueError):
+        return None
+    stamp = session.get(SESSION_KEY, 0)
+    key = (auth_version(), user_id, stamp)
+    snapshot = _user_cache.get(key)
+    if snapshot is not None:
+        return snapshot
+
+    row = db.session.query(
+        User.id, User.email, User.name, User.is_admin, User.auth_version
+    ).filter(User.id == user_id).first()
+    if row is None or (row.auth_version or 0) != stamp:
+        return None
+    snapshot = UserSnapshot(*row)
+    _user_cache.set(key, snapshot)
+    return snapshot
+
+
+def remember_login(user):
+    # Call right after login_user()
+    session[SESSION_KEY] = user.auth_version or 0
+    _user_cache.set((auth_version(), user.id, session[SESSION_KEY]), UserSnapshot.from_user(user))
+
+
+def evict_user(user_id, version):
+    # Runs after commit, so it uses the last polled version rather than polling
+    _user_cache.delete((_auth['value'], user_id, version))
+
+
+def bump_auth_version(connection=None):
+    # Runs inside the caller's transaction so the bump commits with the write
+    connection = connection or db.session.connection()
+    connection.execute(update(AuthState).where(AuthState.id == 1).values(
+        version=AuthState.version + 1,
+        updated_at=datetime.utcnow()
+    ))
+
+
+@event.listens_for(Session, 'before_flush')
+def _user_flush(session, flush_context, instances):
+    for obj in session.dirty:
+        if not isinstance(obj, User) or not session.is_modified(obj):
+            continue
+        state = inspect(obj)
+        old_version = state.attrs.auth_version.history.deleted
+        old_version = old_version[0] if old_version else obj.auth_version
+        session.info.setdefault('evict_users', set()).add((obj.id, old_version or 0))
+        if any(state.attrs[field].history.has_changes() for field in SECURITY_FIELDS):
+            obj.auth_version = (obj.auth_version or 0) + 1
+            session.info['auth_changed'] = True
+    if any(isinstance(obj, User) for obj in session.deleted):
+        session.info['auth_changed'] = True
+
+
+@event.listens_for(Session, 'after_flush')
+def _user_after_flush(session, flush_context):
+    # Bump the shared version at most once per transaction
+    if session.info.pop('auth_changed', False) and not session.info.get('auth_bumped'):
+        bump_auth_version(session.connection())
+        session.info['auth_bumped'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _user_commit(session):
+    for user_id, version in session.info.pop('evict_users', ()):
+        evict_user(user_id, version)
+    if session.info.pop('auth_bumped', False):
+        _expire_local_auth_version()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _user_rollback(session):
+    session.info.pop('evict_users', None)
+    session.info.pop('auth_changed', None)
+    session.info.pop('auth_bumped', None)
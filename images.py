@@ -0,0 +1,257 @@
+import hashlib
+import os
+import threading
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from flask import current_app, send_from_directory
+from sqlalchemy import or_, select, update
+from catalog import mark_catalog_changed
+from models import db, Product
+
+# Locally stored product images. An upload, or a remote image_url fetched by
+# `flask images backfill`, is saved once as <key>.<ext>, where key is the
+# start of its SHA-256, and image_url points at it. A small pool then writes
+# <key>-<width>.webp and <key>-<width>.jpg for each IMAGE_VARIANT_WIDTHS
+# entry and only then sets Product.image_key, which switches the templates to
+# a <picture> with srcsets. File names are derived from content and never
+# change meaning, so /images/ responses are cached as immutable. Pillow is
+# imported on first use to keep it out of worker startup.
+
+URL_PREFIX = '/images/'
+CACHE_CONTROL = 'public, max-age=31536000, immutable'
+EXTENSIONS = {'JPEG': 'jpg', 'PNG': 'png', 'WEBP': 'webp', 'GIF': 'gif'}
+# Variant extension -> Pillow format and save options
+VARIANT_FORMATS = {
+    'webp': ('WEBP', {'method': 4}),
+    'jpg': ('JPEG', {'optimize': True, 'progressive': True}),
+}
+
+
+class ImageError(ValueError):
+    status_code = 400
+
+
+def _image_format(data):
+    from PIL import Image
+
+    try:
+        with Image.open(BytesIO(data)) as image:
+            image.verify()
+            fmt = image.format
+    except (OSError, SyntaxError, ValueError, Image.DecompressionBombError):
+        raise ImageError('Not a readable image')
+    if fmt not in EXTENSIONS:
+        raise ImageError(f'Unsupported image format: {fmt}')
+    return fmt
+
+
+def _save(path, write):
+    # Write to a temporary name first so readers never see a partial file
+    tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp, 'wb') as f:
+        write(f)
+    os.replace(tmp, path)
+
+
+def _resize(image, width):
+    from PIL import Image
+
+    if image.width <= width:
+        return image
+    return image.resize((width, max(1, round(image.height * width / image.width))), Image.LANCZOS)
+
+
+class ImageStore:
+
+    def __init__(self, folder, widths=(160, 480, 960), quality=80, workers=2):
+        self.folder = folder
+        self.widths = tuple(sorted(widths))
+        self.quality = quality
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='image-variants')
+
+    def path(self, filename):
+        return os.path.join(self.folder, filename)
+
+    def store(self, data):
+        # Validates and saves an original; returns (key, filename)
+        extension = EXTENSIONS[_image_format(data)]
+        key = hashlib.sha256(data).hexdigest()[:20]
+        filename = f'{key}.{extension}'
+        path = self.path(filename)
+        if not os.path.exists(path):
+            os.makedirs(self.folder, exist_ok=True)
+            _save(path, lambda f: f.write(data))
+        return key, filename
+
+    def variant(self, key, width, extension):
+        return f'{key}-{width}.{extension}'
+
+    def make_variants(self, key, filename):
+        from PIL import Image, ImageOps
+
+        missing = [(width, extension) for width in self.widths for extension in VARIANT_FORMATS
+                   if not os.path.exists(self.path(self.variant(key, width, extension)))]
+        if not missing:
+            return
+        with Image.open(self.path(filename)) as original:
+            image = ImageOps.exif_transpose(original)
+            image = image.convert('RGBA' if 'A' in image.getbands() or 'transparency' in image.info
+                                  else 'RGB')
+            # JPEG has no alpha channel, so flatten onto white
+            opaque = image
+            if image.mode == 'RGBA':
+                opaque = Image.new('RGB', image.size, 'white')
+                opaque.paste(image, mask=image.getchannel('A'))
+            for width, extension in missing:
+                fmt, options = VARIANT_FORMATS[extension]
+                resized = _resize(image if fmt == 'WEBP' else opaque, width)
+                _save(self.path(self.variant(key, width, extension)),
+                      lambda f: resized.save(f, fmt, quality=self.quality, **options))
+
+    def submit(self, product_id, key, filename):
+        # Variants are made off the request; image_key is set once they exist
+        app = current_app._get_current_object()
+        return self._executor.submit(self._process, app, product_id, key, filename)
+
+    def _process(self, app, product_id, key, filename):
+        with app.app_context():
+            try:
+                self.make_variants(key, filename)
+                if set_image_key(product_id, key, filename):
+                    db.session.commit()
+            except Exception:
+                db.session.rollback()
+                app.logger.exception('Could not make image variants for product %s', product_id)
+
+    def srcset(self, key, extension):
+        return ', '.join(f'{URL_PREFIX}{self.variant(key, width, extension)} {width}w'
+                         for width in self.widths)
+
+    def src(self, key, extension):
+        # Middle width for browsers that ignore srcset
+        return URL_PREFIX + self.variant(key, self.widths[len(self.widths) // 2], extension)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+def get_image_store():
+    return current_app.extensions['images']
+
+
+def image_url(filename):
+    return URL_PREFIX + filename
+
+
+def set_image_key(product_id, key, filename):
+    # Only if the product still shows this image; a later upload or edit wins
+    updated = db.session.execute(
+        update(Product)
+        .where(Product.id == product_id, Product.image_url == image_url(filename))
+        .values(image_key=key)
+    ).rowcount
+    if updated:
+        mark_catalog_changed()
+    return updated
+
+
+def local_image_key(url, key):
+    # The product's image_key, if its variants belong to the current image_url
+    if key and url and url.startswith(f'{URL_PREFIX}{key}.'):
+        return key
+    return None
+
+
+def store_upload(file):
+    # Saves an uploaded werkzeug FileStorage; returns (key, filename) or None
+    if not file or not file.filename:
+        return None
+    return get_image_store().store(file.read())
+
+
+def fetch_image(url, timeout=10, max_bytes=10 * 1024 * 1024):
+    if not url.startswith(('http://', 'https://')):
+        raise ImageError(f'Not an http(s) URL: {url}')
+    request = urllib.request.Request(url, headers={'User-Agent': 'product-image-backfill'})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        data = response.read(max_bytes + 1)
+    if len(data) > max_bytes:
+        raise ImageError(f'Image larger than {max_bytes} bytes')
+    return data
+
+
+def _import_one(store, url, timeout, max_bytes):
+    if url.startswith(URL_PREFIX):
+        with open(store.path(os.path.basename(url)), 'rb') as f:
+            data = f.read()
+    else:
+        data = fetch_image(url, timeout, max_bytes)
+    key, filename = store.store(data)
+    store.make_variants(key, filename)
+    return key, filename
+
+
+def backfill_images(limit=None, concurrency=4, batch_size=100, echo=None):
+    # Imports every product image that has no local variants yet: remote URLs
+    # are downloaded, local originals only get their variants. Failures are
+    # reported through echo and skipped. Returns (imported, failed).
+    config = current_app.config
+    store = get_image_store()
+    query = select(Product.id, Product.image_url).where(
+        Product.image_url.isnot(None), Product.image_url != '',
+        or_(Product.image_key.is_(None), Product.image_url.notlike(URL_PREFIX + '%'))
+    ).order_by(Product.id).limit(limit)
+    rows = db.session.execute(query).all()
+
+    def work(row):
+        try:
+            return row, _import_one(store, row.image_url, config['IMAGE_FETCH_TIMEOUT'],
+                                    config['IMAGE_MAX_BYTES']), None
+        except (OSError, ValueError) as e:
+            return row, None, str(e) or e.__class__.__name__
+
+    echo = echo or (lambda message: None)
+    imported = failed = pending = 0
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='image-backfill') as pool:
+        for row, stored, error in pool.map(work, rows):
+            if error:
+                failed += 1
+                echo(f'Product {row.id}: {row.image_url}: {error}')
+                continue
+            key, filename = stored
+            # Skip products whose image was changed while downloading
+            pending += db.session.execute(
+                update(Product)
+                .where(Product.id == row.id, Product.image_url == row.image_url)
+                .values(image_url=image_url(filename), image_key=key)
+            ).rowcount
+            if pending >= batch_size:
+                mark_catalog_changed()
+                db.session.commit()
+                imported += pending
+                pending = 0
+                echo(f'Imported {imported} of {len(rows)} images')
+    if pending:
+        mark_catalog_changed()
+        db.session.commit()
+        imported += pending
+    return imported, failed
+
+
+def image_view(filename):
+    response = send_from_directory(get_image_store().folder, filename, max_age=31536000)
+    response.headers['Cache-Control'] = CACHE_CONTROL
+    return response
+
+
+def init_images(app):
+    config = app.config
+    folder = os.path.join(app.root_path, config['UPLOAD_FOLDER'])
+    store = ImageStore(folder, widths=config['IMAGE_VARIANT_WIDTHS'],
+                       quality=config['IMAGE_QUALITY'], workers=config['IMAGE_WORKERS'])
+    app.extensions['images'] = store
+    app.add_url_rule(URL_PREFIX + '<path:filename>', 'image', image_view)
+    app.add_template_global(local_image_key)
+    app.add_template_global(store.srcset, 'image_srcset')
+    app.add_template_global(store.src, 'image_src')
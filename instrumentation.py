@@ -0,0 +1,116 @@
+import time
+from collections import Counter
+from flask import (before_render_template, current_app, g, has_app_context, has_request_context,
+                   request, template_rendered)
+from sqlalchemy import event
+from models import db
+
+# Per-request profile of database and template work. Engine events time every
+# statement; a request's totals go out in a Server-Timing header (shown by
+# browser dev tools) and statements slower than SLOW_QUERY_MS are logged.
+# Statements use bound parameters, so per-row lazy loads repeat the exact same
+# SQL text: any text run N_PLUS_ONE_THRESHOLD or more times in one request is
+# logged as a suspected N+1. The bookkeeping is a timer and a Counter update
+# per statement, cheap enough to leave on.
+
+MAX_LOGGED_SQL = 500
+
+
+class RequestProfile:
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.render_time = 0.0
+        self.statements = Counter()
+        self._render_start = None
+
+    def record(self, statement, elapsed):
+        self.queries += 1
+        self.db_time += elapsed
+        self.statements[statement] += 1
+
+    def repeated(self, threshold):
+        return [(statement, count) for statement, count in self.statements.items()
+                if count >= threshold]
+
+    def server_timing(self):
+        total = (time.perf_counter() - self.start) * 1000
+        return (f'db;dur={self.db_time * 1000:.1f};desc="{self.queries} queries", '
+                f'render;dur={self.render_time * 1000:.1f}, app;dur={total:.1f}')
+
+
+def _shorten(statement):
+    statement = ' '.join(statement.split())
+    return statement if len(statement) <= MAX_LOGGED_SQL else statement[:MAX_LOGGED_SQL] + '...'
+
+
+def _where():
+    return (request.endpoint or request.path) if has_request_context() else 'no request'
+
+
+def _instrument_engine(engine, app):
+    slow = app.config['SLOW_QUERY_MS'] / 1000
+
+    # The start time lives on the statement's execution context, which is
+    # discarded with it; after_cursor_execute does not run for a statement
+    # that raises, so nothing may be left on the pooled connection
+    @event.listens_for(engine, 'before_cursor_execute')
+    def start_query(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context.query_start = time.perf_counter()
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def end_query(conn, cursor, statement, parameters, context, executemany):
+        start = getattr(context, 'query_start', None)
+        if start is None:
+            return
+        elapsed = time.perf_counter() - start
+        profile = g.get('profile') if has_app_context() else None
+        if profile is not None:
+            profile.record(statement, elapsed)
+        if elapsed >= slow:
+            app.logger.warning('Slow query (%.1f ms) in %s: %s',
+                               elapsed * 1000, _where(), _shorten(statement))
+
+
+def _start_profile():
+    g.profile = RequestProfile()
+
+
+def _finish_profile(response):
+    profile = g.pop('profile', None)
+    if profile is None:
+        return response
+    config = current_app.config
+    for statement, count in profile.repeated(config['N_PLUS_ONE_THRESHOLD']):
+        current_app.logger.warning('Possible N+1 in %s: %d x %s', _where(), count, _shorten(statement))
+    if config['SERVER_TIMING']:
+        response.headers.add('Server-Timing', profile.server_timing())
+    return response
+
+
+def _start_render(sender, template, context, **extra):
+    profile = g.get('profile')
+    if profile is not None:
+        profile._render_start = time.perf_counter()
+
+
+def _end_render(sender, template, context, **extra):
+    profile = g.get('profile')
+    if profile is not None and profile._render_start is not None:
+        profile.render_time += time.perf_counter() - profile._render_start
+        profile._render_start = None
+
+
+def init_instrumentation(app):
+    if not app.config['SQL_INSTRUMENTATION']:
+        return
+    with app.app_context():
+        for engine in db.engines.values():
+            _instrument_engine(engine, app)
+    app.before_request(_start_profile)
+    app.after_request(_finish_profile)
+    before_render_template.connect(_start_render, app)
+    template_rendered.connect(_end_render, app)
@@ -0,0 +1,253 @@
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from glob import glob
+from flask import Response, current_app, g, request
+from cache import CACHES
+from models import db
+
+# Request, cache and connection pool metrics in Prometheus text format at
+# /metrics. Each worker counts into plain dicts under a lock held for a few
+# updates per request. With METRICS_DIR set to a directory shared by all
+# gunicorn workers (emptied before the server starts), a background thread in
+# every worker writes its totals to <pid>.json there every
+# METRICS_FLUSH_INTERVAL seconds while it has new requests, and a scrape adds
+# up all the files whichever worker serves it.
+# Counters of workers that have exited are kept so totals never go down;
+# gauges only count live workers.
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+METRICS = {
+    'http_requests_total': ('counter', 'HTTP requests by endpoint, method and status code.'),
+    'http_request_duration_seconds': ('histogram', 'Time spent handling HTTP requests.'),
+    'http_request_queries_total': ('counter', 'SQL statements run while handling HTTP requests.'),
+    'cache_hits_total': ('counter', 'Lookups answered by a per-worker cache.'),
+    'cache_misses_total': ('counter', 'Lookups a per-worker cache could not answer.'),
+    'cache_evictions_total': ('counter', 'Entries evicted from per-worker caches.'),
+    'cache_hit_ratio': ('gauge', 'Hits over lookups since start, across workers.'),
+    'cache_entries': ('gauge', 'Entries held by per-worker caches.'),
+    'db_pool_checked_out': ('gauge', 'Database connections in use.'),
+    'db_pool_connections': ('gauge', 'Database connections open, in use or idle.'),
+    'db_pool_size': ('gauge', 'Configured database pool size.'),
+}
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels) + '}'
+
+
+def _value(value):
+    # Counts stay exact; %g would round large ones
+    return str(value) if isinstance(value, int) else repr(float(value))
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class MetricsRegistry:
+
+    def __init__(self, directory='', flush_interval=1.0, engines=()):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.engines = list(engines)
+        self._lock = threading.Lock()
+        self._requests = {}
+        self._durations = {}
+        self._queries = {}
+        self._dirty = False
+        self._flusher_pid = None
+
+    def observe(self, endpoint, method, status, seconds, queries=None):
+        bucket = bisect_left(BUCKETS, seconds)
+        key = (endpoint, method)
+        with self._lock:
+            status_key = (endpoint, method, status)
+            self._requests[status_key] = self._requests.get(status_key, 0) + 1
+            histogram = self._durations.get(key)
+            if histogram is None:
+                # Per-bucket counts, then +Inf, then the sum of durations
+                histogram = self._durations[key] = [0] * (len(BUCKETS) + 1) + [0.0]
+            histogram[bucket] += 1
+            histogram[-1] += seconds
+            if queries:
+                self._queries[key] = self._queries.get(key, 0) + queries
+            self._dirty = True
+        if self.directory and self._flusher_pid != os.getpid():
+            self._start_flusher()
+
+    def snapshot(self):
+        # This worker's metrics as (name, labels, value) rows; histograms carry
+        # their bucket counts and sum as the value
+        with self._lock:
+            requests = list(self._requests.items())
+            durations = [(key, list(histogram)) for key, histogram in self._durations.items()]
+            queries = list(self._queries.items())
+        counters = [
+            ('http_requests_total', [('endpoint', e), ('method', m), ('status', str(s))], n)
+            for (e, m, s), n in requests
+        ] + [
+            ('http_request_queries_total', [('endpoint', e), ('method', m)], n)
+            for (e, m), n in queries
+        ]
+        gauges = []
+        for name, cache in CACHES.items():
+            labels = [('cache', name)]
+            counters += [('cache_hits_total', labels, cache.hits),
+                         ('cache_misses_total', labels, cache.misses),
+                         ('cache_evictions_total', labels, cache.evictions)]
+            gauges.append(('cache_entries', labels, len(cache)))
+        for bind, engine in self.engines:
+            pool, labels = engine.pool, [('bind', bind or 'default')]
+            # Only queue pools report usage; SQLite memory databases use others.
+            # overflow() starts at -size and counts up as connections open.
+            if hasattr(pool, 'overflow'):
+                gauges += [('db_pool_checked_out', labels, pool.checkedout()),
+                           ('db_pool_connections', labels, pool.size() + pool.overflow()),
+                           ('db_pool_size', labels, pool.size())]
+        return {
+            'pid': os.getpid(),
+            'counters': counters,
+            'histograms': [('http_request_duration_seconds', [('endpoint', e), ('method', m)], h)
+                           for (e, m), h in durations],
+            'gauges': gauges,
+        }
+
+    def flush(self):
+        self._dirty = False
+        path = os.path.join(self.directory, f'{os.getpid()}.json')
+        # Scrapes flush too, so each thread writes its own temporary file
+        tmp = f'{path}.{threading.get_ident()}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp, path)
+
+    def _start_flusher(self):
+        # Started on first use in each process, so a gunicorn --preload
+        # master never owns the thread its forked workers would need
+        with self._lock:
+            if self._flusher_pid == os.getpid():
+                return
+            self._flusher_pid = os.getpid()
+        threading.Thread(target=self._flush_loop, name='metrics-flush', daemon=True).start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            if self._dirty:
+                try:
+                    self.flush()
+                except OSError:
+                    pass
+
+    def _snapshots(self):
+        if not self.directory:
+            return [self.snapshot()]
+        self.flush()
+        snapshots = []
+        for path in glob(os.path.join(self.directory, '*.json')):
+            try:
+                with open(path) as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if snapshot['pid'] != os.getpid() and not _pid_alive(snapshot['pid']):
+                snapshot['gauges'] = []
+            snapshots.append(snapshot)
+        return snapshots
+
+    def collect(self):
+        # {name: {labels: value}} summed over every worker
+        totals = {}
+        for snapshot in self._snapshots():
+            for kind in ('counters', 'gauges'):
+                for name, labels, value in snapshot[kind]:
+                    series = totals.setdefault(name, {})
+                    key = tuple(map(tuple, labels))
+                    series[key] = series.get(key, 0) + value
+            for name, labels, histogram in snapshot['histograms']:
+                series = totals.setdefault(name, {})
+                key = tuple(map(tuple, labels))
+                current = series.get(key)
+                series[key] = histogram if current is None else [a + b for a, b in zip(current, histogram)]
+
+        hits, misses = totals.get('cache_hits_total', {}), totals.get('cache_misses_total', {})
+        totals['cache_hit_ratio'] = {
+            key: hits[key] / (hits[key] + misses.get(key, 0))
+            for key in hits if hits[key] + misses.get(key, 0)
+        }
+        return totals
+
+    def render(self):
+        totals = self.collect()
+        lines = []
+        for name, (kind, description) in METRICS.items():
+            series = totals.get(name)
+            if not series:
+                continue
+            lines += [f'# HELP {name} {description}', f'# TYPE {name} {kind}']
+            for labels, value in sorted(series.items()):
+                if kind != 'histogram':
+                    lines.append(f'{name}{_labels(labels)} {_value(value)}')
+                    continue
+                cumulative = 0
+                for bound, count in zip(BUCKETS + ('+Inf',), value[:-1]):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{_labels(labels + (("le", bound),))} {cumulative}')
+                lines.append(f'{name}_sum{_labels(labels)} {_value(value[-1])}')
+                lines.append(f'{name}_count{_labels(labels)} {cumulative}')
+        return '\n'.join(lines) + '\n'
+
+
+def _start_timer():
+    g.metrics_start = time.perf_counter()
+
+
+def _record_request(response):
+    start = g.pop('metrics_start', None)
+    if start is None:
+        return response
+    registry = current_app.extensions['metrics']
+    # Runs before instrumentation's hook, which discards the profile
+    profile = g.get('profile')
+    registry.observe(request.endpoint or 'unmatched', request.method, response.status_code,
+                     time.perf_counter() - start, profile.queries if profile else None)
+    return response
+
+
+def metrics_view():
+    registry = current_app.extensions['metrics']
+    return Response(registry.render(), content_type=CONTENT_TYPE)
+
+
+def init_metrics(app):
+    if not app.config['METRICS_ENABLED']:
+        return
+    directory = app.config['METRICS_DIR']
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with app.app_context():
+        engines = list(db.engines.items())
+    app.extensions['metrics'] = MetricsRegistry(
+        directory, app.config['METRICS_FLUSH_INTERVAL'], engines
+    )
+    app.before_request(_start_timer)
+    app.after_request(_record_request)
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
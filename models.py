@@ -1,9 +1,10 @@
 from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
-from werkzeug.security import generate_password_hash, check_password_hash
+from passwords import hash_password, verify_password
 from flask_login import UserMixin
+from database import RoutingSession
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 class User(db.Model, UserMixin):
     id = db.Column(db.Integer, primary_key=True)
@@ -11,14 +12,19 @@ class User(db.Model, UserMixin):
     password = db.Column(db.String(200), nullable=False)
     name = db.Column(db.String(100), nullable=False)
     is_admin = db.Column(db.Boolean, default=False)
+    # Bumped when sessions issued earlier must re-authenticate
+    auth_version = db.Column(db.Integer, nullable=False, default=0)
+    # Changed by every cart write; keys the cached cart summary (see cart.py)
+    cart_version = db.Column(db.String(16), nullable=False, default='0')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     cart_items = db.relationship('CartItem', backref='user', lazy=True)
+    orders = db.relationship('Order', backref='user', lazy=True)
 
     def set_password(self, password):
-        self.password = generate_password_hash(password)
+        self.password = hash_password(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password, password)
+        return verify_password(self.password, password)
 
     def __repr__(self):
         return f'<User {self.email}>'
@@ -29,11 +35,24 @@ class Product(db.Model):
     description = db.Column(db.Text, nullable=False)
     price = db.Column(db.Float, nullable=False)
     image_url = db.Column(db.String(200), nullable=False)
+    # Content hash of a locally stored image whose resized variants exist
+    # (see images.py); only used while image_url still points at that image
+    image_key = db.Column(db.String(20))
     stock = db.Column(db.Integer, nullable=False)
     category = db.Column(db.String(50), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     cart_items = db.relationship('CartItem', backref='product', lazy=True)
 
+    # Category browsing with a price range, price sorting and in-stock filters
+    __table_args__ = (
+        db.Index('ix_product_category_price', 'category', 'price'),
+        db.Index('ix_product_price', 'price'),
+        db.Index('ix_product_stock', 'stock'),
+        # Incremental sync of per-worker indexes (see suggest.py)
+        db.Index('ix_product_updated_at', 'updated_at'),
+    )
+
     def __repr__(self):
         return f'<Product {self.name}>'
 
@@ -43,6 +62,100 @@ class CartItem(db.Model):
     product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
     quantity = db.Column(db.Integer, default=1)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Last time the line was added to or changed; drives cart expiry
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    # One row per product in a user's cart; also the conflict target of the
+    # add-to-cart upsert
+    __table_args__ = (
+        db.Index('ix_cart_item_user_product', 'user_id', 'product_id', unique=True),
+        db.Index('ix_cart_item_updated_at', 'updated_at'),
+    )
 
     def __repr__(self):
         return f'<CartItem {self.id}>'
+
+class Order(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    total = db.Column(db.Float, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='placed')
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    items = db.relationship('OrderItem', backref='order', lazy=True)
+
+    def __repr__(self):
+        return f'<Order {self.id}>'
+
+class OrderItem(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    order_id = db.Column(db.Integer, db.ForeignKey('order.id'), nullable=False, index=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id', ondelete='SET NULL'))
+    # Snapshot of the product at purchase time
+    product_name = db.Column(db.String(100), nullable=False)
+    unit_price = db.Column(db.Float, nullable=False)
+    quantity = db.Column(db.Integer, nullable=False)
+
+    def __repr__(self):
+        return f'<OrderItem {self.id}>'
+
+class CatalogState(db.Model):
+    # Single row whose version is bumped on every product change; workers
+    # compare it against their cached copy to invalidate catalog caches.
+    # stock_version moves on checkouts, which leave the version alone unless
+    # they sell a product out.
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    stock_version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<CatalogState {self.version}.{self.stock_version}>'
+
+class AuthState(db.Model):
+    # Single row bumped whenever a user's email or admin flag changes or a user
+    # is deleted; workers poll it to drop cached user snapshots
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<AuthState {self.version}>'
+
+class FacetCount(db.Model):
+    # Number of products per (category, price bucket, in stock) cell, kept up
+    # to date by the product write paths and checkout (see facets.py)
+    category = db.Column(db.String(50), primary_key=True)
+    price_bucket = db.Column(db.String(20), primary_key=True)
+    in_stock = db.Column(db.Boolean, primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<FacetCount {self.category} {self.price_bucket} {self.in_stock}: {self.count}>'
+
+class Statistic(db.Model):
+    # Running dashboard totals keyed by name (see stats.py)
+    key = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.Float, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<Statistic {self.key}={self.value}>'
+
+class DailyStatistic(db.Model):
+    day = db.Column(db.Date, primary_key=True)
+    key = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.Float, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<DailyStatistic {self.day} {self.key}={self.value}>'
+
+class StatisticDelta(db.Model):
+    # Pending change to a Statistic, or to a DailyStatistic when day is set.
+    # Write paths only append here (see stats.py).
+    id = db.Column(db.Integer, primary_key=True)
+    key = db.Column(db.String(50), nullable=False)
+    day = db.Column(db.Date)
+    value = db.Column(db.Float, nullable=False)
+
+    def __repr__(self):
+        return f'<StatisticDelta {self.key} {self.day}: {self.value:+g}>'
@@ -0,0 +1,116 @@
+from collections import Counter
+from datetime import datetime
+from sqlalchemy import bindparam, insert, select, update
+from cart import clear_cart, load_cart
+from catalog import mark_catalog_changed, mark_stock_changed
+from facets import adjust_facet_counts, cell
+from models import db, Order, OrderItem, Product
+from stats import add_statistics, low_stock_threshold
+
+
+class CheckoutError(Exception):
+    pass
+
+
+class EmptyCart(CheckoutError):
+    pass
+
+
+class OutOfStock(CheckoutError):
+
+    def __init__(self, products):
+        self.products = products
+        super().__init__('Not enough stock for: ' + ', '.join(p.name for p in products))
+
+
+_decrement_stock = update(Product.__table__).where(
+    Product.__table__.c.id == bindparam('product_id'),
+    Product.__table__.c.stock >= bindparam('quantity')
+).values(stock=Product.__table__.c.stock - bindparam('quantity'))
+
+
+def _decrement(lines):
+    # Conditional decrement: a line only matches while enough stock is left,
+    # so concurrent checkouts can never oversell and no row is read-locked
+    # ahead of the write. Returns the number of lines that were fulfilled.
+    params = [{'product_id': item.product_id, 'quantity': item.quantity} for item in lines]
+    conn = db.session.connection()
+    if conn.dialect.supports_sane_multi_rowcount:
+        return conn.execute(_decrement_stock, params).rowcount
+    return sum(conn.execute(_decrement_stock, p).rowcount for p in params)
+
+
+def place_order(user_id):
+    cart = load_cart(user_id)
+    if not cart.items:
+        raise EmptyCart('Your cart is empty')
+
+    # Lock rows in a stable order so concurrent checkouts cannot deadlock
+    lines = sorted(cart.items, key=lambda item: item.product_id)
+    try:
+        if _decrement(lines) == len(lines):
+            order = Order(user_id=user_id, total=cart.total, created_at=datetime.utcnow())
+            db.session.add(order)
+            db.session.flush()
+            db.session.execute(insert(OrderItem), [{
+                'order_id': order.id,
+                'product_id': item.product_id,
+                'product_name': item.product.name,
+                'unit_price': item.product.price,
+                'quantity': item.quantity
+            } for item in lines])
+            clear_cart(user_id)
+            taken = _taken_stock(lines)
+            _record_order(order, taken)
+            _adjust_facets(taken)
+            # Only a sell-out changes availability in listings, filters and
+            # suggestions; other checkouts just move the stock version so
+            # cached pages and listing ETags follow the new counts (see catalog.py)
+            if any(row.stock <= 0 for row, _ in taken):
+                mark_catalog_changed()
+            else:
+                mark_stock_changed()
+            db.session.commit()
+            return order
+    except Exception:
+        db.session.rollback()
+        raise
+    db.session.rollback()
+    raise OutOfStock(_short_lines(lines))
+
+
+def _taken_stock(lines):
+    # (product row, quantity taken) with stock as left by the decrement. Rows
+    # are re-read, since the loaded cart may predate other checkouts.
+    quantities = {item.product_id: item.quantity for item in lines}
+    rows = db.session.execute(
+        select(Product.id, Product.category, Product.price, Product.stock)
+        .where(Product.id.in_(quantities))
+    ).all()
+    return [(row, quantities[row.id]) for row in rows]
+
+
+def _record_order(order, taken):
+    # Dashboard figures: the order itself, plus inventory value and low-stock
+    # products from the stock this checkout just took
+    threshold = low_stock_threshold()
+    stats = Counter(orders=1, revenue=order.total)
+    for row, quantity in taken:
+        stats['inventory_value'] -= row.price * quantity
+        stats['low_stock'] += row.stock <= threshold < row.stock + quantity
+    add_statistics(db.session.connection(), stats, {'orders': 1, 'revenue': order.total})
+
+
+def _adjust_facets(taken):
+    # Only products this checkout sold out change cells
+    deltas = Counter()
+    for row, quantity in taken:
+        deltas[cell(row.category, row.price, row.stock + quantity)] -= 1
+        deltas[cell(row.category, row.price, row.stock)] += 1
+    adjust_facet_counts(db.session.connection(), deltas)
+
+
+def _short_lines(lines):
+    quantities = {item.product_id: item.quantity for item in lines}
+    products = Product.query.filter(Product.id.in_(quantities)).all()
+    return [p for p in products if p.stock < quantities[p.id]]
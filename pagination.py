@@ -0,0 +1,230 @@
+import base64
+import copy
+import binascii
+import json
+from datetime import datetime
+from flask import abort, current_app, request
+from flask_sqlalchemy.pagination import Pagination, QueryPagination
+from sqlalchemy import and_, or_
+from cache import TTLCache
+from models import Product
+
+# Sort orders usable for keyset pagination. The trailing id column makes every
+# key unique so that rows are never skipped or repeated between pages.
+SORTS = {
+    'newest': ((Product.created_at, 'desc'), (Product.id, 'desc')),
+    'oldest': ((Product.created_at, 'asc'), (Product.id, 'asc')),
+    'price_asc': ((Product.price, 'asc'), (Product.id, 'asc')),
+    'price_desc': ((Product.price, 'desc'), (Product.id, 'desc')),
+}
+DEFAULT_SORT = 'newest'
+COUNT_MODES = ('exact', 'estimate', 'none')
+
+_count_cache = TTLCache(maxsize=512, name='listing_counts')
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {'dt': value.isoformat()}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict) and 'dt' in value:
+        return datetime.fromisoformat(value['dt'])
+    return value
+
+
+def encode_cursor(sort, values, direction):
+    payload = {'s': sort, 'd': direction, 'v': [_encode_value(v) for v in values]}
+    raw = json.dumps(payload, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode()
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        sort, direction, values = payload['s'], payload['d'], payload['v']
+    except (ValueError, KeyError, TypeError, binascii.Error):
+        raise InvalidCursor('Malformed cursor')
+    if sort not in SORTS or direction not in ('next', 'prev') or len(values) != len(SORTS[sort]):
+        raise InvalidCursor('Malformed cursor')
+    return sort, direction, [_decode_value(v) for v in values]
+
+
+def _after(keys, values):
+    # Row-value comparison "(k1, k2) > (v1, v2)" expanded so that each column
+    # can have its own direction
+    clauses = []
+    for i, ((column, order), value) in enumerate(zip(keys, values)):
+        equal = [col == val for (col, _), val in zip(keys[:i], values[:i])]
+        step = column < value if order == 'desc' else column > value
+        clauses.append(and_(*equal, step))
+    return or_(*clauses)
+
+
+def _reverse(keys):
+    return tuple((column, 'asc' if order == 'desc' else 'desc') for column, order in keys)
+
+
+def _order_by(keys):
+    return [column.desc() if order == 'desc' else column.asc() for column, order in keys]
+
+
+def cached_count(query):
+    ttl = current_app.config['COUNT_CACHE_TTL']
+    compiled = query.order_by(None).statement.compile()
+    key = (str(compiled), repr(sorted(compiled.params.items())))
+    return _count_cache.get_or_set(key, lambda: query.order_by(None).count(), ttl=ttl)
+
+
+def count_query(query, mode):
+    if mode == 'exact':
+        return query.order_by(None).count()
+    if mode == 'estimate':
+        return cached_count(query)
+    return None
+
+
+class KeysetPage:
+
+    def __init__(self, items, per_page, sort, has_next, has_prev, total=None):
+        self.items = items
+        self.per_page = per_page
+        self.sort = sort
+        self.has_next = has_next
+        self.has_prev = has_prev
+        self.total = total
+        self.next_cursor = self.cursor_for(items[-1], 'next') if has_next and items else None
+        self.prev_cursor = self.cursor_for(items[0], 'prev') if has_prev and items else None
+
+    def cursor_for(self, item, direction):
+        values = [getattr(item, column.key) for column, _ in SORTS[self.sort]]
+        return encode_cursor(self.sort, values, direction)
+
+    def __iter__(self):
+        yield from self.items
+
+
+def paginate_keyset(query, per_page, sort=DEFAULT_SORT, cursor=None, count='none'):
+    direction, values = 'next', None
+    if cursor:
+        sort, direction, values = decode_cursor(cursor)
+    keys = SORTS[sort]
+    if direction == 'prev':
+        keys = _reverse(keys)
+
+    total = count_query(query, count)
+    page_query = query.order_by(None)
+    if values is not None:
+        page_query = page_query.filter(_after(keys, values))
+    items = page_query.order_by(*_order_by(keys)).limit(per_page + 1).all()
+    has_more = len(items) > per_page
+    items = items[:per_page]
+
+    if direction == 'prev':
+        items.reverse()
+        return KeysetPage(items, per_page, sort, has_next=True, has_prev=has_more, total=total)
+    return KeysetPage(items, per_page, sort, has_next=has_more, has_prev=values is not None, total=total)
+
+
+class OffsetPage(QueryPagination):
+    # Offset pagination that skips or approximates COUNT(*). Without a count,
+    # one extra row is fetched to know whether a next page exists.
+
+    def _query_items(self):
+        query = self._query_args['query']
+        items = query.limit(self.per_page + 1).offset(self._query_offset).all()
+        self._has_more = len(items) > self.per_page
+        return items[:self.per_page]
+
+    def _query_count(self):
+        return count_query(self._query_args['query'], self._query_args['count_mode'])
+
+    @property
+    def pages(self):
+        if self.total is None:
+            return self.page + 1 if self._has_more else self.page
+        return super().pages
+
+    @property
+    def has_next(self):
+        if self.total is None:
+            return self._has_more
+        return super().has_next
+
+
+def paginate_offset(query, page, per_page, count='exact'):
+    max_per_page = current_app.config['MAX_PER_PAGE']
+    if count == 'exact':
+        return query.paginate(page=page, per_page=per_page, max_per_page=max_per_page)
+    return OffsetPage(page=page, per_page=per_page, max_per_page=max_per_page,
+                      query=query, count_mode=count)
+
+
+def paginate_request(query, per_page, sort=None, count='exact'):
+    # Pagination options shared by the HTML listings and the JSON API:
+    #   ?cursor=<token> or ?pagination=cursor  switch to keyset pagination
+    #   ?sort=newest|oldest|price_asc|price_desc
+    #   ?count=exact|estimate|none             how the total is computed
+    sort = request.args.get('sort', sort)
+    count = request.args.get('count', count)
+    if sort is not None and sort not in SORTS:
+        abort(400, description=f'Unknown sort: {sort}')
+    if count not in COUNT_MODES:
+        abort(400, description=f'Unknown count mode: {count}')
+    per_page = max(1, min(per_page, current_app.config['MAX_PER_PAGE']))
+
+    cursor = request.args.get('cursor')
+    if cursor is not None or request.args.get('pagination') == 'cursor':
+        try:
+            return paginate_keyset(query, per_page, sort or DEFAULT_SORT, cursor or None,
+                                   count=count if 'count' in request.args else 'none')
+        except InvalidCursor as e:
+            abort(400, description=str(e))
+
+    if sort is not None:
+        query = query.order_by(None).order_by(*_order_by(SORTS[sort]))
+    return paginate_offset(query, request.args.get('page', 1, type=int), per_page, count=count)
+
+
+def is_keyset(page):
+    return isinstance(page, KeysetPage)
+
+
+class StaticPage(Pagination):
+    # A page whose items and total are already known, e.g. one served from cache
+
+    def _query_items(self):
+        return self._query_args['items']
+
+    def _query_count(self):
+        return self._query_args['total']
+
+    @property
+    def pages(self):
+        if self.total is None:
+            return self.page + 1 if self._query_args['has_more'] else self.page
+        return super().pages
+
+    @property
+    def has_next(self):
+        if self.total is None:
+            return self._query_args['has_more']
+        return super().has_next
+
+
+def freeze_page(page, convert):
+    # Detach a page from its query so it can be cached, converting each item
+    if is_keyset(page):
+        frozen = copy.copy(page)
+        frozen.items = [convert(item) for item in page.items]
+        return frozen
+    return StaticPage(page=page.page, per_page=page.per_page, max_per_page=None,
+                      error_out=False, items=[convert(item) for item in page.items],
+                      total=page.total, has_more=page.has_next)
@@ -0,0 +1,88 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from flask import current_app
+from werkzeug.exceptions import ServiceUnavailable
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+class HashingOverloaded(ServiceUnavailable):
+    description = 'Too many sign-in attempts are being processed. Please try again shortly.'
+
+
+class PasswordHasher:
+    # Runs password hashing on a small bounded pool. hashlib's scrypt and
+    # pbkdf2 release the GIL, so the pool caps how many cores hashing can take
+    # per worker; once workers + queue are full, new requests are shed with a
+    # 503 instead of queueing behind a credential-stuffing burst. The bound is
+    # per process, so it only protects other traffic when each process serves
+    # more concurrent requests than that: gunicorn.conf.py runs gthread
+    # workers with enough threads.
+
+    def __init__(self, method='scrypt', workers=2, queue_limit=8, timeout=10.0, retry_after=2):
+        self.method = method
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hash')
+        self._slots = threading.BoundedSemaphore(workers + queue_limit)
+        self._prefix = None
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise HashingOverloaded(retry_after=self.retry_after)
+        try:
+            future = self._executor.submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            future.cancel()
+            raise HashingOverloaded(retry_after=self.retry_after)
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, pwhash, password):
+        return self._run(check_password_hash, pwhash, password)
+
+    @property
+    def prefix(self):
+        # Full parameter string for the configured method, e.g.
+        # 'scrypt:32768:8:1' for 'scrypt'
+        if self._prefix is None:
+            self._prefix = generate_password_hash('', self.method).split('$', 1)[0]
+        return self._prefix
+
+    def needs_rehash(self, pwhash):
+        return pwhash.split('$', 1)[0] != self.prefix
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+def init_passwords(app):
+    app.extensions['password_hasher'] = PasswordHasher(
+        method=app.config['PASSWORD_HASH_METHOD'],
+        workers=app.config['PASSWORD_HASH_WORKERS'],
+        queue_limit=app.config['PASSWORD_HASH_QUEUE_LIMIT'],
+        timeout=app.config['PASSWORD_HASH_TIMEOUT']
+    )
+
+
+def get_hasher():
+    return current_app.extensions['password_hasher']
+
+
+def hash_password(password):
+    return get_hasher().hash(password)
+
+
+def verify_password(pwhash, password):
+    return get_hasher().verify(pwhash, password)
+
+
+def needs_rehash(pwhash):
+    return get_hasher().needs_rehash(pwhash)
@@ -1,28 +1,60 @@
 from flask import Blueprint, render_template, redirect, url_for, flash, request, abort, jsonify
 from flask_login import login_user, logout_user, current_user, login_required
-from models import db, User, Product, CartItem
+from models import db, User, Product
 from forms import LoginForm, RegistrationForm, ProductForm
-from werkzeug.security import generate_password_hash
+from search import search_products
+from pagination import freeze_page, paginate_request
+from catalog import (cached, get_product_data, listing_validators, product_serializer,
+                     product_validators, project_products, request_key)
+from conditional import conditional
+from facets import facet_counts, filter_products, request_filters
+from cart import load_cart
+from orders import CheckoutError, place_order
+from identity import remember_login
+from database import read_only
+from passwords import hash_password, needs_rehash
+from stats import dashboard_statistics
+from images import ImageError, get_image_store, image_url, store_upload
 from datetime import datetime
 import os
 from functools import wraps
 
 main = Blueprint('main', __name__)
 
+# Columns the product card templates render; the list view only shows the
+# start of each description
+CARD_FIELDS = ('id', 'name', 'price', 'image_url', 'image_key', 'category')
+LIST_FIELDS = CARD_FIELDS + ('description', 'stock')
+LIST_DESCRIPTION_LENGTH = 100
+
+def list_query(query):
+    return project_products(query, LIST_FIELDS, description_length=LIST_DESCRIPTION_LENGTH)
+
+def store_form_image(form):
+    # Saves the form's uploaded image, if any; returns (key, filename) or
+    # None, and reports an unreadable file as a form error
+    try:
+        return store_upload(form.image.data)
+    except ImageError as e:
+        form.image.errors.append(str(e))
+        raise
+
 def admin_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        if not current_user.is_admin:
+        if not getattr(current_user, 'is_admin', False):
             abort(403)
         return f(*args, **kwargs)
     return decorated_function
 
 @main.route('/')
+@read_only
+@conditional(listing_validators, private=True)
 def home():
     if current_user.is_authenticated:
-        page = request.args.get('page', 1, type=int)
-        per_page = 6
-        products = Product.query.paginate(page=page, per_page=per_page)
+        products = cached(request_key('main.home'), lambda: freeze_page(
+            paginate_request(project_products(Product.query, CARD_FIELDS), per_page=6),
+            product_serializer(CARD_FIELDS)))
         return render_template('home.html', products=products)
     else:
         return redirect(url_for('main.login'))
@@ -36,7 +68,12 @@ def login():
     if form.validate_on_submit():
         user = User.query.filter_by(email=form.email.data).first()
         if user and user.check_password(form.password.data):
+            # Upgrade hashes made with older PASSWORD_HASH_METHOD settings
+            if needs_rehash(user.password):
+                user.set_password(form.password.data)
+                db.session.commit()
             login_user(user)
+            remember_login(user)
             next_page = request.args.get('next')
             return redirect(next_page or url_for('main.home'))
         flash('Invalid email or password', 'danger')
@@ -51,7 +88,7 @@ def register():
     if form.validate_on_submit():
         user = User(
             email=form.email.data,
-            password=generate_password_hash(form.password.data),
+            password=hash_password(form.password.data),
             name=form.name.data,
             created_at=datetime.utcnow()
         )
@@ -68,41 +105,47 @@ def logout():
     return redirect(url_for('main.login'))
 
 @main.route('/products')
+@read_only
 @login_required
+@conditional(listing_validators, private=True)
 def product_list():
     search = request.args.get('search', '')
-    category = request.args.get('category', '')
-    page = request.args.get('page', 1, type=int)
-    per_page = 6
+    filters = request_filters()
     
-    query = Product.query
-    if search:
-        query = query.filter(Product.name.ilike(f'%{search}%'))
-    if category:
-        query = query.filter_by(category=category)
+    def load_page():
+        query = Product.query
+        if search:
+            query = search_products(query, search)
+        query = filter_products(query, **filters)
+        page = freeze_page(paginate_request(list_query(query), per_page=6),
+                           product_serializer(LIST_FIELDS))
+        return page, facet_counts(search, **filters)
     
-    products = query.paginate(page=page, per_page=per_page)
+    products, facets = cached(request_key('main.product_list'), load_page)
     return render_template('products/list.html', 
                          products=products, 
+                         facets=facets,
                          search=search, 
-                         category=category)
+                         **filters)
 
 @main.route('/products/<int:product_id>')
+@read_only
 @login_required
+@conditional(product_validators, private=True)
 def product_detail(product_id):
-    product = Product.query.get_or_404(product_id)
+    product = get_product_data(product_id)
     return render_template('products/detail.html', product=product)
 
 @main.route('/admin/products')
 @login_required
 @admin_required
 def admin_products():
-    page = request.args.get('page', 1, type=int)
-    per_page = 10  # Different pagination for admin view
-    
-    products = Product.query.paginate(page=page, per_page=per_page)
+    # Different pagination for admin view
+    products = freeze_page(paginate_request(list_query(Product.query), per_page=10),
+                           product_serializer(LIST_FIELDS))
     return render_template('products/list.html', 
                          products=products,
+                         facets=facet_counts(),
                          admin=True)
 
 @main.route('/admin/products/add', methods=['GET', 'POST'])
@@ -111,17 +154,23 @@ def admin_products():
 def add_product():
     form = ProductForm()
     if form.validate_on_submit():
+        try:
+            image = store_form_image(form)
+        except ImageError:
+            return render_template('products/add.html', form=form)
         product = Product(
             name=form.name.data,
             description=form.description.data,
             price=form.price.data,
-            image_url=form.image_url.data,
+            image_url=image_url(image[1]) if image else form.image_url.data,
             stock=form.stock.data,
             category=form.category.data,
             created_at=datetime.utcnow()
         )
         db.session.add(product)
         db.session.commit()
+        if image:
+            get_image_store().submit(product.id, *image)
         flash('Product added successfully!', 'success')
         return redirect(url_for('main.admin_products'))
     return render_template('products/add.html', form=form)
@@ -133,13 +182,19 @@ def edit_product(product_id):
     product = Product.query.get_or_404(product_id)
     form = ProductForm(obj=product)
     if form.validate_on_submit():
+        try:
+            image = store_form_image(form)
+        except ImageError:
+            return render_template('products/edit.html', form=form, product=product)
         product.name = form.name.data
         product.description = form.description.data
         product.price = form.price.data
-        product.image_url = form.image_url.data
+        product.image_url = image_url(image[1]) if image else form.image_url.data
         product.stock = form.stock.data
         product.category = form.category.data
         db.session.commit()
+        if image:
+            get_image_store().submit(product.id, *image)
         flash('Product updated successfully!', 'success')
         return redirect(url_for('main.admin_products'))
     return render_template('products/edit.html', form=form, product=product)
@@ -157,35 +212,32 @@ def delete_product(product_id):
 @main.route('/cart')
 @login_required
 def view_cart():
-    cart_items = CartItem.query.filter_by(user_id=current_user.id).all()
-    total = sum(item.product.price * item.quantity for item in cart_items)
+    cart = load_cart(current_user.id)
     return render_template('products/cart.html', 
-                         cart_items=cart_items, 
-                         total=total)
+                         cart_items=cart.items, 
+                         total=cart.total)
 
 @main.route('/checkout')
 @login_required
 def checkout():
-    cart_items = CartItem.query.filter_by(user_id=current_user.id).all()
-    if not cart_items:
+    cart = load_cart(current_user.id)
+    if not cart.items:
         flash('Your cart is empty', 'warning')
         return redirect(url_for('main.view_cart'))
     
-    total = sum(item.product.price * item.quantity for item in cart_items)
-    return render_template('products/checkout.html', total=total)
+    return render_template('products/checkout.html', 
+                         cart_items=cart.items, 
+                         total=cart.total)
 
 @main.route('/checkout/complete', methods=['POST'])
 @login_required
 def checkout_complete():
-    cart_items = CartItem.query.filter_by(user_id=current_user.id).all()
-    if not cart_items:
-        return redirect(url_for('main.view_cart'))
-    
     # In a real application, you would process payment here
-    # For this demo, we'll just clear the cart
-    for item in cart_items:
-        db.session.delete(item)
-    db.session.commit()
+    try:
+        place_order(current_user.id)
+    except CheckoutError as e:
+        flash(str(e), 'warning')
+        return redirect(url_for('main.view_cart'))
     
     flash('Order placed successfully! Thank you for your purchase.', 'success')
     return redirect(url_for('main.home'))
@@ -194,11 +246,11 @@ def checkout_complete():
 @login_required
 @admin_required
 def admin_dashboard():
-    products_count = Product.query.count()
-    users_count = User.query.count()
-    orders_count = CartItem.query.count()
+    stats = dashboard_statistics()
+    counters = stats['counters']
     
     return render_template('admin/dashboard.html',
-                         products_count=products_count,
-                         users_count=users_count,
-                         orders_count=orders_count)
\ No newline at end of file
+                         products_count=int(counters['products']),
+                         users_count=int(counters['users']),
+                         orders_count=int(counters['orders']),
+                         stats=stats)
\ No newline at end of file
@@ -0,0 +1,77 @@
+from sqlalchemy import inspect, text
+from models import db, CartItem, FacetCount, Product
+
+# In-place upgrades for databases created before a schema change. db.create_all()
+# only creates missing tables, so columns and indexes added to existing tables
+# are applied here. Every step is idempotent.
+
+
+def _index_names(inspector, table_name):
+    return {index['name'] for index in inspector.get_indexes(table_name)}
+
+
+def _merge_duplicate_cart_items(conn):
+    conn.execute(text(
+        "UPDATE cart_item SET quantity = ("
+        "SELECT SUM(c2.quantity) FROM cart_item c2 "
+        "WHERE c2.user_id = cart_item.user_id AND c2.product_id = cart_item.product_id) "
+        "WHERE id IN (SELECT MIN(id) FROM cart_item GROUP BY user_id, product_id HAVING COUNT(*) > 1)"
+    ))
+    conn.execute(text(
+        "DELETE FROM cart_item WHERE id NOT IN ("
+        "SELECT MIN(id) FROM cart_item GROUP BY user_id, product_id)"
+    ))
+
+
+def _column_names(inspector, table_name):
+    return {column['name'] for column in inspector.get_columns(table_name)}
+
+
+def upgrade_schema():
+    with db.engine.begin() as conn:
+        inspector = inspect(conn)
+        if 'updated_at' not in _column_names(inspector, 'product'):
+            conn.execute(text("ALTER TABLE product ADD COLUMN updated_at TIMESTAMP"))
+            conn.execute(text("UPDATE product SET updated_at = COALESCE(created_at, CURRENT_TIMESTAMP)"))
+        if 'image_key' not in _column_names(inspector, 'product'):
+            conn.execute(text("ALTER TABLE product ADD COLUMN image_key VARCHAR(20)"))
+        if 'auth_version' not in _column_names(inspector, 'user'):
+            conn.execute(text('ALTER TABLE "user" ADD COLUMN auth_version INTEGER NOT NULL DEFAULT 0'))
+        if 'cart_version' not in _column_names(inspector, 'user'):
+            conn.execute(text('ALTER TABLE "user" ADD COLUMN cart_version VARCHAR(16) NOT NULL DEFAULT \'0\''))
+        if 'ix_cart_item_user_product' not in _index_names(inspector, 'cart_item'):
+            _merge_duplicate_cart_items(conn)
+        if 'updated_at' not in _column_names(inspector, 'cart_item'):
+            conn.execute(text("ALTER TABLE cart_item ADD COLUMN updated_at TIMESTAMP"))
+            conn.execute(text("UPDATE cart_item SET updated_at = COALESCE(created_at, CURRENT_TIMESTAMP)"))
+        if 'stock_version' not in _column_names(inspector, 'catalog_state'):
+            conn.execute(text("ALTER TABLE catalog_state ADD COLUMN stock_version INTEGER NOT NULL DEFAULT 0"))
+        if 'in_stock' not in _column_names(inspector, 'facet_count'):
+            # Derived data: recreated with the new key and recounted by init_db
+            FacetCount.__table__.drop(conn)
+            FacetCount.__table__.create(conn)
+        for table in (CartItem.__table__, Product.__table__):
+            existing = _index_names(inspector, table.name)
+            for index in table.indexes:
+                if index.name not in existing:
+                    index.create(conn)
+
+
+def init_db():
+    # Creates missing tables and applies the upgrades above; safe to run on
+    # every deploy
+    from catalog import ensure_catalog_state
+    from identity import ensure_auth_state
+    from facets import refresh_facet_counts
+    from search import setup_search_index
+    from stats import reconcile_statistics
+
+    db.create_all()
+    upgrade_schema()
+    ensure_catalog_state()
+    ensure_auth_state()
+    setup_search_index()
+    # Recount facets and statistics from scratch, which also repairs any drift
+    with db.engine.begin() as conn:
+        refresh_facet_counts(conn)
+    reconcile_statistics()
@@ -0,0 +1,160 @@
+import re
+import sqlite3
+from functools import lru_cache
+from flask import current_app
+from sqlalchemy import case, column, or_, select, table, text
+from models import db, Product
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(term):
+    return TOKEN_RE.findall(term or '')
+
+
+class SearchBackend:
+    name = None
+
+    def setup(self, engine):
+        pass
+
+    def apply(self, query, term, ranked=True):
+        raise NotImplementedError
+
+
+class LikeSearchBackend(SearchBackend):
+    # Portable fallback: substring match on every searchable column
+    name = 'like'
+
+    def apply(self, query, term, ranked=True):
+        tokens = tokenize(term)
+        if not tokens:
+            return query
+        for token in tokens:
+            pattern = f'%{token}%'
+            query = query.filter(or_(
+                Product.name.ilike(pattern),
+                Product.description.ilike(pattern),
+                Product.category.ilike(pattern)
+            ))
+        if ranked:
+            first = tokens[0]
+            query = query.order_by(case(
+                (Product.name.ilike(f'{first}%'), 0),
+                (Product.name.ilike(f'%{first}%'), 1),
+                (Product.category.ilike(f'%{first}%'), 2),
+                else_=3
+            ), Product.id)
+        return query
+
+
+class SQLiteFTSSearchBackend(SearchBackend):
+    # External-content FTS5 index over product, kept in sync by triggers so that
+    # every write path (ORM, API, bulk SQL) updates it without extra code.
+    name = 'fts5'
+    index_table = 'product_fts'
+    # bm25 weights for (name, description, category)
+    rank_weights = (10.0, 1.0, 5.0)
+
+    def setup(self, engine):
+        with engine.begin() as conn:
+            exists = conn.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                {'name': self.index_table}
+            ).first()
+            conn.execute(text(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.index_table} USING fts5("
+                "name, description, category, "
+                "content='product', content_rowid='id', tokenize='unicode61 remove_diacritics 2')"
+            ))
+            conn.execute(text(
+                f"CREATE TRIGGER IF NOT EXISTS {self.index_table}_ai AFTER INSERT ON product BEGIN "
+                f"INSERT INTO {self.index_table}(rowid, name, description, category) "
+                "VALUES (new.id, new.name, new.description, new.category); END"
+            ))
+            conn.execute(text(
+                f"CREATE TRIGGER IF NOT EXISTS {self.index_table}_ad AFTER DELETE ON product BEGIN "
+                f"INSERT INTO {self.index_table}({self.index_table}, rowid, name, description, category) "
+                "VALUES ('delete', old.id, old.name, old.description, old.category); END"
+            ))
+            conn.execute(text(
+                f"CREATE TRIGGER IF NOT EXISTS {self.index_table}_au "
+                "AFTER UPDATE OF name, description, category ON product BEGIN "
+                f"INSERT INTO {self.index_table}({self.index_table}, rowid, name, description, category) "
+                "VALUES ('delete', old.id, old.name, old.description, old.category); "
+                f"INSERT INTO {self.index_table}(rowid, name, description, category) "
+                "VALUES (new.id, new.name, new.description, new.category); END"
+            ))
+            weights = ', '.join(str(w) for w in self.rank_weights)
+            conn.execute(text(
+                f"INSERT INTO {self.index_table}({self.index_table}, rank) VALUES ('rank', :rank)"
+            ), {'rank': f'bm25({weights})'})
+            if not exists:
+                # Index rows that were written before the index existed
+                conn.execute(text(
+                    f"INSERT INTO {self.index_table}({self.index_table}) VALUES ('rebuild')"
+                ))
+
+    def match_expression(self, tokens):
+        # Every token must match; the last one also matches as a prefix
+        quoted = ['"' + token.replace('"', '""') + '"' for token in tokens]
+        quoted[-1] += '*'
+        return ' '.join(quoted)
+
+    def apply(self, query, term, ranked=True):
+        tokens = tokenize(term)
+        if not tokens:
+            return query
+        fts = table(self.index_table, column('rowid'), column('rank'))
+        matches = select(fts.c.rowid, fts.c.rank).where(
+            text(f'{self.index_table} MATCH :match').bindparams(match=self.match_expression(tokens))
+        ).subquery()
+        query = query.join(matches, Product.id == matches.c.rowid)
+        if ranked:
+            query = query.order_by(matches.c.rank, Product.id)
+        return query
+
+
+BACKENDS = {
+    LikeSearchBackend.name: LikeSearchBackend,
+    SQLiteFTSSearchBackend.name: SQLiteFTSSearchBackend,
+}
+
+
+def register_backend(backend_cls):
+    BACKENDS[backend_cls.name] = backend_cls
+    return backend_cls
+
+
+@lru_cache(maxsize=None)
+def fts5_available():
+    # Not every SQLite build has FTS5 compiled in; try it on a scratch database
+    try:
+        with sqlite3.connect(':memory:') as conn:
+            conn.execute('CREATE VIRTUAL TABLE probe USING fts5(body)')
+    except sqlite3.Error:
+        return False
+    return True
+
+
+def init_search(app):
+    name = app.config.get('SEARCH_BACKEND', 'auto')
+    if name == 'auto':
+        uri = app.config['SQLALCHEMY_DATABASE_URI']
+        fts5 = uri.startswith('sqlite') and fts5_available()
+        name = SQLiteFTSSearchBackend.name if fts5 else LikeSearchBackend.name
+    if name not in BACKENDS:
+        raise ValueError(f'Unknown search backend: {name}')
+    app.extensions['search'] = BACKENDS[name]()
+
+
+def setup_search_index():
+    get_backend().setup(db.engine)
+
+
+def get_backend():
+    return current_app.extensions['search']
+
+
+def search_products(query, term, ranked=True):
+    return get_backend().apply(query, term, ranked=ranked)
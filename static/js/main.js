@@ -5,22 +5,16 @@ document.addEventListener('DOMContentLoaded', function() {
             e.preventDefault();
             const productId = this.dataset.productId;
             
-            fetch('/api/cart', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json',
-                    'X-Requested-With': 'XMLHttpRequest'
-                },
-                body: JSON.stringify({
-                    product_id: productId,
-                    quantity: 1
-                })
-            })
-            .then(response => response.json())
-            .then(data => {
-                if (data.message) {
+            // Add the item and read back the badge count in one round trip
+            batch([
+                {op: 'cart.add', product_id: productId, quantity: 1},
+                {op: 'cart.summary'}
+            ])
+            .then(results => {
+                const [added, summary] = results;
+                if (added.status === 200) {
                     showAlert('Product added to cart!', 'success');
-                    updateCartCount();
+                    setCartCount(summary.count);
                 } else {
                     showAlert('Error adding product to cart', 'danger');
                 }
@@ -74,32 +68,82 @@ document.addEventListener('DOMContentLoaded', function() {
     if (searchForm) {
         searchForm.addEventListener('submit', function(e) {
             e.preventDefault();
-            const searchInput = this.querySelector('input[name="search"]');
-            const categorySelect = this.querySelector('select[name="category"]');
+            // Drop empty filters so they do not end up in the URL
+            const params = new URLSearchParams();
+            for (const [name, value] of new FormData(this)) {
+                if (value) {
+                    params.append(name, value);
+                }
+            }
             
-            let url = '/products?';
-            if (searchInput.value) {
-                url += `search=${encodeURIComponent(searchInput.value)}&`;
+            window.location.href = `/products?${params}`;
+        });
+    }
+    
+    // Typeahead: ask for suggestions on every keystroke, dropping replies
+    // to earlier keystrokes that are still in flight
+    const suggestInput = document.querySelector('input[list="product-suggestions"]');
+    if (suggestInput) {
+        const suggestions = document.getElementById('product-suggestions');
+        let pending = null;
+        
+        suggestInput.addEventListener('input', function() {
+            if (pending) {
+                pending.abort();
             }
-            if (categorySelect.value) {
-                url += `category=${encodeURIComponent(categorySelect.value)}`;
+            const query = this.value.trim();
+            if (!query) {
+                suggestions.replaceChildren();
+                return;
             }
             
-            window.location.href = url;
+            pending = new AbortController();
+            fetch(`/api/products/suggest?q=${encodeURIComponent(query)}`, {signal: pending.signal})
+                .then(response => response.json())
+                .then(data => {
+                    suggestions.replaceChildren(...data.suggestions.map(suggestion => {
+                        const option = document.createElement('option');
+                        option.value = suggestion.type === 'product' ? suggestion.name : suggestion.value;
+                        return option;
+                    }));
+                })
+                .catch(error => {
+                    if (error.name !== 'AbortError') {
+                        console.error('Error fetching suggestions:', error);
+                    }
+                });
         });
     }
     
+    function batch(operations) {
+        return fetch('/api/batch', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                'X-Requested-With': 'XMLHttpRequest'
+            },
+            body: JSON.stringify({operations: operations})
+        })
+        .then(response => response.json())
+        .then(data => data.results);
+    }
+    
+    function setCartCount(count) {
+        const cartBadge = document.querySelector('.cart-count');
+        if (cartBadge && count !== undefined) {
+            cartBadge.textContent = count;
+            cartBadge.style.display = count > 0 ? 'inline-block' : 'none';
+        }
+    }
+    
     function updateCartCount() {
-        fetch('/api/cart')
+        if (!document.querySelector('.cart-count')) {
+            return;
+        }
+        
+        fetch('/api/cart/summary')
             .then(response => response.json())
-            .then(data => {
-                const cartCount = data.cart_items.reduce((total, item) => total + item.quantity, 0);
-                const cartBadge = document.querySelector('.cart-count');
-                if (cartBadge) {
-                    cartBadge.textContent = cartCount;
-                    cartBadge.style.display = cartCount > 0 ? 'inline-block' : 'none';
-                }
-            })
+            .then(data => setCartCount(data.count))
             .catch(error => {
                 console.error('Error fetching cart:', error);
             });
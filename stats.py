@@ -0,0 +1,208 @@
+from collections import Counter
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import Integer, event, func, insert, inspect, literal, select, update
+from sqlalchemy.orm import Session
+from facets import committed_value
+from models import db, DailyStatistic, Order, Product, Statistic, StatisticDelta, User
+
+# Dashboard figures kept in the statistic and daily_statistic tables. Each
+# write path appends its deltas to statistic_delta in the same transaction as
+# the write, so concurrent checkouts never update the same rows.
+# fold_statistics moves the pending deltas into the totals. `flask stats fold
+# --every N` runs it in the background so the delta table stays small; the
+# dashboard also folds before reading a handful of rows, so it is never
+# behind, and its cost follows the writes since the last fold rather than the
+# size of the tables. Totals that can be derived from the tables are
+# recomputed by reconcile_statistics (`flask stats reconcile`), which repairs
+# any drift.
+
+# cart_items_swept counts rows deleted by the cart expiry sweeper
+COUNTERS = ('products', 'users', 'orders', 'revenue', 'inventory_value', 'low_stock',
+            'cart_items_swept')
+DAILY = ('users', 'orders', 'revenue', 'carts_created', 'cart_items_swept')
+
+statistic_table = Statistic.__table__
+daily_table = DailyStatistic.__table__
+delta_table = StatisticDelta.__table__
+products_table = Product.__table__
+
+
+def low_stock_threshold():
+    return current_app.config['LOW_STOCK_THRESHOLD']
+
+
+def product_deltas(old, new, threshold=None):
+    # old and new are (price, stock) pairs, None for a missing product
+    threshold = low_stock_threshold() if threshold is None else threshold
+    deltas = Counter()
+    for sign, values in ((-1, old), (1, new)):
+        if values is None:
+            continue
+        price, stock = values
+        deltas['products'] += sign
+        deltas['inventory_value'] += sign * price * stock
+        deltas['low_stock'] += sign * (stock <= threshold)
+    return deltas
+
+
+def _increment(connection, table, where, values, delta):
+    updated = connection.execute(
+        update(table).where(*[table.c[key] == value for key, value in where.items()])
+        .values(value=table.c.value + delta)
+    ).rowcount
+    if not updated:
+        connection.execute(insert(table).values(dict(where, value=delta, **values)))
+
+
+def add_statistics(connection, deltas, daily=None, day=None):
+    day = day or datetime.utcnow().date()
+    rows = [{'key': key, 'day': None, 'value': delta} for key, delta in deltas.items() if delta]
+    rows += [{'key': key, 'day': day, 'value': delta} for key, delta in (daily or {}).items() if delta]
+    if rows:
+        connection.execute(insert(delta_table), rows)
+
+
+def fold_statistics(connection):
+    # Moves every pending delta into the totals and returns how many delta
+    # rows it folded. Deleting with RETURNING hands each delta to exactly one
+    # of two concurrent folds.
+    pending = Counter()
+    folded = 0
+    for key, day, value in connection.execute(
+        delta_table.delete().returning(delta_table.c.key, delta_table.c.day, delta_table.c.value)
+    ):
+        pending[(key, day)] += value
+        folded += 1
+    now = datetime.utcnow()
+    for (key, day), delta in pending.items():
+        if not delta:
+            continue
+        if day is None:
+            _increment(connection, statistic_table, {'key': key}, {'updated_at': now}, delta)
+        else:
+            _increment(connection, daily_table, {'day': day, 'key': key}, {}, delta)
+    return folded
+
+
+@event.listens_for(Product.stock, 'set', active_history=True)
+def _keep_old_stock(target, value, oldvalue, initiator):
+    pass
+
+
+@event.listens_for(Session, 'before_flush')
+def _flush_statistics(session, flush_context, instances):
+    deltas, daily = Counter(), Counter()
+    for obj in session.new:
+        if isinstance(obj, Product):
+            deltas.update(product_deltas(None, (obj.price or 0, obj.stock or 0)))
+        elif isinstance(obj, User):
+            deltas['users'] += 1
+            daily['users'] += 1
+    for obj in session.deleted:
+        if isinstance(obj, Product):
+            state = inspect(obj)
+            old = (committed_value(state, 'price'), committed_value(state, 'stock'))
+            deltas.update(product_deltas(old, None))
+        elif isinstance(obj, User):
+            deltas['users'] -= 1
+    for obj in session.dirty:
+        if isinstance(obj, Product) and obj not in session.deleted:
+            state = inspect(obj)
+            if state.attrs.price.history.has_changes() or state.attrs.stock.history.has_changes():
+                old = (committed_value(state, 'price'), committed_value(state, 'stock'))
+                deltas.update(product_deltas(old, (obj.price, obj.stock)))
+    if any(deltas.values()) or any(daily.values()):
+        add_statistics(session.connection(), deltas, daily)
+
+
+def inventory_totals(connection, where=None):
+    # (products, inventory value, low-stock products), optionally for a subset
+    query = select(
+        func.count(),
+        func.coalesce(func.sum(products_table.c.price * products_table.c.stock), 0.0),
+        func.coalesce(func.sum((products_table.c.stock <= low_stock_threshold()).cast(Integer)), 0)
+    )
+    if where is not None:
+        query = query.where(where)
+    return connection.execute(query).one()
+
+
+def totals_delta(before, after):
+    return Counter({
+        'products': after[0] - before[0],
+        'inventory_value': after[1] - before[1],
+        'low_stock': after[2] - before[2],
+    })
+
+
+def reconcile_statistics():
+    # Recomputes every counter and the per-day user and order figures from
+    # the source tables. carts_created and cart_items_swept have no source to
+    # recount and are kept.
+    # Returns how far each counter had drifted.
+    conn = db.session.connection()
+    fold_statistics(conn)
+    products, inventory_value, low_stock = inventory_totals(conn)
+    orders, revenue = conn.execute(
+        select(func.count(), func.coalesce(func.sum(Order.total), 0.0))
+    ).one()
+    actual = {
+        'products': products,
+        'users': conn.execute(select(func.count()).select_from(User)).scalar(),
+        'orders': orders,
+        'revenue': revenue,
+        'inventory_value': inventory_value,
+        'low_stock': low_stock,
+    }
+    stored = dict(conn.execute(select(statistic_table.c.key, statistic_table.c.value)).all())
+    drift = {key: round(stored.get(key, 0) - value, 2) for key, value in actual.items()
+             if round(stored.get(key, 0) - value, 2)}
+
+    now = datetime.utcnow()
+    conn.execute(statistic_table.delete().where(statistic_table.c.key.in_(list(actual))))
+    conn.execute(insert(statistic_table), [
+        {'key': key, 'value': value, 'updated_at': now} for key, value in actual.items()
+    ])
+
+    conn.execute(daily_table.delete().where(daily_table.c.key.in_(['users', 'orders', 'revenue'])))
+    for model, rows in ((User, [('users', func.count())]),
+                        (Order, [('orders', func.count()), ('revenue', func.sum(Order.total))])):
+        day = func.date(model.created_at)
+        for key, aggregate in rows:
+            conn.execute(insert(daily_table).from_select(
+                ['day', 'key', 'value'],
+                select(day, literal(key), aggregate)
+                .where(model.created_at.isnot(None)).group_by(day)
+            ))
+    db.session.commit()
+    return drift
+
+
+def dashboard_statistics(days=14):
+    # After the fold, bounded reads only: the counters, the last `days` daily
+    # rows and the few lowest-stock products from the stock index
+    fold_statistics(db.session.connection())
+    db.session.commit()
+    counters = dict(db.session.execute(
+        select(statistic_table.c.key, statistic_table.c.value)
+    ).all())
+    since = datetime.utcnow().date() - timedelta(days=days - 1)
+    daily = {}
+    for day, key, value in db.session.execute(
+        select(daily_table.c.day, daily_table.c.key, daily_table.c.value)
+        .where(daily_table.c.day >= since)
+    ):
+        daily.setdefault(day, Counter())[key] = value
+    low_stock_products = db.session.execute(
+        select(Product.id, Product.name, Product.stock)
+        .where(Product.stock <= low_stock_threshold())
+        .order_by(Product.stock, Product.id).limit(5)
+    ).all()
+    return {
+        'counters': {key: counters.get(key, 0) for key in COUNTERS},
+        'daily': [(since + timedelta(days=i), daily.get(since + timedelta(days=i), Counter()))
+                  for i in range(days)],
+        'low_stock_products': low_stock_products,
+        'updated_at': db.session.execute(select(func.max(statistic_table.c.updated_at))).scalar()
+    }
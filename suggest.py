@@ -0,0 +1,181 @@
+import threading
+from bisect import bisect_left, insort
+from datetime import timedelta
+from flask import current_app
+from sqlalchemy import func, select
+from catalog import catalog_version
+from models import db, Product
+from search import tokenize
+
+# Typeahead suggestions from a per-worker prefix index: a sorted list of
+# (token, rank, product id) entries searched with bisect. It is built on first
+# use and then kept in sync with the catalog version. When the version moves,
+# only products whose updated_at is past the last sync are re-read. A few
+# changed products are bisected in and out; larger changes are merged with
+# one filter and one sort. Deletes are caught by comparing row counts, and a
+# mismatch rebuilds the index. Past max_entries, products are left out, and a
+# rebuild keeps in-stock and recently updated products first.
+
+FULL_NAME, WORD = 0, 1
+# Re-read a little before the watermark so rows written by a transaction that
+# committed after a later one are not missed
+SYNC_OVERLAP = timedelta(seconds=5)
+# Entries inspected per lookup before ranking
+SCAN_LIMIT = 200
+# Changed products a sync bisects in one by one; each insert moves the tail
+# of the list, so more than this are merged with a single sort instead
+INSORT_LIMIT = 100
+
+
+def _name_tokens(name, max_words):
+    name = name.casefold()
+    tokens = [(name, FULL_NAME)]
+    for word in tokenize(name)[:max_words]:
+        if word != name:
+            tokens.append((word, WORD))
+    return tokens
+
+
+class SuggestIndex:
+
+    def __init__(self, max_entries=1000000, max_words=6):
+        self.max_entries = max_entries
+        self.max_words = max_words
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._entries = []
+        self._products = {}
+        self._categories = {}
+        self._skipped = set()
+        self._version = None
+        self._watermark = None
+
+    def _add(self, product_id, name, category, pending=None):
+        # Inserts the product's entries in place, or appends them to pending
+        # for the caller to merge in
+        tokens = _name_tokens(name, self.max_words)
+        size = len(self._entries) + len(pending or ())
+        if size + len(tokens) > self.max_entries:
+            self._skipped.add(product_id)
+            return
+        self._skipped.discard(product_id)
+        self._products[product_id] = (name, category)
+        self._categories[category] = self._categories.get(category, 0) + 1
+        entries = [(token, rank, product_id) for token, rank in tokens]
+        if pending is not None:
+            pending.extend(entries)
+            return
+        for entry in entries:
+            insort(self._entries, entry)
+
+    def _remove(self, product_id, in_place=True):
+        # Without in_place the caller filters the product's entries out
+        name, category = self._products.pop(product_id)
+        if in_place:
+            for token, rank in _name_tokens(name, self.max_words):
+                entry = (token, rank, product_id)
+                i = bisect_left(self._entries, entry)
+                if i < len(self._entries) and self._entries[i] == entry:
+                    del self._entries[i]
+        self._categories[category] -= 1
+        if not self._categories[category]:
+            del self._categories[category]
+
+    def _rebuild(self, version):
+        self._reset()
+        rows = db.session.execute(
+            select(Product.id, Product.name, Product.category, Product.updated_at)
+            .order_by((Product.stock > 0).desc(), Product.updated_at.desc())
+        ).all()
+        entries = []
+        for row in rows:
+            tokens = _name_tokens(row.name, self.max_words)
+            if len(entries) + len(tokens) > self.max_entries:
+                self._skipped.add(row.id)
+                continue
+            self._products[row.id] = (row.name, row.category)
+            self._categories[row.category] = self._categories.get(row.category, 0) + 1
+            entries.extend((token, rank, row.id) for token, rank in tokens)
+        # One sort instead of an insort per entry
+        entries.sort()
+        self._entries = entries
+        self._watermark = max((row.updated_at for row in rows if row.updated_at), default=None)
+        self._version = version
+
+    def _sync(self, version):
+        if self._watermark is None:
+            return self._rebuild(version)
+        rows = db.session.execute(
+            select(Product.id, Product.name, Product.category, Product.updated_at)
+            .where(Product.updated_at >= self._watermark - SYNC_OVERLAP)
+        ).all()
+        changed = [row for row in rows if self._products.get(row.id) != (row.name, row.category)]
+        if len(changed) <= INSORT_LIMIT:
+            for row in changed:
+                if row.id in self._products:
+                    self._remove(row.id)
+                self._add(row.id, row.name, row.category)
+        else:
+            stale = {row.id for row in changed if row.id in self._products}
+            for product_id in stale:
+                self._remove(product_id, in_place=False)
+            if stale:
+                self._entries = [entry for entry in self._entries if entry[2] not in stale]
+            pending = []
+            for row in changed:
+                self._add(row.id, row.name, row.category, pending)
+            # Both runs are sorted, so this sort is a linear merge
+            pending.sort()
+            self._entries.extend(pending)
+            self._entries.sort()
+        self._watermark = max([self._watermark] + [row.updated_at for row in rows if row.updated_at])
+        total = db.session.execute(select(func.count()).select_from(Product)).scalar()
+        if total != len(self._products) + len(self._skipped):
+            return self._rebuild(version)
+        self._version = version
+
+    def suggest(self, prefix, limit=8):
+        prefix = ' '.join(prefix.casefold().split())
+        if not prefix:
+            return []
+        version = catalog_version()
+        with self._lock:
+            if version != self._version:
+                self._sync(version)
+            categories = [category for category in sorted(self._categories)
+                          if category.casefold().startswith(prefix)]
+            matches = {}
+            i = bisect_left(self._entries, (prefix,))
+            for token, rank, product_id in self._entries[i:i + SCAN_LIMIT]:
+                if not token.startswith(prefix):
+                    break
+                if rank < matches.get(product_id, WORD + 1):
+                    matches[product_id] = rank
+            products = [(rank, self._products[product_id][0], product_id)
+                        for product_id, rank in matches.items()]
+
+        # Names that start with the prefix first, then names with a word that does
+        suggestions = [{'type': 'category', 'value': category} for category in categories]
+        for _, name, product_id in sorted(products)[:max(0, limit - len(suggestions))]:
+            suggestions.append({'type': 'product', 'id': product_id, 'name': name})
+        return suggestions[:limit]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'products': len(self._products),
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'skipped': len(self._skipped),
+                'version': self._version
+            }
+
+
+def init_suggest(app):
+    app.extensions['suggest'] = SuggestIndex(max_entries=app.config['SUGGEST_MAX_ENTRIES'])
+
+
+def suggest_products(prefix, limit=8):
+    return current_app.extensions['suggest'].suggest(prefix, limit)
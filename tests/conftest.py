@@ -0,0 +1,88 @@
+import pytest
+from sqlalchemy import event, insert
+from app import create_app
+from cache import CACHES
+from catalog import _expire_local_version
+from config import Config
+from identity import _expire_local_auth_version
+from models import db, Product
+from schema import init_db
+from seed import ADMIN_EMAIL, seed_database
+
+PASSWORD = 'password'
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    # A fresh SQLite file per test; cheap hashing keeps logins fast
+    monkeypatch.setattr(Config, 'SQLALCHEMY_DATABASE_URI', f'sqlite:///{tmp_path / "test.db"}')
+    monkeypatch.setattr(Config, 'PASSWORD_HASH_METHOD', 'pbkdf2:sha256:1000')
+    monkeypatch.setattr(Config, 'UPLOAD_FOLDER', str(tmp_path / 'images'))
+    monkeypatch.setattr(Config, 'WTF_CSRF_ENABLED', False, raising=False)
+    # Per-worker caches and the catalog and auth versions outlive an app
+    for cache in CACHES.values():
+        cache.clear()
+    _expire_local_version()
+    _expire_local_auth_version()
+
+    app = create_app()
+    app.config['TESTING'] = True
+    with app.app_context():
+        init_db()
+        seed_database()
+    yield app
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose()
+    app.extensions['password_hasher'].shutdown()
+    app.extensions['images'].shutdown()
+
+
+def login(app, email=ADMIN_EMAIL, password=PASSWORD):
+    client = app.test_client()
+    response = client.post('/login', data={'email': email, 'password': password})
+    assert response.status_code == 302
+    return client
+
+
+@pytest.fixture
+def client(app):
+    return login(app)
+
+
+def add_products(app, count, stock=100, price=10.0):
+    with app.app_context():
+        ids = [db.session.execute(insert(Product).values(
+            name=f'Test Product {n}', description='Test', price=price, image_url='https://example.com/x.jpg',
+            stock=stock, category='Other'
+        )).inserted_primary_key[0] for n in range(count)]
+        db.session.commit()
+    return ids
+
+
+class QueryCounter:
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.statements = []
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._record)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_cursor_execute', self._record)
+
+    def __len__(self):
+        return len(self.statements)
+
+
+@pytest.fixture
+def count_queries(app):
+    # with count_queries() as queries: ...; len(queries)
+    with app.app_context():
+        engine = db.engine
+    return lambda: QueryCounter(engine)
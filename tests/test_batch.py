@@ -0,0 +1,50 @@
+from tests.conftest import add_products
+
+
+def run(client, *operations):
+    response = client.post('/api/batch', json={'operations': list(operations)})
+    assert response.status_code == 200
+    return response.get_json()['results']
+
+
+def test_batch_runs_operations_in_order(app, client, count_queries):
+    first, second = add_products(app, 2, stock=5, price=2.5)
+    with count_queries() as queries:
+        results = run(
+            client,
+            {'id': 'a', 'op': 'products', 'ids': [first, 999999]},
+            {'id': 'b', 'op': 'products', 'ids': [second, first]},
+            {'id': 'c', 'op': 'cart.add', 'product_id': first, 'quantity': 2},
+            {'id': 'd', 'op': 'cart.add', 'product_id': second, 'quantity': 6},
+            {'id': 'e', 'op': 'cart.summary'},
+        )
+    assert [(result['id'], result['op'], result['status']) for result in results] == [
+        ('a', 'products', 200), ('b', 'products', 200), ('c', 'cart.add', 200),
+        ('d', 'cart.add', 400), ('e', 'cart.summary', 200)]
+    assert [p['id'] for p in results[0]['products']] == [first] and results[0]['missing'] == [999999]
+    assert [p['id'] for p in results[1]['products']] == [second, first]
+    # The failed add left the earlier one in place
+    assert (results[4]['count'], results[4]['total']) == (2, 5.0)
+    # Product lookups across operations share one query
+    assert len([s for s in queries.statements if 'FROM product \nWHERE product.id IN' in s]) == 1
+
+
+def test_batch_checks_each_operation(app):
+    product_id = add_products(app, 1)[0]
+    results = run(
+        app.test_client(),
+        {'op': 'products', 'ids': [product_id]},
+        {'op': 'cart.add', 'product_id': product_id},
+        {'op': 'cart.add', 'product_id': 'x'},
+        {'op': 'drop_tables'},
+    )
+    assert [result['status'] for result in results] == [200, 401, 401, 400]
+
+
+def test_batch_rejects_bad_requests(app, client):
+    assert client.post('/api/batch', json={'operations': []}).status_code == 400
+    assert client.post('/api/batch', json={'operations': {'op': 'cart'}}).status_code == 400
+    limit = app.config['BATCH_MAX_OPERATIONS']
+    assert client.post('/api/batch', json={'operations': [{'op': 'cart'}] * (limit + 1)}).status_code == 400
+    results = run(client, {'op': 'cart.add', 'product_id': 'x'}, {'op': 'cart.update', 'cart_item_id': 1})
+    assert [result['status'] for result in results] == [400, 400]
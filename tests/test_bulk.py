@@ -0,0 +1,61 @@
+import csv
+import io
+import json
+import pytest
+from models import db, Product
+from stats import reconcile_statistics
+from tests.conftest import add_products
+
+
+def test_patches_to_one_product_apply_in_request_order(app, client):
+    product_id = add_products(app, 1, stock=20, price=19.999)[0]
+    with app.app_context():
+        reconcile_statistics()  # add_products bypasses the statistics hooks
+    response = client.patch('/api/products', json={'patches': [
+        {'id': product_id, 'stock': {'add': 5}},
+        {'id': product_id, 'stock': 10},
+        {'id': product_id, 'stock': {'add': 1}},
+    ]})
+    assert response.status_code == 200
+    assert [result['status'] for result in response.get_json()['results']] == ['updated'] * 3
+    with app.app_context():
+        assert db.session.get(Product, product_id).stock == 11
+        # The maintained statistics followed the same order
+        assert reconcile_statistics() == {}
+
+
+def exported_rows(response, fmt):
+    # Export rows without updated_at, which the import itself moves
+    body = response.get_data(as_text=True)
+    rows = csv.DictReader(io.StringIO(body)) if fmt == 'csv' else map(json.loads, body.splitlines())
+    return [{key: value for key, value in row.items() if key != 'updated_at'} for row in rows]
+
+
+@pytest.mark.parametrize('fmt, mimetype', [('ndjson', 'application/x-ndjson'), ('csv', 'text/csv')])
+def test_export_reimports_unchanged(app, client, fmt, mimetype):
+    sold_out = add_products(app, 1, stock=0)[0]
+    exported = client.get(f'/api/products/export?format={fmt}')
+    assert exported.status_code == 200
+
+    response = client.post('/api/products/import', data=exported.get_data(), content_type=mimetype)
+    assert response.status_code == 200
+    result = response.get_json()
+    with app.app_context():
+        assert result == {'inserted': 0, 'updated': Product.query.count(), 'error_count': 0, 'errors': []}
+        assert db.session.get(Product, sold_out).stock == 0
+
+    again = client.get(f'/api/products/export?format={fmt}')
+    assert exported_rows(again, fmt) == exported_rows(exported, fmt)
+
+
+@pytest.mark.parametrize('mimetype', ['text/plain', 'application/x-www-form-urlencoded', 'multipart/form-data'])
+def test_import_refuses_form_content_types(app, client, mimetype):
+    # What a cross-site <form> can send with the admin's cookie
+    with app.app_context():
+        before = Product.query.count()
+    body = json.dumps({'name': 'Injected', 'description': 'x', 'price': 1, 'image_url': 'https://example.com/x.jpg',
+                       'stock': 1, 'category': 'Other'})
+    for url in ('/api/products/import', '/api/products/import?format=ndjson'):
+        assert client.post(url, data=body, content_type=mimetype).status_code == 415
+    with app.app_context():
+        assert Product.query.count() == before
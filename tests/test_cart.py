@@ -0,0 +1,92 @@
+import threading
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import update
+from cart import sweep_expired_cart_items
+from models import db, CartItem, CatalogState
+from tests.conftest import add_products, login
+
+
+def fill_cart(client, product_ids):
+    for product_id in product_ids:
+        assert client.post('/api/cart', json={'product_id': product_id}).status_code == 201
+
+
+@pytest.mark.parametrize('url', ['/cart', '/checkout', '/api/cart'])
+def test_cart_queries_do_not_grow_with_cart_size(app, client, count_queries, url):
+    product_ids = add_products(app, 20)
+    counts = []
+    for lines in (product_ids[:1], product_ids[1:]):
+        fill_cart(client, lines)
+        client.get(url)  # warm per-worker caches
+        with count_queries() as queries:
+            assert client.get(url).status_code == 200
+        counts.append(len(queries))
+    assert counts[0] == counts[1]
+
+
+
+def test_concurrent_add_to_cart_never_oversells(app):
+    stock, threads, requests_per_thread = 30, 8, 10
+    product_id = add_products(app, 1, stock=stock)[0]
+    clients = [login(app) for _ in range(threads)]
+    statuses, lock = [], threading.Lock()
+
+    def hammer(client):
+        for _ in range(requests_per_thread):
+            status = client.post('/api/cart', json={'product_id': product_id, 'quantity': 1}).status_code
+            with lock:
+                statuses.append(status)
+
+    workers = [threading.Thread(target=hammer, args=(client,)) for client in clients]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    assert set(statuses) <= {201, 400}
+    items = clients[0].get('/api/cart').get_json()['cart_items']
+    quantity = sum(item['quantity'] for item in items if item['product_id'] == product_id)
+    assert quantity == statuses.count(201)
+    assert quantity <= stock
+
+
+def test_cart_summary_follows_writes_from_other_sessions(app):
+    first, second = login(app), login(app)
+    product_ids = add_products(app, 2, price=5.0)
+    fill_cart(first, product_ids)
+    assert second.get('/api/cart/summary').get_json() == {'count': 2, 'total': 10.0}
+
+    item_id = first.get('/api/cart').get_json()['cart_items'][0]['id']
+    assert first.delete('/api/cart', json={'cart_item_id': item_id}).status_code == 200
+    assert second.get('/api/cart/summary').get_json() == {'count': 1, 'total': 5.0}
+    assert first.post('/checkout/complete').status_code == 302
+    assert second.get('/api/cart/summary').get_json() == {'count': 0, 'total': 0.0}
+
+
+def test_sweep_invalidates_cart_summaries(app, client):
+    for product_id in add_products(app, 2):
+        client.post('/api/cart', json={'product_id': product_id})
+    assert client.get('/api/cart/summary').get_json()['count'] == 2
+
+    with app.app_context():
+        db.session.execute(update(CartItem).values(updated_at=datetime.utcnow() - timedelta(days=60)))
+        db.session.commit()
+        assert sweep_expired_cart_items(ttl_days=30, pause=0) == (2, 1)
+    assert client.get('/api/cart').get_json()['cart_items'] == []
+    assert client.get('/api/cart/summary').get_json() == {'count': 0, 'total': 0.0}
+
+
+def test_checkout_bumps_catalog_version_only_on_sell_out(app, client):
+    plenty, scarce = add_products(app, 1, stock=10) + add_products(app, 1, stock=1)
+
+    def checkout(product_id):
+        client.post('/api/cart', json={'product_id': product_id})
+        with app.app_context():
+            before = db.session.get(CatalogState, 1).version
+        assert client.post('/checkout/complete').status_code == 302
+        with app.app_context():
+            return db.session.get(CatalogState, 1).version - before
+
+    assert checkout(plenty) == 0
+    assert checkout(scarce) == 1
@@ -0,0 +1,55 @@
+import pytest
+from tests.conftest import add_products, login
+
+
+def stock_of(response, product_id):
+    return next(p['stock'] for p in response.get_json()['products'] if p['id'] == product_id)
+
+
+@pytest.mark.parametrize('url', ['/api/products?category=Other', '/products?category=Other'])
+def test_listing_etag_changes_with_stock(app, client, url):
+    product_id = add_products(app, 1, stock=50)[0]
+    # A separate reader, since checkout leaves a flash message on its session
+    reader = login(app)
+    first = reader.get(url)
+    assert first.status_code == 200
+    assert reader.get(url, headers={'If-None-Match': first.headers['ETag']}).status_code == 304
+
+    # A checkout that leaves stock behind still changes the payload
+    client.post('/api/cart', json={'product_id': product_id, 'quantity': 5})
+    assert client.post('/checkout/complete').status_code == 302
+
+    second = reader.get(url, headers={'If-None-Match': first.headers['ETag']})
+    assert second.status_code == 200
+    assert second.headers['ETag'] != first.headers['ETag']
+    assert second.get_data() != first.get_data()
+    if url.startswith('/api/'):
+        assert (stock_of(first, product_id), stock_of(second, product_id)) == (50, 45)
+    assert reader.get(url).headers['ETag'] == second.headers['ETag']
+
+
+@pytest.mark.parametrize('url', ['/api/products/{id}', '/products/{id}'])
+def test_product_etag_follows_edits(app, client, url):
+    product_id = add_products(app, 1)[0]
+    url = url.format(id=product_id)
+    first = client.get(url)
+    assert first.status_code == 200
+    assert client.get(url, headers={'If-None-Match': first.headers['ETag']}).status_code == 304
+    assert client.get(url, headers={'If-Modified-Since': first.headers['Last-Modified']}).status_code == 304
+
+    assert client.put(f'/api/products/{product_id}', json={'name': 'Renamed'}).status_code == 200
+    second = client.get(url, headers={'If-None-Match': first.headers['ETag']})
+    assert second.status_code == 200
+    assert second.headers['ETag'] != first.headers['ETag']
+    assert b'Renamed' in second.get_data()
+
+
+def test_not_modified_listing_skips_the_view(app, client, count_queries):
+    url = '/products?category=Other'
+    etag = client.get(url).headers['ETag']
+    with count_queries() as queries:
+        response = client.get(url, headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.get_data() == b''
+    assert not [s for s in queries.statements if 'FROM product' in s]
+
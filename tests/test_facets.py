@@ -0,0 +1,40 @@
+from sqlalchemy import select
+from facets import facet_counts, facet_table, refresh_facet_counts
+from models import db, Product
+from tests.conftest import add_products
+
+
+def maintained_cells():
+    # Non-empty cells as maintained by the write paths, then as recounted
+    query = select(facet_table).where(facet_table.c.count != 0)
+    maintained = set(db.session.execute(query).all())
+    with db.engine.begin() as conn:
+        refresh_facet_counts(conn)
+    return maintained, set(db.session.execute(query).all())
+
+
+def test_in_stock_facets_read_only_the_cells(app, count_queries):
+    with app.app_context(), count_queries() as queries:
+        facet_counts(category='Home', in_stock=True)
+    assert queries.statements and not any('FROM product' in s for s in queries.statements)
+
+
+def test_in_stock_cells_follow_checkout_edits_and_patches(app, client):
+    scarce, plenty = add_products(app, 2, stock=1, price=30.0)
+    with app.app_context():
+        refresh_facet_counts(db.session.connection())  # add_products bypasses the hooks
+        db.session.commit()
+        before = facet_counts(in_stock=True)
+
+    client.post('/api/cart', json={'product_id': scarce})
+    assert client.post('/checkout/complete').status_code == 302
+    client.patch('/api/products', json={'patches': [{'id': plenty, 'stock': 0}]})
+    with app.app_context():
+        after = facet_counts(in_stock=True)
+        total = lambda facets: sum(c['count'] for c in facets['category'])
+        assert total(after) == total(before) - 2
+        product = db.session.get(Product, scarce)
+        product.stock = 5
+        db.session.commit()
+        maintained, recounted = maintained_cells()
+        assert maintained == recounted
@@ -0,0 +1,45 @@
+from datetime import datetime
+import pytest
+import identity
+from models import db, User
+from passwords import hash_password
+from seed import ADMIN_EMAIL
+from tests.conftest import PASSWORD, login
+
+
+@pytest.fixture
+def other_worker(app, monkeypatch):
+    # Writes made through the returned context skip this worker's local
+    # eviction, as if another gunicorn worker had made them
+    app.config['AUTH_VERSION_CHECK_INTERVAL'] = 0
+    monkeypatch.setattr(identity, 'evict_user', lambda user_id, version: None)
+    monkeypatch.setattr(identity, '_expire_local_auth_version', lambda: None)
+    return app.app_context
+
+
+def test_demoted_admin_loses_access_on_other_workers(app, client, other_worker):
+    assert client.get('/admin').status_code == 200
+    with other_worker():
+        User.query.filter_by(email=ADMIN_EMAIL).one().is_admin = False
+        db.session.commit()
+    assert client.get('/admin').status_code != 200
+
+
+def test_deleted_user_is_logged_out_on_other_workers(app, other_worker):
+    with app.app_context():
+        db.session.add(User(email='shopper@example.com', password=hash_password(PASSWORD), name='Shopper',
+                            created_at=datetime.utcnow()))
+        db.session.commit()
+    client = login(app, 'shopper@example.com')
+    assert client.get('/api/cart').status_code == 200
+    with other_worker():
+        db.session.delete(User.query.filter_by(email='shopper@example.com').one())
+        db.session.commit()
+    assert client.get('/api/cart').status_code != 200
+
+
+def test_snapshot_serves_requests_without_user_queries(app, client, count_queries):
+    client.get('/api/cart')
+    with count_queries() as queries:
+        client.get('/api/cart')
+    assert not [statement for statement in queries.statements if 'auth_version' in statement]
@@ -0,0 +1,20 @@
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from models import db
+
+
+def snapshot(info):
+    return {key: list(value) if isinstance(value, list) else value for key, value in info.items()}
+
+
+def test_failed_statements_leave_nothing_on_the_connection(app):
+    with app.app_context():
+        conn = db.session.connection()
+        before = snapshot(conn.info)
+        for _ in range(3):
+            with pytest.raises(OperationalError):
+                conn.execute(text('SELECT * FROM no_such_table'))
+        conn.execute(text('SELECT 1'))
+        assert snapshot(conn.info) == before
+        db.session.rollback()
@@ -0,0 +1,57 @@
+import pytest
+from models import Product
+from tests.conftest import add_products
+
+
+def get_page(client, **params):
+    response = client.get('/api/products', query_string=dict(params, per_page=params.get('per_page', 7)))
+    assert response.status_code == 200
+    return response.get_json()
+
+
+@pytest.mark.parametrize('sort', ['newest', 'oldest', 'price_asc', 'price_desc'])
+def test_cursor_walk_visits_every_product_once(app, client, sort):
+    # Equal prices and creation times make the id tie-breaker do the work
+    add_products(app, 30)
+    with app.app_context():
+        total = Product.query.count()
+
+    pages = [get_page(client, pagination='cursor', sort=sort)]
+    while pages[-1]['next_cursor']:
+        pages.append(get_page(client, cursor=pages[-1]['next_cursor']))
+    ids = [product['id'] for page in pages for product in page['products']]
+    assert len(ids) == len(set(ids)) == total
+    # Matches the offset listing with the same sort
+    assert ids == [product['id'] for page in range(1, len(pages) + 1)
+                   for product in get_page(client, sort=sort, page=page)['products']]
+
+    # And walks back through the same pages
+    back = pages[-1]
+    for page in reversed(pages[:-1]):
+        back = get_page(client, cursor=back['prev_cursor'])
+        assert back['products'] == page['products']
+    assert back['prev_cursor'] is None
+
+
+def test_cursor_pages_seek_without_counting(app, client, count_queries):
+    add_products(app, 30)
+    cursor = get_page(client, pagination='cursor', sort='price_asc')['next_cursor']
+    with count_queries() as queries:
+        page = get_page(client, cursor=cursor)
+    assert page['total'] is None
+    assert not [s for s in queries.statements if 'count(' in s.lower()]
+    # The page seeks past the cursor's sort keys instead of offsetting
+    assert [s for s in queries.statements if 'product.price > ?' in s]
+
+
+def test_per_page_is_capped(app, client):
+    add_products(app, 30)
+    app.config['MAX_PER_PAGE'] = 10
+    assert len(get_page(client, per_page=1000)['products']) == 10
+    page = get_page(client, per_page=1000, pagination='cursor')
+    assert (len(page['products']), page['per_page']) == (10, 10)
+
+
+@pytest.mark.parametrize('params', [{'cursor': 'not-a-cursor'}, {'sort': 'random'}, {'count': 'maybe'}])
+def test_bad_pagination_options_are_rejected(app, client, params):
+    assert client.get('/api/products', query_string=params).status_code == 400
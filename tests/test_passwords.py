@@ -0,0 +1,63 @@
+import threading
+import pytest
+from models import User
+from passwords import HashingOverloaded, PasswordHasher
+from seed import ADMIN_EMAIL
+from tests.conftest import PASSWORD, login
+
+
+def use_hasher(app, hasher):
+    app.extensions['password_hasher'].shutdown()
+    app.extensions['password_hasher'] = hasher
+    return hasher
+
+
+def occupy(hasher):
+    # Holds one hashing slot until the returned event is set
+    release, started = threading.Event(), threading.Event()
+
+    def block():
+        started.set()
+        release.wait(5)
+
+    thread = threading.Thread(target=hasher._run, args=(block,))
+    thread.start()
+    assert started.wait(5)
+    return release, thread
+
+
+def test_full_hasher_sheds_load():
+    hasher = PasswordHasher(method='pbkdf2:sha256:1000', workers=1, queue_limit=0, retry_after=7)
+    try:
+        release, thread = occupy(hasher)
+        with pytest.raises(HashingOverloaded) as overloaded:
+            hasher.hash(PASSWORD)
+        assert overloaded.value.retry_after == 7
+        release.set()
+        thread.join()
+        assert hasher.verify(hasher.hash(PASSWORD), PASSWORD)
+    finally:
+        hasher.shutdown()
+
+
+def test_login_is_shed_with_retry_after(app):
+    hasher = use_hasher(app, PasswordHasher(method='pbkdf2:sha256:1000', workers=1, queue_limit=0))
+    release, thread = occupy(hasher)
+    try:
+        response = app.test_client().post('/login', data={'email': ADMIN_EMAIL, 'password': PASSWORD})
+        assert response.status_code == 503
+        assert response.headers['Retry-After'] == str(hasher.retry_after)
+    finally:
+        release.set()
+        thread.join()
+    login(app)
+
+
+def test_login_rehashes_with_the_configured_method(app):
+    with app.app_context():
+        assert User.query.filter_by(email=ADMIN_EMAIL).one().password.startswith('pbkdf2:sha256:1000$')
+    use_hasher(app, PasswordHasher(method='pbkdf2:sha256:2000'))
+    login(app)
+    with app.app_context():
+        assert User.query.filter_by(email=ADMIN_EMAIL).one().password.startswith('pbkdf2:sha256:2000$')
+    login(app)
@@ -0,0 +1,55 @@
+import pytest
+import search
+from models import db, Product
+from search import BACKENDS, init_search
+
+
+def add_product(app, name, description='Plain', category='Other'):
+    with app.app_context():
+        product = Product(name=name, description=description, price=10.0, stock=5, category=category,
+                          image_url='https://example.com/x.jpg')
+        db.session.add(product)
+        db.session.commit()
+        return product.id
+
+
+def search_ids(client, term):
+    response = client.get('/api/products', query_string={'search': term, 'per_page': 50})
+    assert response.status_code == 200
+    return [product['id'] for product in response.get_json()['products']]
+
+
+@pytest.fixture(params=sorted(BACKENDS))
+def backend(request, app):
+    app.extensions['search'] = BACKENDS[request.param]()
+    return request.param
+
+
+def test_name_matches_rank_first(app, client, backend):
+    in_description = add_product(app, 'Desk Lamp', description='Pairs well with a zorblax')
+    in_name = add_product(app, 'Zorblax Speaker')
+    assert search_ids(client, 'zorblax') == [in_name, in_description]
+    # The last token also matches as a prefix
+    assert search_ids(client, 'zorbl') == [in_name, in_description]
+
+
+def test_index_follows_product_writes(app, client, backend):
+    product_id = add_product(app, 'Quuxel Kettle')
+    assert search_ids(client, 'quuxel') == [product_id]
+    with app.app_context():
+        db.session.get(Product, product_id).name = 'Frobnic Kettle'
+        db.session.commit()
+    assert search_ids(client, 'quuxel') == []
+    assert search_ids(client, 'frobnic') == [product_id]
+    with app.app_context():
+        db.session.delete(db.session.get(Product, product_id))
+        db.session.commit()
+    assert search_ids(client, 'frobnic') == []
+
+
+@pytest.mark.parametrize('fts5, expected', [(True, 'fts5'), (False, 'like')])
+def test_auto_backend_falls_back_without_fts5(app, monkeypatch, fts5, expected):
+    app.config['SEARCH_BACKEND'] = 'auto'
+    monkeypatch.setattr(search, 'fts5_available', lambda: fts5)
+    init_search(app)
+    assert app.extensions['search'].name == expected
@@ -0,0 +1,44 @@
+from sqlalchemy import func, select
+from models import db, Statistic, StatisticDelta
+from stats import dashboard_statistics, reconcile_statistics
+from tests.conftest import add_products
+
+
+def test_checkout_appends_statistics_instead_of_updating_totals(app, client, count_queries):
+    product_id = add_products(app, 1, stock=10, price=20.0)[0]
+    with app.app_context():
+        reconcile_statistics()  # add_products bypasses the statistics hooks
+        before = dashboard_statistics()['counters']
+    client.post('/api/cart', json={'product_id': product_id, 'quantity': 2})
+
+    with count_queries() as queries:
+        assert client.post('/checkout/complete').status_code == 302
+    writes = [s for s in queries.statements if 'statistic' in s and not s.startswith('SELECT')]
+    assert writes and all(s.startswith('INSERT INTO statistic_delta') for s in writes)
+
+    with app.app_context():
+        after = dashboard_statistics()['counters']
+        assert db.session.scalar(select(func.count()).select_from(StatisticDelta)) == 0
+        assert after['orders'] == before['orders'] + 1
+        assert after['revenue'] == before['revenue'] + 40.0
+        assert after['inventory_value'] == before['inventory_value'] - 40.0
+        assert reconcile_statistics() == {}
+
+
+def test_fold_command_empties_the_delta_table(app, client):
+    product_id = add_products(app, 1, stock=10, price=20.0)[0]
+    with app.app_context():
+        reconcile_statistics()
+    client.post('/api/cart', json={'product_id': product_id})
+    assert client.post('/checkout/complete').status_code == 302
+    with app.app_context():
+        pending = db.session.scalar(select(func.count()).select_from(StatisticDelta))
+        assert pending
+
+    result = app.test_cli_runner().invoke(args=['stats', 'fold'])
+    assert result.exit_code == 0
+    assert result.output == f'Folded {pending} statistic deltas.\n'
+    with app.app_context():
+        assert db.session.scalar(select(func.count()).select_from(StatisticDelta)) == 0
+        assert db.session.scalar(select(Statistic.value).where(Statistic.key == 'orders')) == 1
+        assert reconcile_statistics() == {}
@@ -0,0 +1,42 @@
+import pytest
+from sqlalchemy import update
+from catalog import _expire_local_version, mark_catalog_changed
+from models import db, Product
+from suggest import INSORT_LIMIT, SuggestIndex
+from tests.conftest import add_products
+
+
+@pytest.mark.parametrize('changed', [3, INSORT_LIMIT + 50])
+def test_incremental_sync_matches_a_rebuild(app, changed):
+    product_ids = add_products(app, INSORT_LIMIT + 100)
+    with app.app_context():
+        index = SuggestIndex()
+        assert index.suggest('test product 1')
+        db.session.execute(
+            update(Product).where(Product.id.in_(product_ids[:changed]))
+            .values(name='Renamed ' + Product.name)
+        )
+        mark_catalog_changed()
+        db.session.commit()
+        _expire_local_version()
+
+        assert len(index.suggest('renamed', limit=changed + 10)) == changed
+        rebuilt = SuggestIndex()
+        rebuilt.suggest('renamed')
+        assert index._entries == rebuilt._entries
+        assert index._products == rebuilt._products
+        assert index._categories == rebuilt._categories
+
+
+def test_full_index_keeps_in_stock_products_first(app):
+    in_stock = add_products(app, 3, stock=5)
+    out_of_stock = add_products(app, 3, stock=0)
+    with app.app_context():
+        full = SuggestIndex()
+        full.suggest('test')
+        # Room for every product except the out-of-stock ones
+        needed = sum(1 for entry in full._entries if entry[2] not in out_of_stock)
+        index = SuggestIndex(max_entries=needed)
+        index.suggest('test')
+        assert index._skipped == set(out_of_stock)
+        assert set(in_stock) <= set(index._products)